@@ -0,0 +1,71 @@
+"""
+Crisis detector micro-benchmark: Aho–Corasick automaton (src.crisis) vs the previous
+`any(k in text.lower() for k in keywords)` scan, on a synthetic corpus.
+
+    python -m bench.crisis_bench [--messages 20000] [--extra-keywords 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import string
+import time
+
+from src.crisis import CRISIS_KEYWORDS, CrisisDetector
+
+WORDS = (
+    "сегодня был обычный день работа учеба устал немного спал плохо настроение нормальное "
+    "встретился с друзьями гулял в парке tired work meeting slept well coffee walk friends "
+    "стресс дедлайн экзамен радость тревога злость спокойно weekend plans family"
+).split()
+
+
+def naive_detect(text: str, keywords: list[str]) -> bool:
+    lower = text.lower()
+    return any(k in lower for k in keywords)
+
+
+def make_corpus(n: int, rnd: random.Random) -> list[str]:
+    corpus = []
+    for _ in range(n):
+        words = rnd.choices(WORDS, k=rnd.randint(5, 80))
+        if rnd.random() < 0.02:
+            words.insert(rnd.randrange(len(words)), rnd.choice(CRISIS_KEYWORDS))
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def make_keywords(extra: int, rnd: random.Random) -> list[str]:
+    alphabet = "абвгдежзийклмнопрстуфхцчшщыэюя" + string.ascii_lowercase
+    synthetic = ["".join(rnd.choices(alphabet, k=rnd.randint(6, 14))) for _ in range(extra)]
+    return CRISIS_KEYWORDS + synthetic
+
+
+def bench(fn, corpus: list[str]) -> tuple[float, int]:
+    started = time.perf_counter()
+    hits = sum(1 for text in corpus if fn(text))
+    return time.perf_counter() - started, hits
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--extra-keywords", type=int, nargs="*", default=[0, 100, 1000, 5000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    corpus = make_corpus(args.messages, rnd)
+    chars = sum(map(len, corpus))
+    print(f"corpus: {len(corpus)} messages, {chars / 1e6:.1f}M chars")
+    print(f"{'keywords':>9} {'naive, s':>10} {'automaton, s':>13} {'speedup':>8}  hits (naive/automaton)")
+    for extra in args.extra_keywords:
+        keywords = make_keywords(extra, rnd)
+        detector = CrisisDetector(keywords)
+        t_naive, h_naive = bench(lambda text: naive_detect(text, keywords), corpus)
+        t_ac, h_ac = bench(detector.detect, corpus)
+        print(f"{len(keywords):>9} {t_naive:>10.3f} {t_ac:>13.3f} {t_naive / t_ac:>7.1f}x  {h_naive}/{h_ac}")
+
+
+if __name__ == "__main__":
+    main()
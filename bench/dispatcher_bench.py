@@ -0,0 +1,343 @@
+"""
+In-process load test of the real dispatcher: `build_dispatcher` + `setup_routes`, synthetic
+updates through `feed_update`, a fake Bot session recording API calls, and a stubbed
+OpenRouter (httpx.MockTransport behind the real `LLMClient`, so its queue is exercised).
+
+Every simulated user runs /start → consent → /checkin → three scale callbacks → emotions →
+sleep → notes (analysis job) → /coach → N coach messages → end; users run concurrently.
+Reports throughput, p50/p95/p99 latency and DB queries per update for every handler, and
+how long the analysis queue takes to drain. Exits non-zero if a handler executes more
+statements than its budget in `src.repository.ROUND_TRIP_BUDGETS`.
+
+    python -m bench.dispatcher_bench [--users 500] [--concurrency 50] [--coach-turns 3]
+        [--db-url postgresql+asyncpg://...] [--llm-latency 0.3] [--api-latency 0.02] [--json out.json]
+
+Without --db-url a throwaway SQLite file is used (writes serialize there, so Postgres numbers
+are the ones to compare before a deploy).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=500)
+    p.add_argument("--concurrency", type=int, default=50, help="users in flight at once")
+    p.add_argument("--coach-turns", type=int, default=3)
+    p.add_argument("--db-url", default=None, help="default: temporary SQLite file")
+    p.add_argument("--llm-latency", type=float, default=0.3, help="seconds per stubbed completion")
+    p.add_argument("--api-latency", type=float, default=0.0, help="seconds per fake Telegram API call")
+    p.add_argument("--drain-timeout", type=float, default=120, help="seconds to wait for analysis jobs")
+    p.add_argument("--json", default=None, help="also write the report to this file")
+    return p.parse_args()
+
+
+# замер одного апдейта: имя хендлера и число SQL-запросов
+_probe: contextvars.ContextVar[dict | None] = contextvars.ContextVar("bench_probe", default=None)
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    # настройки читаются при импорте src — окружение готовим заранее
+    tmp_db = None
+    if args.db_url is None:
+        tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+        args.db_url = f"sqlite+aiosqlite:///{tmp_db}"
+    os.environ["DATABASE_URL"] = args.db_url
+    os.environ.setdefault("BOT_TOKEN", "123456:" + "A" * 35)
+    os.environ["OPENROUTER_API_KEY"] = "bench"
+    os.environ.setdefault("STREAM_EDIT_INTERVAL", "0.1")
+    os.environ.setdefault("ANALYSIS_POLL_INTERVAL", "0.5")
+    os.environ.setdefault("LLM_MAX_QUEUE", "100000")
+
+    import httpx
+    from aiogram import Bot
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import CallbackQuery, Chat, Message, Update, User as TgUser
+    from sqlalchemy import event, func, select
+
+    from src import bot as app
+    from src import llm
+    from src.config import settings
+    from src.db import engine, SessionLocal
+    from src.fsm_storage import SQLStorage
+    from src.i18n import t
+    from src.jobs import AnalysisWorker
+    from src.models import AnalysisJob
+    from src.repository import ROUND_TRIP_BUDGETS
+
+    ids = itertools.count(1)
+    analysis_prefix = t('analysis_ready', 'ru')
+    finalized_at: dict[int, float] = {}
+    analysis_latency: list[float] = []
+    api_calls: Counter = Counter()
+
+    class FakeSession(BaseSession):
+        async def close(self) -> None:
+            pass
+
+        async def make_request(self, bot, method, timeout=None):
+            name = type(method).__name__
+            api_calls[name] += 1
+            if args.api_latency:
+                await asyncio.sleep(args.api_latency)
+            text = getattr(method, "text", None)
+            chat_id = getattr(method, "chat_id", None)
+            # разбор LLM приходит правкой сообщения с быстрым локальным разбором
+            if name in ("SendMessage", "EditMessageText") and text and text.startswith(analysis_prefix) \
+                    and chat_id in finalized_at:
+                analysis_latency.append(time.perf_counter() - finalized_at.pop(chat_id))
+            if name in ("SendMessage", "EditMessageText", "SendDocument", "SendPhoto"):
+                return Message(
+                    message_id=next(ids), date=datetime.now(),
+                    chat=Chat(id=chat_id or 1, type="private"), text=text,
+                ).as_(bot)
+            return True
+
+        async def stream_content(self, *a, **k):
+            yield b""
+
+    async def openrouter(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        words = "Спасибо, что поделились. Попробуйте короткую прогулку и ранний отбой сегодня.".split()
+        if not body.get("stream"):
+            await asyncio.sleep(args.llm_latency)
+            return httpx.Response(200, json={"choices": [{"message": {"content": " ".join(words)}}]})
+
+        async def sse():
+            for w in words:
+                await asyncio.sleep(args.llm_latency / len(words))
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': w + ' '}}]})}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+
+        return httpx.Response(200, content=sse(), headers={"content-type": "text/event-stream"})
+
+    client = llm.get_llm_client()
+    await client._http.aclose()
+    client._http = httpx.AsyncClient(transport=httpx.MockTransport(openrouter))
+
+    await app.init_db()
+    storage = SQLStorage(engine, settings.fsm_ttl)
+    dp = app.build_dispatcher(storage)
+
+    async def probe_handler(handler, event, data):
+        probe = _probe.get()
+        if probe is not None:
+            probe["handler"] = data["handler"].callback.__name__
+        return await handler(event, data)
+
+    dp.message.middleware(probe_handler)
+    dp.callback_query.middleware(probe_handler)
+
+    def count_query(*_):
+        probe = _probe.get()
+        if probe is not None:
+            probe["queries"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+
+    bot = Bot(token=settings.bot_token, session=FakeSession())
+    worker = AnalysisWorker(bot)
+    await worker.start()
+
+    latency: dict[str, list[float]] = defaultdict(list)
+    queries: dict[str, list[int]] = defaultdict(list)
+    errors: Counter = Counter()
+    aborted: list[int] = []
+
+    def tg_user(uid: int) -> TgUser:
+        return TgUser(id=uid, is_bot=False, first_name="bench", language_code="ru")
+
+    def message(uid: int, text: str) -> Update:
+        return Update(update_id=next(ids), message=Message(
+            message_id=next(ids), date=datetime.now(), chat=Chat(id=uid, type="private"),
+            from_user=tg_user(uid), text=text,
+        ))
+
+    def callback(uid: int, data: str) -> Update:
+        origin = Message(
+            message_id=next(ids), date=datetime.now(), chat=Chat(id=uid, type="private"),
+            from_user=TgUser(id=1, is_bot=True, first_name="bot"), text="…",
+        )
+        return Update(update_id=next(ids), callback_query=CallbackQuery(
+            id=str(next(ids)), chat_instance="bench", from_user=tg_user(uid), message=origin, data=data,
+        ))
+
+    async def feed(update: Update) -> bool:
+        probe = {"handler": None, "queries": 0}
+        token = _probe.set(probe)
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+            if errors[type(e).__name__] == 1:
+                logging.getLogger("bench").exception("first %s", type(e).__name__)
+            return False
+        finally:
+            elapsed = time.perf_counter() - started
+            _probe.reset(token)
+            name = probe["handler"] or "unhandled"
+            latency[name].append(elapsed)
+            queries[name].append(probe["queries"])
+        return True
+
+    async def scenario(uid: int) -> None:
+        coach = [message(uid, f"Как мне лучше спать? ({uid}/{turn})") for turn in range(args.coach_turns)]
+        for update in (
+            message(uid, "/start"),
+            callback(uid, "consent:yes"),
+            message(uid, "/checkin"),
+            callback(uid, "scale:mood:7"),
+            callback(uid, "scale:stress:4"),
+            callback(uid, "scale:energy:6"),
+            message(uid, "радость, спокойствие"),
+            message(uid, "7"),
+            "finalize",
+            message(uid, f"работа, прогулка, пользователь {uid}"),
+            message(uid, "/coach"),
+            *coach,
+            callback(uid, "coach:end"),
+        ):
+            if update == "finalize":
+                finalized_at[uid] = time.perf_counter()
+                continue
+            # после ошибки сценарий пользователя теряет смысл — не плодим каскад
+            if not await feed(update):
+                aborted.append(uid)
+                finalized_at.pop(uid, None)
+                return
+
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def limited(uid: int) -> None:
+        async with gate:
+            await scenario(uid)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(10_000_000 + i) for i in range(args.users)))
+    dispatch_elapsed = time.perf_counter() - started
+
+    # ждём, пока воркеры разберут очередь анализов
+    async with SessionLocal() as session:
+        while True:
+            left = (await session.execute(
+                select(func.count()).select_from(AnalysisJob).where(AnalysisJob.status != "failed")
+            )).scalar()
+            if not left or time.perf_counter() - started > dispatch_elapsed + args.drain_timeout:
+                break
+            await asyncio.sleep(0.2)
+        failed = (await session.execute(
+            select(func.count()).select_from(AnalysisJob).where(AnalysisJob.status == "failed")
+        )).scalar()
+    drain_elapsed = time.perf_counter() - started
+
+    await worker.stop()
+    await storage.close()
+    await llm.stop_llm_client()
+    await engine.dispose()
+    if tmp_db:
+        os.unlink(tmp_db)
+
+    handlers = {}
+    for name, values in latency.items():
+        values.sort()
+        handlers[name] = {
+            "count": len(values),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000,
+            "queries_avg": statistics.fmean(queries[name]),
+            "queries_max": max(queries[name]),
+            "queries_budget": ROUND_TRIP_BUDGETS.get(name),
+        }
+    total_updates = sum(h["count"] for h in handlers.values())
+    analysis_latency.sort()
+    return {
+        "db": engine.dialect.name,
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "updates": total_updates,
+        "dispatch_seconds": dispatch_elapsed,
+        "updates_per_second": total_updates / dispatch_elapsed if dispatch_elapsed else 0.0,
+        "handlers": handlers,
+        "analysis": {
+            "delivered": len(analysis_latency),
+            "pending": left,
+            "failed": failed,
+            "drain_seconds": drain_elapsed,
+            "p50_ms": percentile(analysis_latency, 0.50) * 1000,
+            "p95_ms": percentile(analysis_latency, 0.95) * 1000,
+            "p99_ms": percentile(analysis_latency, 0.99) * 1000,
+        },
+        "api_calls": dict(api_calls),
+        "errors": dict(errors),
+        "aborted_users": len(aborted),
+        "over_budget": sorted(
+            name for name, h in handlers.items()
+            if h["queries_budget"] is not None and h["queries_max"] > h["queries_budget"]
+        ),
+    }
+
+
+def print_report(r: dict) -> None:
+    print(f"{r['db']}: {r['users']} users, concurrency {r['concurrency']}")
+    print(f"{r['updates']} updates in {r['dispatch_seconds']:.2f} s — {r['updates_per_second']:.0f} updates/s")
+    print()
+    print(
+        f"{'handler':<24}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        f"{'q/upd':>7}{'q max':>7}{'budget':>8}"
+    )
+    for name, h in sorted(r["handlers"].items(), key=lambda kv: -kv[1]["p95_ms"]):
+        budget = "—" if h["queries_budget"] is None else str(h["queries_budget"])
+        print(
+            f"{name:<24}{h['count']:>7}{h['p50_ms']:>9.1f}{h['p95_ms']:>9.1f}{h['p99_ms']:>9.1f}"
+            f"{h['max_ms']:>9.1f}{h['queries_avg']:>7.1f}{h['queries_max']:>7}{budget:>8}"
+            + ("  OVER BUDGET" if name in r["over_budget"] else "")
+        )
+    a = r["analysis"]
+    print()
+    print(
+        f"analysis: {a['delivered']} delivered, {a['pending']} pending, {a['failed']} failed; "
+        f"queue drained at {a['drain_seconds']:.2f} s; "
+        f"check-in → reply p50 {a['p50_ms']:.0f} / p95 {a['p95_ms']:.0f} / p99 {a['p99_ms']:.0f} ms"
+    )
+    print("api calls:", ", ".join(f"{k}={v}" for k, v in sorted(r["api_calls"].items())))
+    if r["errors"]:
+        print("errors:", ", ".join(f"{k}={v}" for k, v in r["errors"].items()), f"— {r['aborted_users']} users aborted")
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report["over_budget"]:
+        # бюджеты — repository.ROUND_TRIP_BUDGETS; лишний запрос на апдейт — регрессия
+        raise SystemExit(f"over the round-trip budget: {', '.join(report['over_budget'])}")
+
+
+if __name__ == "__main__":
+    main()
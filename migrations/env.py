@@ -37,6 +37,13 @@ def run_migrations_offline():
         context.run_migrations()
 
 def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        # программный запуск (tests/): миграции идут в переданном соединении
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix='sqlalchemy.',
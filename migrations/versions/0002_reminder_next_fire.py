@@ -0,0 +1,21 @@
+"""
+Reminder next fire time
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002_reminder_next_fire'
+down_revision = '0001_initial'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # заполняется ReminderEngine.backfill() при старте бота
+    op.add_column('reminders', sa.Column('next_fire_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_reminders_next_fire_at', 'reminders', ['next_fire_at'])
+
+
+def downgrade():
+    op.drop_index('ix_reminders_next_fire_at', table_name='reminders')
+    op.drop_column('reminders', 'next_fire_at')
@@ -0,0 +1,26 @@
+"""
+FSM storage table
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003_fsm_states'
+down_revision = '0002_reminder_next_fire'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'fsm_states',
+        sa.Column('key', sa.String(length=255), primary_key=True),
+        sa.Column('state', sa.String(length=128), nullable=True),
+        sa.Column('data', sa.JSON(), nullable=False, server_default=sa.text("'{}'")),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_fsm_states_expires_at', 'fsm_states', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_fsm_states_expires_at', table_name='fsm_states')
+    op.drop_table('fsm_states')
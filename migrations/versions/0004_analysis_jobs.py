@@ -0,0 +1,34 @@
+"""
+Check-in analysis job queue
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0004_analysis_jobs'
+down_revision = '0003_fsm_states'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'analysis_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('locale', sa.String(length=8), nullable=False, server_default='ru'),
+        sa.Column('prompt', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    op.create_unique_constraint('uq_analysis_job_user_date', 'analysis_jobs', ['user_id', 'date'])
+    op.create_index('ix_analysis_jobs_run_after', 'analysis_jobs', ['run_after'])
+
+
+def downgrade():
+    op.drop_index('ix_analysis_jobs_run_after', table_name='analysis_jobs')
+    op.drop_table('analysis_jobs')
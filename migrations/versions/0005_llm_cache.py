@@ -0,0 +1,25 @@
+"""
+LLM response cache
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005_llm_cache'
+down_revision = '0004_analysis_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'llm_cache',
+        sa.Column('key', sa.String(length=64), primary_key=True),
+        sa.Column('response', sa.Text(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_llm_cache_expires_at', 'llm_cache', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_llm_cache_expires_at', table_name='llm_cache')
+    op.drop_table('llm_cache')
@@ -0,0 +1,49 @@
+"""
+Daily/weekly check-in rollups for /stats
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0006_checkin_rollups'
+down_revision = '0005_llm_cache'
+branch_labels = None
+depends_on = None
+
+METRICS = (('mood', 'mood_score'), ('stress', 'stress_score'), ('energy', 'energy_score'), ('sleep', 'sleep_hours'))
+
+
+def upgrade():
+    columns = []
+    for name, _ in METRICS:
+        columns += [
+            sa.Column(f'{name}_sum', sa.Integer(), nullable=True),
+            sa.Column(f'{name}_n', sa.Integer(), nullable=False),
+            sa.Column(f'{name}_min', sa.Integer(), nullable=True),
+            sa.Column(f'{name}_max', sa.Integer(), nullable=True),
+        ]
+    op.create_table(
+        'checkin_rollups',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('period', sa.String(length=8), nullable=False),
+        sa.Column('period_start', sa.DateTime(), nullable=False),
+        sa.Column('checkins', sa.Integer(), nullable=False),
+        *columns,
+        sa.PrimaryKeyConstraint('user_id', 'period', 'period_start', name='pk_checkin_rollups'),
+    )
+
+    # заполняем из уже накопленных чек-инов
+    aggregates = ", ".join(
+        f"sum({col}), count({col}), min({col}), max({col})" for _, col in METRICS
+    )
+    names = ", ".join(f"{n}_sum, {n}_n, {n}_min, {n}_max" for n, _ in METRICS)
+    for period, trunc in (('day', 'day'), ('week', 'week')):
+        op.execute(
+            f"INSERT INTO checkin_rollups (user_id, period, period_start, checkins, {names}) "
+            f"SELECT user_id, '{period}', date_trunc('{trunc}', date), count(*), {aggregates} "
+            f"FROM checkins GROUP BY user_id, date_trunc('{trunc}', date)"
+        )
+
+
+def downgrade():
+    op.drop_table('checkin_rollups')
@@ -0,0 +1,103 @@
+"""
+Monthly range partitions for checkins, (user_id, date DESC) index, checkins_archive
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007_checkins_partitioned'
+down_revision = '0006_checkin_rollups'
+branch_labels = None
+depends_on = None
+
+PARTITIONS_AHEAD = 3  # дальше партиции создаёт archive.CheckinArchiver
+
+COLUMNS = """
+    id integer NOT NULL DEFAULT nextval('checkins_id_seq'),
+    user_id integer NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    date timestamp without time zone NOT NULL,
+    mood_score integer,
+    stress_score integer,
+    energy_score integer,
+    emotions text,
+    sleep_hours integer,
+    notes text,
+    analysis_summary text,
+    recommendations text
+"""
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    # старая таблица уходит в сторону вместе с последовательностью id
+    op.execute("ALTER TABLE checkins RENAME TO checkins_old")
+    op.execute("ALTER TABLE checkins_old DROP CONSTRAINT uq_checkin_user_date")
+    op.execute("DROP INDEX IF EXISTS ix_checkins_date")
+    op.execute("DROP INDEX IF EXISTS ix_checkins_user_id")
+    # имя PK зависит от того, кто создавал таблицу (0001 — checkins_pkey, create_all — pk_checkins)
+    pkey = conn.execute(sa.text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = 'checkins_old'::regclass AND contype = 'p'"
+    )).scalar()
+    op.execute(f'ALTER TABLE checkins_old RENAME CONSTRAINT "{pkey}" TO checkins_old_pkey')
+    op.execute("ALTER SEQUENCE checkins_id_seq OWNED BY NONE")
+
+    # PK секционированной таблицы обязан включать ключ секционирования
+    op.execute(
+        f"CREATE TABLE checkins ({COLUMNS}, CONSTRAINT pk_checkins PRIMARY KEY (id, date)) PARTITION BY RANGE (date)"
+    )
+    op.execute("ALTER SEQUENCE checkins_id_seq OWNED BY checkins.id")
+    # одна и та же структура обслуживает и ON CONFLICT (user_id, date), и "последние N чек-инов"
+    op.execute("CREATE UNIQUE INDEX uq_checkin_user_date ON checkins (user_id, date DESC)")
+
+    first = conn.execute(sa.text("SELECT min(date) FROM checkins_old")).scalar()
+    month = date.today().replace(day=1)
+    if first is not None:
+        month = min(month, first.date().replace(day=1))
+    last = date.today().replace(day=1)
+    for _ in range(PARTITIONS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        nxt = _next_month(month)
+        op.execute(
+            f"CREATE TABLE checkins_p{month:%Y%m} PARTITION OF checkins "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{nxt:%Y-%m-%d}')"
+        )
+        month = nxt
+
+    op.execute("INSERT INTO checkins SELECT * FROM checkins_old")
+    op.execute("DROP TABLE checkins_old")
+
+    op.create_table(
+        'checkins_archive',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('month', sa.DateTime(), nullable=False),
+        sa.Column('checkins', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('user_id', 'month', name='pk_checkins_archive'),
+    )
+
+
+def downgrade():
+    # архивные месяцы обратно не разворачиваются — восстановите их из checkins_archive вручную
+    op.drop_table('checkins_archive')
+    op.execute("ALTER TABLE checkins RENAME TO checkins_partitioned")
+    op.execute("ALTER INDEX uq_checkin_user_date RENAME TO uq_checkin_user_date_partitioned")
+    op.execute("ALTER TABLE checkins_partitioned RENAME CONSTRAINT pk_checkins TO pk_checkins_partitioned")
+    op.execute("ALTER SEQUENCE checkins_id_seq OWNED BY NONE")
+    op.execute(
+        "CREATE TABLE checkins (" + COLUMNS.replace("integer NOT NULL DEFAULT", "integer PRIMARY KEY DEFAULT", 1) + ")"
+    )
+    op.execute("ALTER SEQUENCE checkins_id_seq OWNED BY checkins.id")
+    op.execute("INSERT INTO checkins SELECT * FROM checkins_partitioned")
+    op.execute("DROP TABLE checkins_partitioned")
+    op.create_unique_constraint('uq_checkin_user_date', 'checkins', ['user_id', 'date'])
+    op.create_index('ix_checkins_user_id', 'checkins', ['user_id'])
+    op.create_index('ix_checkins_date', 'checkins', ['date'])
@@ -0,0 +1,19 @@
+"""
+Message of the quick local analysis that the LLM analysis replaces
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0008_analysis_job_message'
+down_revision = '0007_checkins_partitioned'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('analysis_jobs', sa.Column('message_id', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('analysis_jobs', 'message_id')
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import logging
+import re
+from datetime import date, datetime
+from typing import AsyncIterator
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .db import dialect_insert
+from .models import CheckinArchive
+
+log = logging.getLogger(__name__)
+
+_PARTITION = re.compile(r"^checkins_p(\d{4})(\d{2})$")
+
+
+def checkin_record(c) -> dict:
+    """Export/archive representation of a `Checkin` (ORM object or Core row)."""
+    return {
+        "date": c.date.isoformat(),
+        "mood": c.mood_score,
+        "stress": c.stress_score,
+        "energy": c.energy_score,
+        "emotions": c.emotions,
+        "sleep_hours": c.sleep_hours,
+        "notes": c.notes,
+        "analysis": c.analysis_summary,
+        "recs": c.recommendations,
+    }
+
+
+def _add_months(d: date, n: int) -> date:
+    months = d.year * 12 + d.month - 1 + n
+    return date(months // 12, months % 12 + 1, 1)
+
+
+async def iter_archived(session, user_id: int, since: datetime | None, until: datetime | None) -> AsyncIterator[dict]:
+    """Records of the user's archived months in date order, one decompressed month at a time."""
+    import orjson
+
+    stmt = select(CheckinArchive.data).where(CheckinArchive.user_id == user_id).order_by(CheckinArchive.month)
+    if since:
+        stmt = stmt.where(CheckinArchive.month >= datetime(since.year, since.month, 1))
+    if until:
+        stmt = stmt.where(CheckinArchive.month < until)
+    async for data in await session.stream_scalars(stmt):
+        for record in orjson.loads(gzip.decompress(data)):
+            day = datetime.fromisoformat(record["date"])
+            if (since is None or day >= since) and (until is None or day < until):
+                yield record
+
+
+class CheckinArchiver:
+    """
+    Maintenance of the monthly `checkins` partitions (Postgres only, see migration 0007).
+
+    Keeps `partitions_ahead` future months created, and moves partitions older than
+    `archive_after_months` into `checkins_archive`: one gzip-compressed JSON row per user and
+    month, then detaches and drops the partition. Each partition is handled in one
+    transaction, so a crash leaves it either untouched or fully archived.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.interval = settings.checkin_maintenance_interval
+        self.archive_after_months = settings.checkin_archive_after_months
+        self.partitions_ahead = settings.checkin_partitions_ahead
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.engine.dialect.name == "postgresql"
+
+    def start(self) -> None:
+        if not self.enabled:
+            log.info("archive: %s backend, checkins are not partitioned", self.engine.dialect.name)
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.ensure_partitions()
+                await self.archive_old()
+            except Exception:
+                log.exception("archive: maintenance failed")
+            await asyncio.sleep(self.interval)
+
+    async def _partitions(self, conn) -> list[tuple[str, date]]:
+        rows = (await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'checkins'::regclass"
+        ))).scalars().all()
+        parts = []
+        for name in rows:
+            m = _PARTITION.match(name)
+            if m:
+                parts.append((name, date(int(m.group(1)), int(m.group(2)), 1)))
+        return sorted(parts, key=lambda p: p[1])
+
+    async def ensure_partitions(self) -> None:
+        current = date.today().replace(day=1)
+        async with self.engine.begin() as conn:
+            existing = {month for _, month in await self._partitions(conn)}
+            for i in range(self.partitions_ahead + 1):
+                month = _add_months(current, i)
+                if month in existing:
+                    continue
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS checkins_p{month:%Y%m} PARTITION OF checkins "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_add_months(month, 1):%Y-%m-%d}')"
+                ))
+                log.info("archive: created partition checkins_p%s", f"{month:%Y%m}")
+
+    async def archive_old(self) -> int:
+        cutoff = _add_months(date.today().replace(day=1), -self.archive_after_months)
+        async with self.engine.connect() as conn:
+            old = [(name, month) for name, month in await self._partitions(conn) if month < cutoff]
+        for name, month in old:
+            await self._archive_partition(name, month)
+        return len(old)
+
+    async def _archive_partition(self, name: str, month: date) -> None:
+        import orjson
+
+        users = rows = raw = packed = 0
+        async with self.engine.begin() as conn:
+            # курсор SQL, а не серверный курсор драйвера: его можно закрыть до DROP в этой же транзакции
+            await conn.execute(text(f"DECLARE archive_rows NO SCROLL CURSOR FOR SELECT * FROM {name} ORDER BY user_id, date"))
+            fetch = text(f"FETCH {settings.export_batch_size} FROM archive_rows")
+            current_user, records = None, []
+
+            async def flush():
+                nonlocal users, raw, packed
+                payload = orjson.dumps(records)
+                data = gzip.compress(payload)
+                values = {"checkins": len(records), "data": data, "archived_at": datetime.utcnow()}
+                stmt = dialect_insert(CheckinArchive).values(
+                    user_id=current_user, month=datetime(month.year, month.month, 1), **values,
+                )
+                await conn.execute(stmt.on_conflict_do_update(index_elements=["user_id", "month"], set_=values))
+                users += 1
+                raw += len(payload)
+                packed += len(data)
+
+            while batch := (await conn.execute(fetch)).all():
+                for row in batch:
+                    if row.user_id != current_user:
+                        if records:
+                            await flush()
+                        current_user, records = row.user_id, []
+                    records.append(checkin_record(row))
+                    rows += 1
+            if records:
+                await flush()
+            await conn.execute(text("CLOSE archive_rows"))
+            await conn.execute(text(f"ALTER TABLE checkins DETACH PARTITION {name}"))
+            await conn.execute(text(f"DROP TABLE {name}"))
+        log.info(
+            "archive: %s → %d check-ins of %d users, %d → %d bytes", name, rows, users, raw, packed,
+        )
@@ -1,26 +1,56 @@
 from __future__ import annotations
 
+from src import startup  # первым: отсчёт времени холодного старта
+
 import asyncio
+import json
+import logging
 import os
+import signal
+import sys
+
+import pytz
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, BufferedInputFile, CallbackQuery
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+import aiohttp
 from aiohttp import web
-from sqlalchemy import select, delete
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
 
 from src.config import settings
-from src.db import get_session, engine, Base
+from src.db import LazySession, SCHEMA_REVISION, engine, Base, prewarm_pool, schema_revision
 from src.models import User, Checkin, Reminder
-from src.i18n import t
-from src.llm import analyze_checkin, detect_crisis, chat
+from src.middlewares import crisis_mw, session_mw, user_mw
+from src.user_cache import CachedUser, user_cache
+from src.i18n import t, start_reloader, stop_reloader
+from src.i18n.keyboards import kb_chat_controls, kb_consent, kb_scale, kb_skip
+from src import local_analysis
+from src.jobs import AnalysisWorker, enqueue_analysis, notify_workers
+from src.streaming import send_streamed
 from src.utils import parse_time_hhmm, today_start_in_tz
+from src.reminders import ReminderEngine, next_fire_utc
+from src.fsm_storage import SQLStorage
+from src.coach_context import CoachContext
+from src.archive import CheckinArchiver
+from src.charts import chart_cache, get_chart, start_chart_pool, stop_chart_pool
+from src.metrics import (
+    TelegramMetricsMiddleware, front_metrics_handler, instrument_dispatcher, instrument_engine, metrics_handler,
+)
+from src import shards
+from src.dispatch import UserQueues
+from src.send_queue import SendQueue
+from src.export import SpooledInputFile, parse_export_args, write_export
+from src.stats import PERIODS, format_stats, load_stats, refresh_rollups
+from src.repository import checkin_values, delete_user, upsert_checkin
+
+
+log = logging.getLogger(__name__)
 
 
 # ===== FSM =====
@@ -46,143 +76,74 @@ class ChatStates(StatesGroup):
     active = State()
 
 
-# ===== Keyboards =====
-
-def kb_consent():
-    kb = InlineKeyboardBuilder()
-    kb.button(text="✅ Согласен", callback_data="consent:yes")
-    kb.button(text="❌ Не согласен", callback_data="consent:no")
-    kb.adjust(2)
-    return kb.as_markup()
-
-def kb_scale(field: str):
-    kb = InlineKeyboardBuilder()
-    for i in range(1, 11):
-        kb.button(text=str(i), callback_data=f"scale:{field}:{i}")
-    kb.adjust(5, 5)
-    kb.button(text="Пропустить", callback_data=f"skip:{field}")
-    kb.adjust(5, 5, 1)
-    return kb.as_markup()
-
-def kb_skip(field: str):
-    kb = InlineKeyboardBuilder()
-    kb.button(text="Пропустить", callback_data=f"skip:{field}")
-    return kb.as_markup()
-
-def kb_chat_controls():
-    kb = InlineKeyboardBuilder()
-    kb.button(text="Подытожь мой день", callback_data="coach:prompt:summary")
-    kb.button(text="План на завтра", callback_data="coach:prompt:plan")
-    kb.button(text="Снизить стресс", callback_data="coach:prompt:stress")
-    kb.button(text="Завершить", callback_data="coach:end")
-    kb.adjust(2, 2)
-    return kb.as_markup()
-
-
 # ===== Helpers =====
 
 async def ask_scale(message_or_query, locale: str, field: str, prompt_key: str):
-    text = f"{t(prompt_key, locale)}\nВыберите по шкале 1–10:"
+    text = f"{t(prompt_key, locale)}\n{t('scale_hint', locale)}"
     if isinstance(message_or_query, Message):
-        await message_or_query.answer(text, reply_markup=kb_scale(field))
+        await message_or_query.answer(text, reply_markup=kb_scale(field, locale))
     else:
-        await message_or_query.message.edit_text(text, reply_markup=kb_scale(field))
+        await message_or_query.message.edit_text(text, reply_markup=kb_scale(field, locale))
 
-async def ask_free_text(message: Message | CallbackQuery, locale: str, prompt_key: str, field: str, hint: str = ""):
+async def ask_free_text(message: Message | CallbackQuery, locale: str, prompt_key: str, field: str, hint_key: str = ""):
     msg = f"{t(prompt_key, locale)}"
-    if hint:
-        msg += f"\n{hint}"
+    if hint_key:
+        msg += f"\n{t(hint_key, locale)}"
     target = message if isinstance(message, Message) else message.message
-    await target.answer(msg, reply_markup=kb_skip(field))
+    await target.answer(msg, reply_markup=kb_skip(field, locale))
 
-async def finalize_checkin(message: Message, state: FSMContext, session: AsyncSession, user: User, locale: str, data: dict):
+async def finalize_checkin(message: Message, state: FSMContext, session: LazySession, user: CachedUser, locale: str, data: dict):
     # дата "сегодня" по таймзоне пользователя — делаем naive под TIMESTAMP WITHOUT TIME ZONE
     date_local = today_start_in_tz(user.timezone)      # aware
     date_naive = date_local.replace(tzinfo=None)       # naive
 
-    # найти чек-ин на сегодня; если нет — создать
-    q = await session.execute(
-        select(Checkin).where(Checkin.user_id == user.id, Checkin.date == date_naive)
-    )
-    checkin = q.scalar_one_or_none()
-    if checkin is None:
-        checkin = Checkin(user_id=user.id, date=date_naive)
-        session.add(checkin)
-
-    # наивный парсер чисел из строк
-    def to_int_or_none(v):
-        try:
-            return int(v)
-        except Exception:
-            return None
-
-    checkin.mood_score = to_int_or_none(data.get('mood'))
-    checkin.stress_score = to_int_or_none(data.get('stress'))
-    checkin.energy_score = to_int_or_none(data.get('energy'))
-    checkin.emotions = data.get('emotions') or None
-
-    # sleep (может прийти как "7", "7.5", "7 ч")
-    try:
-        sh_raw = (data.get('sleep') or "").replace(",", ".")
-        sh_tok = [x for x in sh_raw.split() if x.replace('.', '', 1).isdigit()]
-        checkin.sleep_hours = int(float(sh_tok[0])) if sh_tok else None
-    except Exception:
-        checkin.sleep_hours = None
-
-    checkin.notes = data.get('notes') or None
-
-    # сохранить базовые данные
+    # локальный разбор сразу; он же хранится с чек-ином, пока его не заменит ответ LLM
+    values = checkin_values(data)
+    quick = local_analysis.analyze(values, await local_analysis.load_trend(session, user.id, date_naive), locale)
+    # чек-ин и строки /stats — одной транзакцией, без предварительного SELECT
+    await upsert_checkin(session, user.id, date_naive, {**values, "analysis_summary": quick, "recommendations": quick})
+    await refresh_rollups(session, user.id, date_naive)
     await session.commit()
-    await message.answer(t('checkin_saved', locale))
-
-    # кризис
-    full_text = "\n".join(filter(None, [
-        str(data.get('mood', '')), str(data.get('stress','')), str(data.get('energy','')),
-        data.get('emotions',''), data.get('sleep',''), data.get('notes','')
-    ]))
-    if detect_crisis(full_text):
-        await message.answer(t('crisis_detected', locale))
-        await message.answer("Если вы в опасности — звоните 112. Линия доверия: 8-800-2000-122.")
-
-    # LLM-анализ
-    analysis = await analyze_checkin(
-        f"User locale={locale}, timezone={user.timezone}. Daily check-in raw data: {data}.\n"
-        "Provide: 1) brief empathetic summary; 2) 2–4 actionable, low-risk recommendations aligned with CBT/ACT/mindfulness; 3) encourage self-reflection; 4) no diagnoses.",
-        locale=locale,
-    )
-    checkin.analysis_summary = analysis
-    checkin.recommendations = analysis
-    await session.commit()
-
-    await message.answer(t('analysis_ready', locale) + "\n\n" + analysis)
+    chart_cache.invalidate_user(user.id)
+    # кризисные формулировки уже проверены crisis_mw на каждом входящем сообщении
+    with_llm = bool(settings.openrouter_api_key)
+    sent = await message.answer(local_analysis.quick_message(quick, locale, pending=with_llm), parse_mode=None)
+    if with_llm:
+        # задача ставится после отправки: воркеру нужен id сообщения, которое он заменит
+        await enqueue_analysis(
+            session, user.id, date_naive, message.chat.id, locale,
+            f"User locale={locale}, timezone={user.timezone}. Daily check-in raw data: {data}.\n"
+            "Provide: 1) brief empathetic summary; 2) 2–4 actionable, low-risk recommendations aligned with CBT/ACT/mindfulness; 3) encourage self-reflection; 4) no diagnoses.",
+            message_id=sent.message_id,
+        )
+        await session.commit()
+        notify_workers()
 
 
 # ===== Handlers =====
 
-async def cmd_start(message: Message, state: FSMContext, session: AsyncSession):
+async def cmd_start(message: Message, state: FSMContext, session: LazySession, user: CachedUser | None):
     # Upsert user
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
     if not user:
-        user = User(tg_user_id=message.from_user.id, language_code=message.from_user.language_code or 'ru')
-        session.add(user)
+        row = User(tg_user_id=message.from_user.id, language_code=message.from_user.language_code or 'ru')
+        session.add(row)
         await session.commit()
+        user = user_cache.put(CachedUser.from_row(row))
     locale = user.language_code or 'ru'
 
     await message.answer(t('start_welcome', locale))
     await message.answer(t('disclaimer', locale))
     await state.set_state(ConsentStates.waiting)
-    await message.answer(t('consent_request', locale), reply_markup=kb_consent())
+    await message.answer(t('consent_request', locale), reply_markup=kb_consent(locale))
 
 
-async def consent_handler(message: Message, state: FSMContext, session: AsyncSession):
+async def consent_handler(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     text = (message.text or '').strip().lower()
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
     locale = user.language_code or 'ru'
     if text in {"да", "согласен", "согласна", "yes", "agree"}:
-        user.consent_given = True
+        await session.execute(update(User).where(User.id == user.id).values(consent_given=True))
         await session.commit()
+        user_cache.update(user, consent_given=True)
         await state.clear()
         await message.answer(t('consent_yes', locale))
     else:
@@ -190,14 +151,13 @@ async def consent_handler(message: Message, state: FSMContext, session: AsyncSes
         await message.answer(t('consent_no', locale))
 
 
-async def cb_consent(query: CallbackQuery, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == query.from_user.id))
-    user = result.scalar_one_or_none()
+async def cb_consent(query: CallbackQuery, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     _, value = (query.data or "consent:no").split(":")
     if value == "yes":
-        user.consent_given = True
+        await session.execute(update(User).where(User.id == user.id).values(consent_given=True))
         await session.commit()
+        user_cache.update(user, consent_given=True)
         await state.clear()
         await query.message.edit_text(t('consent_yes', locale))
     else:
@@ -205,53 +165,45 @@ async def cb_consent(query: CallbackQuery, state: FSMContext, session: AsyncSess
         await query.message.edit_text(t('consent_no', locale))
 
 
-async def cmd_help(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def cmd_help(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     await message.answer(t('help', locale))
 
 
-async def cmd_lang(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
-    user.language_code = 'en' if (user.language_code or 'ru') == 'ru' else 'ru'
+async def cmd_lang(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
+    language_code = 'en' if (user.language_code or 'ru') == 'ru' else 'ru'
+    await session.execute(update(User).where(User.id == user.id).values(language_code=language_code))
     await session.commit()
-    await message.answer(t('language_set', user.language_code))
+    user_cache.update(user, language_code=language_code)
+    await message.answer(t('language_set', language_code))
 
 
-async def cmd_settings(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def cmd_settings(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     await message.answer(
         f"{t('settings_saved', locale)}\n"
-        f"TZ: {user.timezone}, check-in: {user.checkin_time}"
+        f"{t('settings_current', locale, tz=user.timezone, time=user.checkin_time)}"
     )
 
 
-async def cmd_reminders(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def cmd_reminders(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     await state.set_state(RemindersStates.waiting)
     await message.answer(
-        t('reminder_set', locale) + "\n" +
-        "Отправьте список времени (HH:MM, через запятую) и при необходимости укажите часовой пояс (например, Europe/Moscow)."
+        t('reminder_set', locale) + "\n" + t('reminders_prompt', locale)
     )
 
 
-async def reminders_text(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def reminders_text(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     text = (message.text or '').strip()
     parts = [p.strip() for p in text.split()]
     tz = user.timezone
     times_part = parts
     if len(parts) >= 2 and "/" in parts[-1]:
-        tz = parts[-1]
         times_part = parts[:-1]
+        if parts[-1] in pytz.all_timezones_set:
+            tz = parts[-1]
     times_raw = " ".join(times_part).replace(" ", "")
     times = [t for t in times_raw.split(',') if parse_time_hhmm(t)]
     times_str = ",".join(times) if times else user.checkin_time
@@ -264,17 +216,17 @@ async def reminders_text(message: Message, state: FSMContext, session: AsyncSess
     else:
         rem.times = times_str
         rem.enabled = True
-    user.timezone = tz
+    rem.next_fire_at = next_fire_utc(times_str, tz)
+    await session.execute(update(User).where(User.id == user.id).values(timezone=tz))
     await session.commit()
+    user_cache.update(user, timezone=tz)
     await state.clear()
     await message.answer(t('reminder_set', locale))
 
 
 # === Check-in with inline ===
 
-async def cmd_checkin(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def cmd_checkin(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     await state.clear()
     await state.set_state(CheckinStates.mood)
@@ -282,7 +234,7 @@ async def cmd_checkin(message: Message, state: FSMContext, session: AsyncSession
     await ask_scale(message, locale, field="mood", prompt_key="ask_mood")
 
 
-async def cb_scale(query: CallbackQuery, state: FSMContext, session: AsyncSession):
+async def cb_scale(query: CallbackQuery, state: FSMContext, session: LazySession, user: CachedUser):
     # data = "scale:mood:7"
     parts = (query.data or "").split(":")
     if len(parts) < 3:
@@ -290,8 +242,6 @@ async def cb_scale(query: CallbackQuery, state: FSMContext, session: AsyncSessio
         return
     _, field, value = parts[0], parts[1], parts[2]
 
-    result = await session.execute(select(User).where(User.tg_user_id == query.from_user.id))
-    user = result.scalar_one_or_none()
     locale = user.language_code or 'ru'
 
     await state.update_data(**{field: value})
@@ -305,12 +255,12 @@ async def cb_scale(query: CallbackQuery, state: FSMContext, session: AsyncSessio
         await ask_scale(query, locale, field="energy", prompt_key="ask_energy")
     elif field == "energy":
         await state.set_state(CheckinStates.emotions)
-        await ask_free_text(query, locale, prompt_key="ask_emotions", field="emotions", hint="(можно словами через запятую)")
+        await ask_free_text(query, locale, prompt_key="ask_emotions", field="emotions", hint_key="hint_emotions")
     else:
         await query.answer()
 
 
-async def cb_skip(query: CallbackQuery, state: FSMContext, session: AsyncSession):
+async def cb_skip(query: CallbackQuery, state: FSMContext, session: LazySession, user: CachedUser):
     # data = "skip:emotions" | "skip:sleep" | "skip:notes" | also can be skip:mood/stress/energy
     parts = (query.data or "").split(":")
     if len(parts) < 2:
@@ -318,8 +268,6 @@ async def cb_skip(query: CallbackQuery, state: FSMContext, session: AsyncSession
         return
     field = parts[1]
 
-    result = await session.execute(select(User).where(User.tg_user_id == query.from_user.id))
-    user = result.scalar_one_or_none()
     locale = user.language_code or 'ru'
 
     await state.update_data(**{field: None})
@@ -332,10 +280,10 @@ async def cb_skip(query: CallbackQuery, state: FSMContext, session: AsyncSession
         await ask_scale(query, locale, field="energy", prompt_key="ask_energy")
     elif field == "energy":
         await state.set_state(CheckinStates.emotions)
-        await ask_free_text(query, locale, "ask_emotions", "emotions", "(можно словами через запятую)")
+        await ask_free_text(query, locale, "ask_emotions", "emotions", "hint_emotions")
     elif field == "emotions":
         await state.set_state(CheckinStates.sleep)
-        await ask_free_text(query, locale, "ask_sleep", "sleep", "Например: 7")
+        await ask_free_text(query, locale, "ask_sleep", "sleep", "hint_sleep")
     elif field == "sleep":
         await state.set_state(CheckinStates.notes)
         await ask_free_text(query, locale, "ask_notes", "notes")
@@ -350,55 +298,43 @@ async def cb_skip(query: CallbackQuery, state: FSMContext, session: AsyncSession
         await query.answer()
 
 
-async def mood_handler(message: Message, state: FSMContext, session: AsyncSession):
+async def mood_handler(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     # если кто-то всё же пишет текстом на шаге шкалы — сохраним и продолжим
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
     locale = user.language_code or 'ru'
     await state.update_data(mood=(message.text or '').strip())
     await state.set_state(CheckinStates.stress)
     await ask_scale(message, locale, "stress", "ask_stress")
 
 
-async def stress_handler(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def stress_handler(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     await state.update_data(stress=(message.text or '').strip())
     await state.set_state(CheckinStates.energy)
     await ask_scale(message, locale, "energy", "ask_energy")
 
 
-async def energy_handler(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def energy_handler(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     await state.update_data(energy=(message.text or '').strip())
     await state.set_state(CheckinStates.emotions)
-    await ask_free_text(message, locale, "ask_emotions", "emotions", "(можно словами через запятую)")
+    await ask_free_text(message, locale, "ask_emotions", "emotions", "hint_emotions")
 
 
-async def emotions_handler(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def emotions_handler(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     await state.update_data(emotions=message.text or '')
     await state.set_state(CheckinStates.sleep)
-    await ask_free_text(message, locale, "ask_sleep", "sleep", "Например: 7")
+    await ask_free_text(message, locale, "ask_sleep", "sleep", "hint_sleep")
 
 
-async def sleep_handler(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def sleep_handler(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
     await state.update_data(sleep=message.text or '')
     await state.set_state(CheckinStates.notes)
     await ask_free_text(message, locale, "ask_notes", "notes")
 
 
-async def notes_handler(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def notes_handler(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     locale = user.language_code or 'ru'
 
     await state.update_data(notes=message.text or '')
@@ -410,62 +346,73 @@ async def notes_handler(message: Message, state: FSMContext, session: AsyncSessi
 
 # === Stats & export ===
 
-async def cmd_stats(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
+async def cmd_stats(message: Message, state: FSMContext, session: LazySession, user: CachedUser, command: CommandObject):
     locale = user.language_code or 'ru'
+    arg = (command.args or "").strip() or "7"
+    if arg.split()[0] == "chart":
+        # /stats chart 30 == /chart 30
+        await send_chart(message, session, user, arg[len("chart"):])
+        return
+    if not arg.isdigit() or int(arg) not in PERIODS:
+        await message.answer(t('stats_usage', locale))
+        return
+    days = int(arg)
+    today = today_start_in_tz(user.timezone).replace(tzinfo=None)
+    rows = await load_stats(session, user.id, days, today)
+    await message.answer(format_stats(rows, days, locale))
+
+
+async def cmd_chart(message: Message, state: FSMContext, session: LazySession, user: CachedUser, command: CommandObject):
+    await send_chart(message, session, user, command.args)
+
+
+async def send_chart(message: Message, session: LazySession, user: CachedUser, args: str | None):
+    locale = user.language_code or 'ru'
+    arg = (args or "").strip() or "30"
+    if not arg.isdigit() or int(arg) not in PERIODS:
+        await message.answer(t('chart_usage', locale))
+        return
+    days = int(arg)
+    today = today_start_in_tz(user.timezone).replace(tzinfo=None)
+    png = await get_chart(session, user.id, days, today, locale)
+    await session.release()
+    if png is None:
+        await message.answer(t('stats_title', locale) + "\n" + t('stats_empty', locale))
+        return
+    await message.answer_photo(BufferedInputFile(png, filename=f"chart_{days}.png"))
 
-    q = await session.execute(select(Checkin).where(Checkin.user_id == user.id).order_by(Checkin.date.desc()).limit(7))
-    rows = q.scalars().all()
-    if not rows:
-        await message.answer(t('stats_title', locale) + "\nНет данных пока.")
+
+async def cmd_export(message: Message, state: FSMContext, session: LazySession, user: CachedUser, command: CommandObject):
+    locale = user.language_code or 'ru'
+    req = parse_export_args(command.args)
+    if req is None:
+        await message.answer(t('export_usage', locale))
         return
-    lines = []
-    for r in rows:
-        lines.append(
-            f"{r.date.date()}: mood={r.mood_score}, stress={r.stress_score}, energy={r.energy_score}; sleep={r.sleep_hours}; notes={(r.notes or '')[:50]}")
-    await message.answer(t('stats_title', locale) + "\n" + "\n".join(lines))
-
-
-async def cmd_export(message: Message, state: FSMContext, session: AsyncSession):
-    import orjson
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
-    q = await session.execute(select(Checkin).where(Checkin.user_id == user.id).order_by(Checkin.date.asc()))
-    rows = q.scalars().all()
-    payload = [
-        {
-            "date": r.date.isoformat(),
-            "mood": r.mood_score,
-            "stress": r.stress_score,
-            "energy": r.energy_score,
-            "emotions": r.emotions,
-            "sleep_hours": r.sleep_hours,
-            "notes": r.notes,
-            "analysis": r.analysis_summary,
-            "recs": r.recommendations,
-        } for r in rows
-    ]
-    data = orjson.dumps(payload)
-    await message.answer_document(document=BufferedInputFile(data, filename="export.json"))
-
-
-async def cmd_delete_me(message: Message, state: FSMContext, session: AsyncSession):
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
-    await session.execute(delete(Checkin).where(Checkin.user_id == user.id))
-    await session.execute(delete(Reminder).where(Reminder.user_id == user.id))
-    await session.execute(delete(User).where(User.id == user.id))
+    spool = await write_export(session, user.id, req)
+    try:
+        await session.release()
+        await message.answer_document(
+            document=SpooledInputFile(spool, filename=req.filename),
+            caption=t('export_ready', locale, format=req.fmt.upper() + (" (gzip)" if req.compress else "")),
+        )
+    finally:
+        spool.close()
+
+
+async def cmd_delete_me(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
+    locale = user.language_code or 'ru'
+    await delete_user(session, user.id)
     await session.commit()
-    await message.answer("Данные удалены.")
+    user_cache.invalidate(user.tg_user_id)
+    # незаконченный чек-ин или история чата коуча — тоже данные пользователя
+    await state.clear()
+    await message.answer(t('deleted', locale))
 
 
 # === Coach chat ===
 
-async def cmd_coach(message: Message, state: FSMContext, session: AsyncSession):
+async def cmd_coach(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     # старт чата — подтягиваем последний чек-ин как контекст
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
     locale = user.language_code or 'ru'
 
     last = await session.execute(
@@ -475,70 +422,69 @@ async def cmd_coach(message: Message, state: FSMContext, session: AsyncSession):
 
     ctx = ""
     if last:
-        ctx = (
-            f"Контекст последнего чек-ина ({last.date.date()}): "
-            f"mood={last.mood_score}, stress={last.stress_score}, energy={last.energy_score}, "
-            f"sleep={last.sleep_hours}, emotions={last.emotions or ''}, notes={(last.notes or '')[:200]}"
+        ctx = t(
+            'coach_context', locale, date=last.date.date(),
+            mood=last.mood_score, stress=last.stress_score, energy=last.energy_score,
+            sleep=last.sleep_hours, emotions=last.emotions or '', notes=(last.notes or '')[:200],
         )
 
+    coach = CoachContext(context=ctx)
+    coach.add("user", t('coach_opening', locale))
     await state.set_state(ChatStates.active)
-    await state.update_data(history=[{"role": "user", "content": f"{ctx}\nКоротко: поможешь обсудить мой день?"}])
+    await state.update_data(**coach.to_data())
 
-    intro = (
-        "Режим беседы с коучем включён. Пиши сообщение — отвечу. "
-        "Есть быстрые кнопки ниже."
-    )
-    await message.answer(intro, reply_markup=kb_chat_controls())
+    await message.answer(t('coach_intro', locale), reply_markup=kb_chat_controls(locale))
 
 
-async def cb_coach_prompt(query: CallbackQuery, state: FSMContext, session: AsyncSession):
+async def cb_coach_prompt(query: CallbackQuery, state: FSMContext, session: LazySession, user: CachedUser):
     # быстрые подсказки
     _, _, kind = (query.data or "coach:prompt:summary").split(":")
-    prompt_map = {
-        "summary": "Подытожь мой день коротко и доброжелательно. Дай 2–3 мягких шага.",
-        "plan": "Помоги составить простой план на завтра из 3 шагов (сон/учёба/отдых).",
-        "stress": "Что могу сделать сегодня и завтра, чтобы снизить стресс без риска?",
-    }
-    user_prompt = prompt_map.get(kind, "Подытожь и дай 2–3 шага.")
+    locale = user.language_code or 'ru'
+    key = f"coach_prompt_{kind}" if kind in ("summary", "plan", "stress") else "coach_prompt_default"
 
-    data = await state.get_data()
-    history = data.get("history", [])
-    history.append({"role": "user", "content": user_prompt})
-    await state.update_data(history=history)
+    coach = CoachContext.from_data(await state.get_data())
+    coach.add("user", t(key, locale))
 
     # ответ модели
-    result = await session.execute(select(User).where(User.tg_user_id == query.from_user.id))
-    user = result.scalar_one_or_none()
-    locale = user.language_code or 'ru'
-    reply = await chat(history, locale=locale)
-    history.append({"role": "assistant", "content": reply})
-    await state.update_data(history=history)
+    from src.llm import chat_stream
 
-    await query.message.answer(reply, reply_markup=kb_chat_controls())
+    await session.release()
     await query.answer()
+    reply = await send_streamed(
+        query.bot, query.message.chat.id, chat_stream(coach.messages(), locale=locale), reply_markup=kb_chat_controls(locale),
+        empty_text=t('llm_empty', locale),
+    )
+    coach.add("assistant", reply)
+
+    await coach.compact(locale)
+    await state.update_data(**coach.to_data())
 
 
-async def cb_coach_end(query: CallbackQuery, state: FSMContext, session: AsyncSession):
+async def cb_coach_end(query: CallbackQuery, state: FSMContext, session: LazySession, user: CachedUser):
     await state.clear()
-    await query.message.edit_text("Беседа завершена.")
+    await query.message.edit_text(t('coach_ended', user.language_code or 'ru'))
     await query.answer()
 
 
-async def chat_message_handler(message: Message, state: FSMContext, session: AsyncSession):
+async def chat_message_handler(message: Message, state: FSMContext, session: LazySession, user: CachedUser):
     # любые сообщения, пока ChatStates.active
-    data = await state.get_data()
-    history = data.get("history", [])
-    history.append({"role": "user", "content": message.text or ""})
+    coach = CoachContext.from_data(await state.get_data())
+    coach.add("user", message.text or "")
 
-    result = await session.execute(select(User).where(User.tg_user_id == message.from_user.id))
-    user = result.scalar_one_or_none()
     locale = user.language_code or 'ru'
 
-    reply = await chat(history, locale=locale)
-    history.append({"role": "assistant", "content": reply})
-    await state.update_data(history=history)
+    from src.llm import chat_stream
+
+    await session.release()
+    reply = await send_streamed(
+        message.bot, message.chat.id, chat_stream(coach.messages(), locale=locale), reply_markup=kb_chat_controls(locale),
+        empty_text=t('llm_empty', locale),
+    )
+    coach.add("assistant", reply)
 
-    await message.answer(reply, reply_markup=kb_chat_controls())
+    # сворачиваем старые реплики в сводку уже после ответа пользователю
+    await coach.compact(locale)
+    await state.update_data(**coach.to_data())
 
 
 # ===== Infra =====
@@ -567,6 +513,7 @@ def setup_routes(dp: Dispatcher):
     dp.message.register(notes_handler, CheckinStates.notes)
 
     dp.message.register(cmd_stats, Command(commands=["stats"]))
+    dp.message.register(cmd_chart, Command(commands=["chart"]))
     dp.message.register(cmd_export, Command(commands=["export"]))
     dp.message.register(cmd_delete_me, Command(commands=["delete_me"]))
 
@@ -577,54 +524,289 @@ def setup_routes(dp: Dispatcher):
     dp.message.register(chat_message_handler, ChatStates.active)
 
 
+def build_dispatcher(storage: SQLStorage, user_queues: UserQueues | None = None) -> Dispatcher:
+    """Dispatcher with the production middleware chain and routes (also used by bench/)."""
+    dp = Dispatcher(storage=storage)
+    if user_queues is not None:
+        # до метрик: время апдейта считается от выхода из очереди, ожидание — отдельно
+        user_queues.attach(dp)
+    instrument_dispatcher(dp)
+    dp.update.outer_middleware(startup.schema_gate_mw)
+    # буфер FSM должен охватывать FSM-middleware, чтобы чтение состояния тоже шло через него
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(storage.middleware)
+    dp.update.outer_middleware(dp.fsm)
+    dp.update.outer_middleware(session_mw)
+    dp.update.outer_middleware(user_mw)
+    dp.message.outer_middleware(crisis_mw)
+    setup_routes(dp)
+    return dp
+
+
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # схемой управляет Alembic (render.yaml: alembic upgrade head); create_all — только для новой dev-БД
+    revision = await schema_revision()
+    if revision is None:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    elif revision != SCHEMA_REVISION:
+        log.error("db: schema revision %s, code expects %s — run `alembic upgrade head`", revision, SCHEMA_REVISION)
+    startup.schema_ready.set()
 
 
 async def health(request):
-    return web.Response(text="ok")
+    return web.Response(text=f"ok\nshards: {shards.SHARDS}")
+
+
+def shard_health(user_queues: UserQueues):
+    # опрашивает фронт-процесс по unix-сокету
+    async def handle(request):
+        return web.json_response({
+            "shard": shards.SHARD, "shards": shards.SHARDS, "pending": user_queues.pending, "users": user_queues.users,
+        })
+
+    return handle
+
+
+def front_health(router: shards.ShardRouter, workers: shards.ShardWorkers):
+    async def handle(request):
+        states = await asyncio.gather(*(router.health(i) for i in range(shards.SHARDS)))
+        lines = ["ok", f"shards: {shards.SHARDS}"]
+        for i, state in enumerate(states):
+            if state is None:
+                lines.append(f"shard {i}: {'starting' if workers.alive(i) else 'down'}")
+            else:
+                lines.append(f"shard {i}: up, pending {state['pending']}, users {state['users']}")
+        return web.Response(text="\n".join(lines))
+
+    return handle
+
+
+def front_webhook(router: shards.ShardRouter):
+    async def handle(request):
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != settings.webhook_secret:
+            raise web.HTTPUnauthorized()
+        body = await request.read()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            # повтор ничего не исправит: отвечаем 200, иначе Telegram будет слать его вечно
+            log.warning("shards: malformed update dropped: %r", body[:200])
+            return web.json_response({})
+        try:
+            await router.forward(data, body)
+        except aiohttp.ClientResponseError as e:
+            # шард ответил, но апдейт не принял (не разобрался в Update) — тоже не повторяем
+            log.error("shards: update %s rejected by its shard: %s", data.get("update_id"), e.status)
+        except Exception:
+            log.exception("shards: update %s not forwarded", data.get("update_id"))
+            # шард недоступен — не 200, Telegram пришлёт апдейт повторно
+            return web.Response(status=503)
+        return web.json_response({})
+
+    return handle
 
 
 async def index(request):
     return web.Response(text="MindCheck bot running")
 
 
-async def run_http_server():
+def build_http_app(dp: Dispatcher, bot: Bot, user_queues: UserQueues | None = None) -> web.Application:
     app = web.Application()
-    app.add_routes([web.get('/', index), web.get('/healthz', health)])
+    if shards.SHARD is not None:
+        # воркер шарда: апдейты приходят от фронт-процесса по unix-сокету
+        app.add_routes([web.get('/healthz', shard_health(user_queues)), web.get('/metrics', metrics_handler(engine))])
+        SimpleRequestHandler(dispatcher=dp, bot=bot, handle_in_background=False).register(app, path="/update")
+        setup_application(app, dp, bot=bot)
+        return app
+    app.add_routes([web.get('/', index), web.get('/healthz', health), web.get('/metrics', metrics_handler(engine))])
+    if settings.bot_mode == "webhook":
+        # апдейт только ставится в очередь пользователя (UserQueues), так что ответ Telegram быстрый;
+        # когда очереди полны, ответ ждёт — это и есть обратное давление на Telegram
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            handle_in_background=False,
+            secret_token=settings.webhook_secret,
+        ).register(app, path=settings.webhook_path)
+        setup_application(app, dp, bot=bot)
+    return app
+
+
+async def setup_webhook(dp: Dispatcher, bot: Bot):
+    base_url = settings.webhook_url or os.getenv('RENDER_EXTERNAL_URL')
+    if not base_url:
+        raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_URL (or RENDER_EXTERNAL_URL).")
+    if not settings.webhook_secret:
+        raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_SECRET.")
+    await bot.set_webhook(
+        base_url.rstrip('/') + settings.webhook_path,
+        secret_token=settings.webhook_secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+
+async def start_http_server(app: web.Application) -> web.AppRunner:
     runner = web.AppRunner(app)
     await runner.setup()
-    port = int(os.getenv('PORT', '10000'))
-    site = web.TCPSite(runner, host='0.0.0.0', port=port)
+    if shards.SHARD is not None:
+        site = web.UnixSite(runner, shards.socket_path(shards.SHARD))
+    else:
+        site = web.TCPSite(runner, host='0.0.0.0', port=int(os.getenv('PORT', '10000')))
     await site.start()
-    while True:
-        await asyncio.sleep(3600)
+    return runner
+
+
+async def wait_for_stop() -> None:
+    """Sleep until SIGTERM (platform shutdown, or the front process stopping its workers)."""
+    stop = asyncio.Event()
+    if sys.platform != "win32":
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    await stop.wait()
+
+
+async def prepare_bot(dp: Dispatcher, bot: Bot):
+    if shards.SHARD is not None:
+        # webhook и polling — у фронт-процесса
+        return
+    if settings.bot_mode == "webhook":
+        await setup_webhook(dp, bot)
+    else:
+        await bot.delete_webhook()
 
 
 async def main():
+    startup.mark("imports")
     bot = Bot(
         token=settings.bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    # первой: метрики Bot API меряют сам запрос, ожидание лимитов — telegram_send_wait_seconds
+    bot.session.middleware(SendQueue())
+    bot.session.middleware(TelegramMetricsMiddleware())
+    instrument_engine(engine)
+
+    storage = SQLStorage(engine, settings.fsm_ttl, settings.fsm_evict_interval)
+    user_queues = UserQueues()
+    dp = build_dispatcher(storage, user_queues)
+    dp.update.outer_middleware(startup.first_update_mw)
+    app = build_http_app(dp, bot, user_queues)
+
+    reminders = ReminderEngine(bot)
+    archiver = CheckinArchiver(engine)
+    analysis_worker = AnalysisWorker(bot)
+    runner = None
+
+    async def start_services():
+        await reminders.start()
+        if shards.is_primary():
+            # общие для всех шардов задачи — в одном процессе
+            storage.start_eviction()
+            archiver.start()
+        await analysis_worker.start()
+        start_reloader(settings.i18n_reload_interval)
 
+    try:
+        await user_queues.start()
+        if settings.fast_start:
+            # спящий инстанс будит сам апдейт: сначала слушаем порт (webhook отвечает 200 сразу,
+            # апдейт ждёт соединения из пула), остальное — параллельно; LLM-клиент и пул
+            # графиков создаются при первом использовании
+            runner = await startup.timed("http_listening", start_http_server(app))
+            await asyncio.gather(
+                startup.timed("schema_checked", init_db()),
+                startup.timed("pool_prewarmed", prewarm_pool(settings.db_prewarm_connections)),
+                startup.timed("telegram_ready", prepare_bot(dp, bot)),
+            )
+            await startup.timed("services_started", start_services())
+        else:
+            await startup.timed("schema_checked", init_db())
+            from src.llm import start_llm_client
+            await start_llm_client()
+            start_chart_pool()
+            await startup.timed("services_started", start_services())
+            await startup.timed("telegram_ready", prepare_bot(dp, bot))
+            runner = await startup.timed("http_listening", start_http_server(app))
+
+        if settings.bot_mode == "webhook" or shards.SHARD is not None:
+            await wait_for_stop()
+        else:
+            # апдейты раздаёт UserQueues; без задач на апдейт цикл polling ждёт, когда очереди полны
+            await dp.start_polling(bot, handle_as_tasks=False)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        await user_queues.stop()
+        await stop_reloader()
+        await analysis_worker.stop()
+        await archiver.stop()
+        await reminders.stop()
+        await storage.close()
+        llm = sys.modules.get("src.llm")
+        if llm is not None:  # в быстром старте модуль мог так и не загрузиться
+            await llm.stop_llm_client()
+        stop_chart_pool()
+
+
+async def front_main():
+    """
+    SHARDS > 1, front process: starts the shard workers and hands them raw updates from the
+    webhook or getUpdates (src/shards.py); it runs no handlers itself.
+    """
+    bot = Bot(token=settings.bot_token)
     dp = Dispatcher()
-    await init_db()
-
-    async def db_session_mw(handler, event, data):
-        async for session in get_session():
-            data["session"] = session
-            return await handler(event, data)
-
-    dp.update.outer_middleware(db_session_mw)
-
-    setup_routes(dp)
-
-    await asyncio.gather(
-        dp.start_polling(bot),
-        run_http_server(),
-    )
+    setup_routes(dp)  # только ради allowed_updates
+    router = shards.ShardRouter()
+    workers = shards.ShardWorkers()
+    app = web.Application()
+    app.add_routes([
+        web.get('/', index), web.get('/healthz', front_health(router, workers)),
+        web.get('/metrics', front_metrics_handler(router)),
+    ])
+    if settings.bot_mode == "webhook":
+        app.router.add_post(settings.webhook_path, front_webhook(router))
+    runner, poller = None, None
+    try:
+        if settings.fast_start:
+            # апдейты, пришедшие до запуска воркеров, ждут их в forward
+            runner = await startup.timed("http_listening", start_http_server(app))
+        # схема проверяется (в dev — создаётся) один раз, до воркеров
+        await startup.timed("schema_checked", init_db())
+        await engine.dispose()
+        await workers.start()
+        await startup.timed("telegram_ready", prepare_bot(dp, bot))
+        if runner is None:
+            runner = await startup.timed("http_listening", start_http_server(app))
+        if settings.bot_mode != "webhook":
+            poller = asyncio.create_task(
+                router.poll(bot.session.api.api_url(bot.token, "getUpdates"), dp.resolve_used_update_types())
+            )
+        log.info("shards: front process routing updates to %d workers", shards.SHARDS)
+        await wait_for_stop()
+    finally:
+        if poller is not None:
+            poller.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        await workers.stop()
+        await router.close()
+        await bot.session.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    logging.basicConfig(
+        level=logging.INFO,
+        format=logging.BASIC_FORMAT if shards.SHARD is None else f"%(levelname)s:shard-{shards.SHARD}:%(name)s:%(message)s",
+    )
+    entry = front_main if shards.is_front() else main
+    if settings.use_uvloop and sys.platform != "win32":
+        try:
+            import uvloop
+        except ImportError:
+            asyncio.run(entry())
+        else:
+            uvloop.run(entry())
+    else:
+        asyncio.run(entry())
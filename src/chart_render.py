@@ -0,0 +1,73 @@
+"""
+Pure chart rendering, executed in a worker process/thread (see `charts.py`).
+
+Kept free of aiogram/SQLAlchemy imports so pool workers start quickly.
+"""
+from __future__ import annotations
+
+import io
+from datetime import date
+
+
+def moving_average(values, window: int):
+    """Trailing mean over `window` days ignoring NaN gaps; NaN where the window is empty."""
+    import numpy as np
+
+    arr = np.asarray(values, dtype=float)
+    valid = ~np.isnan(arr)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, arr, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    idx = np.arange(arr.size)
+    lo = np.maximum(idx - window + 1, 0)
+    s = sums[idx + 1] - sums[lo]
+    n = counts[idx + 1] - counts[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 0, s / n, np.nan)
+
+
+def render_chart(
+    start: int,
+    days: int,
+    points: list[tuple[int, int | None, int | None, int | None, int | None]],
+    labels: dict[str, str],
+    title: str,
+    window: int,
+) -> bytes:
+    """
+    PNG of mood/stress/energy (0–10) and sleep hours over `days` days starting at the
+    ordinal `start`. `points` are (date ordinal, mood, stress, energy, sleep).
+    """
+    import numpy as np
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    from matplotlib.figure import Figure
+
+    # плотный ряд по дням, пропуски — NaN
+    series = np.full((4, days), np.nan)
+    if points:
+        arr = np.array([[np.nan if v is None else v for v in p] for p in points], dtype=float)
+        pos = arr[:, 0].astype(int) - start
+        keep = (pos >= 0) & (pos < days)
+        series[:, pos[keep]] = arr[keep, 1:].T
+    x = np.array([date.fromordinal(start + i) for i in range(days)], dtype="datetime64[D]")
+
+    fig = Figure(figsize=(8, 5), dpi=100, layout="constrained")
+    top, bottom = fig.subplots(2, 1, sharex=True, height_ratios=(2, 1))
+    colors = {"mood": "tab:blue", "stress": "tab:red", "energy": "tab:green", "sleep": "tab:purple"}
+    for i, name in enumerate(("mood", "stress", "energy", "sleep")):
+        ax = bottom if name == "sleep" else top
+        ax.plot(x, series[i], "o", ms=3, alpha=0.35, color=colors[name])
+        ax.plot(x, moving_average(series[i], window), "-", lw=2, color=colors[name], label=labels[name])
+    top.set_ylim(0, 10.5)
+    bottom.set_ylim(bottom=0)
+    top.legend(loc="upper left", ncols=3, fontsize="small")
+    bottom.legend(loc="upper left", fontsize="small")
+    for ax in (top, bottom):
+        ax.grid(alpha=0.3)
+    locator = AutoDateLocator()
+    bottom.xaxis.set_major_locator(locator)
+    bottom.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    top.set_title(title)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from sqlalchemy import func, select
+
+from .chart_render import render_chart
+from .config import settings
+from .i18n import t
+from .metrics import CACHE_LOOKUPS, instrument_cache
+from .models import Checkin
+
+log = logging.getLogger(__name__)
+
+_pool: Executor | None = None
+
+
+def start_chart_pool() -> Executor:
+    return get_chart_pool()
+
+
+def stop_chart_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def get_chart_pool() -> Executor:
+    global _pool
+    if _pool is None:
+        if settings.chart_pool == "thread":
+            _pool = ThreadPoolExecutor(settings.chart_workers, thread_name_prefix="chart")
+        else:
+            # не fork: копия процесса с запущенным циклом, потоками и пулом соединений опасна;
+            # forkserver порождает воркеры из чистого процесса, который импортирует только chart_render
+            _pool = ProcessPoolExecutor(settings.chart_workers, mp_context=multiprocessing.get_context("forkserver"))
+    return _pool
+
+
+class ChartCache:
+    """
+    LRU of rendered PNGs keyed by (user_id, days, since, last_checkin_date, locale).
+    A new day (the window shifts) or a new last check-in date changes the key; an edit of
+    the same day's check-in is handled by `invalidate_user`.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[tuple, bytes] = OrderedDict()
+
+    def get(self, key: tuple) -> bytes | None:
+        png = self._data.get(key)
+        if png is None:
+            CACHE_LOOKUPS.labels("chart", "miss").inc()
+            return None
+        self._data.move_to_end(key)
+        CACHE_LOOKUPS.labels("chart", "hit").inc()
+        return png
+
+    def put(self, key: tuple, png: bytes) -> None:
+        self._data[key] = png
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        for key in [k for k in self._data if k[0] == user_id]:
+            del self._data[key]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+chart_cache = ChartCache(settings.chart_cache_size)
+instrument_cache("chart", chart_cache)
+
+
+async def get_chart(session, user_id: int, days: int, today: datetime, locale: str) -> bytes | None:
+    """PNG for the last `days` days, or None if there are no check-ins in that range."""
+    since = today - timedelta(days=days - 1)
+    last = (await session.execute(
+        select(func.max(Checkin.date)).where(Checkin.user_id == user_id, Checkin.date >= since)
+    )).scalar()
+    if last is None:
+        return None
+    # окно сдвигается каждый день, даже без новых чек-инов — старое начало уже не то
+    key = (user_id, days, since, last, locale)
+    png = chart_cache.get(key)
+    if png is not None:
+        return png
+
+    points = (await session.execute(
+        select(Checkin.date, Checkin.mood_score, Checkin.stress_score, Checkin.energy_score, Checkin.sleep_hours)
+        .where(Checkin.user_id == user_id, Checkin.date >= since)
+        .order_by(Checkin.date)
+    )).all()
+    # в пул уходят только простые типы — они пиклятся в процесс
+    render = partial(
+        render_chart,
+        since.toordinal(),
+        days,
+        [(d.toordinal(), m, s, e, sl) for d, m, s, e, sl in points],
+        {name: t(f'stats_label_{name}', locale) for name in ("mood", "stress", "energy", "sleep")},
+        t('chart_title', locale, days=days),
+        7 if days <= 90 else 30,
+    )
+    started = time.perf_counter()
+    png = await asyncio.get_running_loop().run_in_executor(get_chart_pool(), render)
+    log.info("chart: rendered %d days for user %s in %.0f ms", days, user_id, (time.perf_counter() - started) * 1000)
+    chart_cache.put(key, png)
+    return png
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    # без токенизатора: ~3 символа на токен для смеси кириллицы и латиницы
+    return len(text) // 3 + 4
+
+
+def _tokens(messages: list[dict]) -> int:
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+@dataclass
+class CoachContext:
+    """
+    Coach conversation kept in FSM data.
+
+    The last `keep_turns` messages are stored verbatim; older ones are folded into a
+    running `summary` in batches of `fold_batch` after the reply is sent. `messages()`
+    assembles the request within `budget` tokens (system prompt included).
+    """
+    context: str = ""
+    summary: str = ""
+    turns: list[dict] = field(default_factory=list)
+    full_tokens: int = 0  # сколько стоила бы вся история целиком
+    budget: int = field(default_factory=lambda: settings.coach_token_budget)
+    keep_turns: int = field(default_factory=lambda: settings.coach_keep_turns)
+    fold_batch: int = field(default_factory=lambda: settings.coach_fold_batch)
+
+    @classmethod
+    def from_data(cls, data: dict) -> CoachContext:
+        return cls(
+            context=data.get("context", ""),
+            summary=data.get("summary", ""),
+            turns=list(data.get("history", [])),
+            full_tokens=data.get("full_tokens", 0),
+        )
+
+    def to_data(self) -> dict:
+        return {
+            "context": self.context,
+            "summary": self.summary,
+            "history": self.turns,
+            "full_tokens": self.full_tokens,
+        }
+
+    def add(self, role: str, content: str) -> None:
+        self.turns.append({"role": role, "content": content})
+        self.full_tokens += estimate_tokens(content)
+
+    def messages(self) -> list[dict]:
+        from .llm import CHAT_SYSTEM_PROMPT
+
+        head = []
+        if self.context:
+            head.append({"role": "system", "content": self.context})
+        if self.summary:
+            head.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        available = self.budget - estimate_tokens(CHAT_SYSTEM_PROMPT) - _tokens(head)
+        tail: list[dict] = []
+        for m in reversed(self.turns):
+            cost = estimate_tokens(m["content"])
+            if tail and cost > available:
+                break
+            if not tail and cost > available:
+                # последнее сообщение пользователя отправляем всегда, обрезав под бюджет
+                m = {"role": m["role"], "content": m["content"][-max(available, 1) * 3:]}
+                cost = estimate_tokens(m["content"])
+            tail.append(m)
+            available -= cost
+        messages = head + tail[::-1]
+        sent = _tokens(messages)
+        full = self.full_tokens + estimate_tokens(self.context)
+        log.info("coach: request ~%d tokens, saved ~%d vs full history", sent, max(full - sent, 0))
+        return messages
+
+    async def compact(self, locale: str = "ru") -> None:
+        if len(self.turns) < self.keep_turns + self.fold_batch:
+            return
+        from .llm import summarize
+
+        old, self.turns = self.turns[:-self.keep_turns], self.turns[-self.keep_turns:]
+        self.summary = await summarize(self.summary, old, locale=locale)
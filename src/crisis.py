@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import re
+from collections import deque
+
+# Основы слов: совпадение по подстроке покрывает словоформы (суицид-альный, самоповрежд-ение)
+CRISIS_KEYWORDS = [
+    "суицид", "самоубийств", "покончу с собой", "покончить с собой", "покончу", "умереть", "хочу умереть",
+    "самоповреж", "не хочу жить", "не хочу больше жить", "жить не хочу", "не хочется жить", "незачем жить",
+    "не вижу смысла", "повешусь", "повеситься", "вскрыть вены", "порезать себя", "режу себя",
+    "self-harm", "self harm", "suicid", "kill myself", "killing myself", "end my life", "want to die",
+    "hurt myself", "cut myself",
+]
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, ё→е, every run of punctuation/whitespace → one space."""
+    return _NON_WORD.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+class CrisisDetector:
+    """
+    Aho–Corasick automaton over normalized keywords: one pass over the text,
+    O(len(text)) regardless of the keyword count. Transitions are memoized into a DFA
+    on first use, so the hot loop is a single dict lookup per character.
+    """
+
+    def __init__(self, keywords: list[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[tuple[str, ...]] = [()]
+        for kw in keywords:
+            self._add(normalize(kw), kw)
+        self._build()
+        self._delta: list[dict[str, int]] = [dict(g) for g in self._goto]
+
+    def _add(self, pattern: str, keyword: str) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        if pattern:
+            self._out[node] += (keyword,)
+
+    def _build(self) -> None:
+        # BFS: у детей корня fail = 0, дальше — по fail-ссылкам родителя
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def _transition(self, node: int, ch: str) -> int:
+        # goto с откатом по fail-ссылкам; результат запоминается в _delta (ленивый ДКА)
+        goto, fail = self._goto, self._fail
+        state = node
+        while state and ch not in goto[state]:
+            state = fail[state]
+        nxt = goto[state].get(ch, 0)
+        self._delta[node][ch] = nxt
+        return nxt
+
+    def find(self, text: str) -> list[str]:
+        """All keywords occurring in `text` (after normalization)."""
+        delta, out = self._delta, self._out
+        node, found = 0, []
+        for ch in normalize(text):
+            nxt = delta[node].get(ch)
+            node = self._transition(node, ch) if nxt is None else nxt
+            if out[node]:
+                found.extend(out[node])
+        return found
+
+    def detect(self, text: str) -> bool:
+        delta, out = self._delta, self._out
+        node = 0
+        for ch in normalize(text):
+            nxt = delta[node].get(ch)
+            node = self._transition(node, ch) if nxt is None else nxt
+            if out[node]:
+                return True
+        return False
+
+
+detector = CrisisDetector(CRISIS_KEYWORDS)
+
+
+def detect_crisis(text: str) -> bool:
+    return detector.detect(text)
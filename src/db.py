@@ -1,8 +1,11 @@
 from __future__ import annotations
+import asyncio
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, event, func, inspect, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from .config import settings
 
 
@@ -31,9 +34,94 @@ metadata = MetaData(naming_convention=convention)
 class Base(DeclarativeBase):
     metadata = metadata
 
-engine = create_async_engine(normalize_db_url(settings.database_url), pool_pre_ping=True)
+# последняя ревизия в migrations/versions — обновлять вместе с каждой новой миграцией
+SCHEMA_REVISION = '0008_analysis_job_message'
+
+def _connect_args(url: str) -> dict:
+    if url.startswith("postgresql+asyncpg"):
+        # повторный запрос на соединении — только Bind/Execute, без Parse/Describe
+        return {"prepared_statement_cache_size": settings.db_statement_cache_size}
+    return {}
+
+
+_url = normalize_db_url(settings.database_url)
+engine = create_async_engine(_url, pool_pre_ping=True, connect_args=_connect_args(_url))
+
+if engine.dialect.name == "sqlite":
+    # без этого SQLite игнорирует ON DELETE CASCADE, на который опирается repository.delete_user
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+def dialect_insert(model):
+    """INSERT construct with `on_conflict_do_update` for the configured backend (Postgres or SQLite)."""
+    return (pg_insert if engine.dialect.name == "postgresql" else sqlite_insert)(model)
+
+def day_number(column):
+    """Timestamp as a number of days, for window frames over calendar days (`RANGE BETWEEN n PRECEDING ...`)."""
+    if engine.dialect.name == "postgresql":
+        return func.extract("epoch", column) / 86400
+    return func.julianday(column)
+
+async def schema_revision() -> str | None:
+    """Current Alembic revision, or None if the schema is not managed by Alembic (fresh dev DB)."""
+    def read(conn):
+        if not inspect(conn).has_table("alembic_version"):
+            return None
+        return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+
+    async with engine.connect() as conn:
+        return await conn.run_sync(read)
+
+
+async def prewarm_pool(connections: int) -> None:
+    """Open `connections` pool connections concurrently so the first updates don't pay for TCP/TLS/auth."""
+    async def touch():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(touch() for _ in range(connections)))
+
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with SessionLocal() as session:
         yield session
+
+
+class LazySession:
+    """
+    Per-update session proxy. The underlying `AsyncSession` is created on first attribute
+    access, so updates that never touch the DB never create a session or check out a connection.
+    """
+
+    __slots__ = ("_session",)
+
+    def __init__(self):
+        self._session: AsyncSession | None = None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = SessionLocal()
+        return getattr(self._session, name)
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    async def release(self) -> None:
+        """
+        End the current transaction (committing pending changes) and return the connection
+        to the pool. Call before long external awaits (LLM, file uploads); the session stays
+        usable and checks out a connection again on next use.
+        """
+        if self._session is not None and self._session.in_transaction():
+            await self._session.commit()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import time
+from collections import deque
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+from .config import settings
+from .metrics import DISPATCH_WAIT, instrument_user_queues
+
+log = logging.getLogger(__name__)
+
+
+class UserQueues:
+    """
+    Per-user FIFO in front of the aiogram dispatcher.
+
+    Updates of one user (fast taps on the scale keyboard, messages) are handled strictly one
+    after another in update_id order, so the FSM step they read is the one the previous update
+    wrote; different users run in parallel on `workers` tasks. At most `max_pending` updates
+    are queued — beyond that `middleware` waits, which holds the webhook response or the
+    polling loop and so pushes back on Telegram. A user's queue exists only while it has work.
+    """
+
+    def __init__(self):
+        self.dp: Dispatcher | None = None
+        self.workers = settings.dispatch_workers
+        self.max_pending = settings.dispatch_max_pending
+        self.pending = 0
+        self.busy = 0
+        self._slots = asyncio.Semaphore(self.max_pending)
+        # ключ -> апдейты, ждущие своей очереди; ключ есть в _ready или в работе ровно пока очередь жива
+        self._queues: dict[object, deque[tuple[int, Update, Bot, float]]] = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def users(self) -> int:
+        return len(self._queues)
+
+    def attach(self, dp: Dispatcher) -> None:
+        """Register `middleware` on a fresh dispatcher, before every other outer update middleware."""
+        self.dp = dp
+        dp.update.outer_middleware(self.middleware)
+
+    async def middleware(self, handler, event: Update, data):
+        # первый проход — только постановка в очередь; воркер подаёт апдейт повторно с dispatch_queued
+        if data.get("dispatch_queued"):
+            return await handler(event, data)
+        user, chat = data.get("event_from_user"), data.get("event_chat")
+        key = user.id if user else chat.id if chat else ("update", event.update_id)
+        await self.submit(key, event, data["bot"])
+        return None
+
+    async def submit(self, key, update: Update, bot: Bot) -> None:
+        await self._slots.acquire()
+        self.pending += 1
+        item = (update.update_id, update, bot, time.perf_counter())
+        queue = self._queues.get(key)
+        if queue is None:
+            self._queues[key] = deque([item])
+            self._ready.put_nowait(key)
+        elif not queue or queue[-1][0] < item[0]:
+            queue.append(item)
+        else:
+            # при webhook апдейты одного пользователя могут прийти по разным соединениям не по порядку
+            bisect.insort(queue, item, key=lambda i: i[0])
+
+    async def start(self) -> None:
+        instrument_user_queues(self)
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10) -> None:
+        # даём доработать уже принятым апдейтам: Telegram их повторно не пришлёт
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            _, update, bot, enqueued = queue.popleft()
+            DISPATCH_WAIT.observe(time.perf_counter() - enqueued)
+            self.busy += 1
+            try:
+                response = await self.dp.feed_update(bot, update, dispatch_queued=True)
+                if isinstance(response, TelegramMethod):
+                    await self.dp.silent_call_request(bot=bot, result=response)
+            except Exception:
+                log.exception("dispatch: update %s failed", update.update_id)
+            finally:
+                self.busy -= 1
+                self.pending -= 1
+                self._slots.release()
+                # следующий апдейт пользователя — в конец общей очереди, чтобы не занимать воркер подряд
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._queues[key]
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncGenerator
+
+from aiogram.types.input_file import DEFAULT_CHUNK_SIZE, InputFile
+from sqlalchemy import select
+
+from .config import settings
+from .archive import checkin_record, iter_archived
+from .models import Checkin
+
+FORMATS = ("json", "ndjson", "csv")
+COLUMNS = ("date", "mood", "stress", "energy", "emotions", "sleep_hours", "notes", "analysis", "recs")
+
+
+@dataclass
+class ExportRequest:
+    fmt: str = "json"
+    compress: bool = False
+    since: datetime | None = None  # включительно
+    until: datetime | None = None  # не включительно
+
+    @property
+    def filename(self) -> str:
+        return f"export.{self.fmt}" + (".gz" if self.compress else "")
+
+
+def parse_export_args(args: str | None) -> ExportRequest | None:
+    """
+    `/export [json|ndjson|csv] [gz] [YYYY-MM-DD[..YYYY-MM-DD]]` in any order.
+    Returns None when an argument is not understood.
+    """
+    req = ExportRequest()
+    for token in (args or "").lower().split():
+        if token in FORMATS:
+            req.fmt = token
+        elif token in ("gz", "gzip"):
+            req.compress = True
+        else:
+            start, sep, end = token.partition("..")
+            if not start and not end:
+                # голое ".." — не диапазон, а опечатка: показываем подсказку, а не выгружаем всё
+                return None
+            try:
+                if start:
+                    req.since = datetime.strptime(start, "%Y-%m-%d")
+                if end:
+                    req.until = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)
+                elif not sep:
+                    # одна дата — только этот день
+                    req.until = req.since + timedelta(days=1)
+            except ValueError:
+                return None
+    return req
+
+
+class _CsvEncoder:
+    def __init__(self):
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf)
+
+    def __call__(self, values) -> bytes:
+        self._buf.seek(0)
+        self._buf.truncate()
+        self._writer.writerow(values)
+        return self._buf.getvalue().encode("utf-8")
+
+
+async def write_export(session, user_id: int, req: ExportRequest) -> tempfile.SpooledTemporaryFile:
+    """
+    Stream the user's check-ins from a server-side cursor into a spooled temp file,
+    one row at a time, so memory stays bounded by the batch size and the spool size.
+    The returned file is positioned at 0; the caller closes it.
+    """
+    stmt = select(Checkin).where(Checkin.user_id == user_id).order_by(Checkin.date.asc())
+    if req.since:
+        stmt = stmt.where(Checkin.date >= req.since)
+    if req.until:
+        stmt = stmt.where(Checkin.date < req.until)
+    stmt = stmt.execution_options(yield_per=settings.export_batch_size)
+
+    import orjson
+
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.export_spool_size)
+    out = gzip.GzipFile(fileobj=spool, mode="wb") if req.compress else spool
+    first = True
+
+    def emit(record: dict) -> None:
+        nonlocal first
+        if req.fmt == "csv":
+            out.write(encode(record.values()))
+        elif req.fmt == "ndjson":
+            out.write(orjson.dumps(record) + b"\n")
+        else:
+            out.write((b"" if first else b",") + orjson.dumps(record))
+        first = False
+
+    try:
+        if req.fmt == "csv":
+            encode = _CsvEncoder()
+            out.write(b"\xef\xbb\xbf")  # BOM — чтобы Excel открыл кириллицу
+            out.write(encode(COLUMNS))
+        elif req.fmt == "json":
+            out.write(b"[")
+        # сначала архивные месяцы (они всегда старше живых секций), по одному месяцу в памяти
+        async for record in iter_archived(session, user_id, req.since, req.until):
+            emit(record)
+        async for c in await session.stream_scalars(stmt):
+            emit(checkin_record(c))
+            session.expunge(c)
+        if req.fmt == "json":
+            out.write(b"]")
+        if out is not spool:
+            out.close()
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+class SpooledInputFile(InputFile):
+    """Uploads an open file object chunk by chunk (aiogram's BufferedInputFile needs all bytes at once)."""
+
+    def __init__(self, file, filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
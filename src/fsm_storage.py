@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .db import dialect_insert
+from .models import FsmState
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    loaded: bool = False
+    state_dirty: bool = False
+    data_dirty: bool = False
+
+
+# ключ -> запись, накопленные за время обработки текущего апдейта
+_pending: ContextVar[dict[str, _Entry] | None] = ContextVar("fsm_pending", default=None)
+
+
+class SQLStorage(BaseStorage):
+    """
+    FSM storage in the `fsm_states` table.
+
+    Inside `middleware` (one update) the row is read at most once and all `set_state` /
+    `set_data` / `update_data` calls are buffered and written with a single upsert when
+    the update finishes. Rows expire `ttl` seconds after the last write; expired rows are
+    invisible to reads and removed in batches by a background task.
+    """
+
+    def __init__(self, engine: AsyncEngine, ttl: float, evict_interval: float = 600, evict_batch: int = 1000):
+        self.engine = engine
+        self.ttl = timedelta(seconds=ttl)
+        self.evict_interval = evict_interval
+        self.evict_batch = evict_batch
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._evict_task: asyncio.Task | None = None
+
+    # --- per-update unit of work ---
+
+    async def middleware(self, handler, event, data):
+        token = _pending.set({})
+        try:
+            return await handler(event, data)
+        finally:
+            pending = _pending.get()
+            _pending.reset(token)
+            for key, entry in pending.items():
+                await self._flush(key, entry)
+
+    async def _entry(self, key: StorageKey, load: bool) -> tuple[str, _Entry, bool]:
+        k = self.key_builder.build(key)
+        pending = _pending.get()
+        entry = pending.get(k) if pending is not None else None
+        if entry is None:
+            entry = _Entry()
+            if pending is not None:
+                pending[k] = entry
+        if load and not entry.loaded:
+            await self._load(k, entry)
+        return k, entry, pending is not None
+
+    async def _load(self, k: str, entry: _Entry) -> None:
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(
+                select(FsmState.state, FsmState.data)
+                .where(FsmState.key == k, FsmState.expires_at > datetime.utcnow())
+            )).first()
+        if row is not None:
+            if not entry.state_dirty:
+                entry.state = row.state
+            if not entry.data_dirty:
+                entry.data = dict(row.data or {})
+        entry.loaded = True
+
+    async def _flush(self, k: str, entry: _Entry) -> None:
+        if not (entry.state_dirty or entry.data_dirty):
+            return
+        if not entry.loaded:
+            # пишем строку целиком, чтобы не воскресить половину просроченной записи
+            await self._load(k, entry)
+        async with self.engine.begin() as conn:
+            if entry.state is None and not entry.data:
+                await conn.execute(delete(FsmState).where(FsmState.key == k))
+                return
+            values = {"state": entry.state, "data": entry.data, "expires_at": datetime.utcnow() + self.ttl}
+            stmt = dialect_insert(FsmState).values(key=k, **values)
+            await conn.execute(stmt.on_conflict_do_update(index_elements=[FsmState.key], set_=values))
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, entry, buffered = await self._entry(key, load=False)
+        entry.state = state.state if isinstance(state, State) else state
+        entry.state_dirty = True
+        if not buffered:
+            await self._flush(k, entry)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, entry, _ = await self._entry(key, load=True)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        k, entry, buffered = await self._entry(key, load=False)
+        entry.data = dict(data)
+        entry.data_dirty = True
+        if not buffered:
+            await self._flush(k, entry)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, entry, _ = await self._entry(key, load=True)
+        return dict(entry.data)
+
+    async def close(self) -> None:
+        if self._evict_task:
+            self._evict_task.cancel()
+            try:
+                await self._evict_task
+            except asyncio.CancelledError:
+                pass
+            self._evict_task = None
+
+    # --- TTL eviction ---
+
+    def start_eviction(self) -> None:
+        if self._evict_task is None:
+            self._evict_task = asyncio.create_task(self._evict_loop())
+
+    async def evict_expired(self) -> int:
+        removed = 0
+        while True:
+            async with self.engine.begin() as conn:
+                expired = (
+                    select(FsmState.key)
+                    .where(FsmState.expires_at <= datetime.utcnow())
+                    .limit(self.evict_batch)
+                    .scalar_subquery()
+                )
+                res = await conn.execute(delete(FsmState).where(FsmState.key.in_(expired)))
+            removed += res.rowcount
+            if res.rowcount < self.evict_batch:
+                return removed
+
+    async def _evict_loop(self) -> None:
+        while True:
+            try:
+                removed = await self.evict_expired()
+                if removed:
+                    log.info("fsm: evicted %d expired states", removed)
+            except Exception:
+                log.exception("fsm: eviction failed")
+            await asyncio.sleep(self.evict_interval)
@@ -1,13 +1,106 @@
 from __future__ import annotations
+import asyncio
 import json
+import logging
 from pathlib import Path
+from string import Formatter
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+LOCALES = ("ru", "en")
+DEFAULT_LOCALE = "ru"
 
-_LOCALES = {}
 _BASE = Path(__file__).parent
-for loc in ("ru", "en"):
-    with open(_BASE / f"strings_{loc}.json", "r", encoding="utf-8") as f:
-        _LOCALES[loc] = json.load(f)
+_LOCALES: dict[str, dict[str, str]] = {}
+_mtimes: dict[str, float] = {}
+_listeners: list[Callable[[], None]] = []
+_reloader: asyncio.Task | None = None
+
+
+def _fields(template: str) -> set[str]:
+    return {name for _, name, _, _ in Formatter().parse(template) if name}
+
+
+def _file_mtimes() -> dict[str, float]:
+    return {loc: (_BASE / f"strings_{loc}.json").stat().st_mtime for loc in LOCALES}
+
+
+def _load() -> dict[str, dict[str, str]]:
+    """Read and check every locale: same placeholders as the default locale, missing keys fall back to it."""
+    catalogs = {}
+    for loc in LOCALES:
+        with open(_BASE / f"strings_{loc}.json", "r", encoding="utf-8") as f:
+            catalogs[loc] = json.load(f)
+    base = catalogs[DEFAULT_LOCALE]
+    for loc, data in catalogs.items():
+        for key, template in data.items():
+            # ошибку в шаблоне ловим при загрузке, а не на отправке сообщения
+            if key in base and _fields(template) != _fields(base[key]):
+                raise ValueError(f"i18n: placeholders of {loc}:{key} differ from {DEFAULT_LOCALE}")
+        missing = base.keys() - data.keys()
+        if missing:
+            log.warning("i18n: %s lacks %s, using %s", loc, ", ".join(sorted(missing)), DEFAULT_LOCALE)
+            catalogs[loc] = {**base, **data}
+    return catalogs
+
+
+def on_reload(callback: Callable[[], None]) -> None:
+    """Call `callback` after every successful (re)load, e.g. to rebuild prebuilt keyboards."""
+    _listeners.append(callback)
+
+
+def reload() -> bool:
+    """Re-read the string files; on any error keep serving the previous catalog."""
+    try:
+        catalogs = _load()
+    except Exception:
+        log.exception("i18n: reload failed, keeping the previous strings")
+        return False
+    _LOCALES.clear()
+    _LOCALES.update(catalogs)
+    for callback in _listeners:
+        callback()
+    return True
+
+
+def t(key: str, locale: str = "ru", **params) -> str:
+    data = _LOCALES.get(locale) or _LOCALES[DEFAULT_LOCALE]
+    text = data.get(key, key)
+    return text.format(**params) if params else text
+
+
+async def _watch(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            mtimes = _file_mtimes()
+        except OSError:
+            continue
+        if mtimes != _mtimes:
+            # запоминаем и при неудачной загрузке — ошибка логируется один раз на правку
+            _mtimes.update(mtimes)
+            if reload():
+                log.info("i18n: strings reloaded")
+
+
+def start_reloader(interval: float) -> None:
+    """Poll the string files every `interval` seconds and reload them on change (0 — off)."""
+    global _reloader
+    if interval > 0 and _reloader is None:
+        _reloader = asyncio.create_task(_watch(interval))
+
+
+async def stop_reloader() -> None:
+    global _reloader
+    if _reloader is not None:
+        _reloader.cancel()
+        try:
+            await _reloader
+        except asyncio.CancelledError:
+            pass
+        _reloader = None
+
 
-def t(key: str, locale: str = "ru") -> str:
-    data = _LOCALES.get(locale) or _LOCALES["ru"]
-    return data.get(key, key)
+_mtimes.update(_file_mtimes())
+_LOCALES.update(_load())
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from . import LOCALES, DEFAULT_LOCALE, on_reload, t
+
+SCALE_FIELDS = ("mood", "stress", "energy")
+CHECKIN_FIELDS = SCALE_FIELDS + ("emotions", "sleep", "notes")
+
+# (locale, keyboard, field) -> разметка; объекты aiogram неизменяемые, так что одну
+# разметку безопасно отдавать во все сообщения
+_markups: dict[tuple[str, str, str | None], InlineKeyboardMarkup] = {}
+
+
+def _consent(locale: str) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text=t("kb_consent_yes", locale), callback_data="consent:yes")
+    kb.button(text=t("kb_consent_no", locale), callback_data="consent:no")
+    kb.adjust(2)
+    return kb.as_markup()
+
+
+def _scale(locale: str, field: str) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    for i in range(1, 11):
+        kb.button(text=str(i), callback_data=f"scale:{field}:{i}")
+    kb.button(text=t("kb_skip", locale), callback_data=f"skip:{field}")
+    kb.adjust(5, 5, 1)
+    return kb.as_markup()
+
+
+def _skip(locale: str, field: str) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text=t("kb_skip", locale), callback_data=f"skip:{field}")
+    return kb.as_markup()
+
+
+def _chat_controls(locale: str) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text=t("kb_coach_summary", locale), callback_data="coach:prompt:summary")
+    kb.button(text=t("kb_coach_plan", locale), callback_data="coach:prompt:plan")
+    kb.button(text=t("kb_coach_stress", locale), callback_data="coach:prompt:stress")
+    kb.button(text=t("kb_coach_end", locale), callback_data="coach:end")
+    kb.adjust(2, 2)
+    return kb.as_markup()
+
+
+def build_keyboards() -> None:
+    """Build every keyboard for every locale; called on import and after each i18n reload."""
+    markups = {}
+    for loc in LOCALES:
+        markups[(loc, "consent", None)] = _consent(loc)
+        markups[(loc, "chat_controls", None)] = _chat_controls(loc)
+        for field in CHECKIN_FIELDS:
+            markups[(loc, "skip", field)] = _skip(loc, field)
+        for field in SCALE_FIELDS:
+            markups[(loc, "scale", field)] = _scale(loc, field)
+    _markups.clear()
+    _markups.update(markups)
+
+
+def _get(locale: str, name: str, field: str | None = None) -> InlineKeyboardMarkup:
+    markup = _markups.get((locale, name, field))
+    return markup if markup is not None else _markups[(DEFAULT_LOCALE, name, field)]
+
+
+def kb_consent(locale: str) -> InlineKeyboardMarkup:
+    return _get(locale, "consent")
+
+
+def kb_scale(field: str, locale: str) -> InlineKeyboardMarkup:
+    return _get(locale, "scale", field)
+
+
+def kb_skip(field: str, locale: str) -> InlineKeyboardMarkup:
+    return _get(locale, "skip", field)
+
+
+def kb_chat_controls(locale: str) -> InlineKeyboardMarkup:
+    return _get(locale, "chat_controls")
+
+
+build_keyboards()
+on_reload(build_keyboards)
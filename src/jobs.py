@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import select, update
+
+from . import shards
+from .config import settings
+from .db import SessionLocal, dialect_insert
+from .i18n import t
+from .local_analysis import quick_message
+from .models import AnalysisJob, Checkin
+from .repository import save_analysis
+from .send_queue import BULK, send_priority
+from .streaming import send_streamed
+
+log = logging.getLogger(__name__)
+
+_wakeup = asyncio.Event()
+
+
+class LeaseLost(Exception):
+    """The job was re-queued or taken by another worker while this one was running it."""
+
+
+async def enqueue_analysis(session, user_id: int, date: datetime, chat_id: int, locale: str, prompt: str,
+                           message_id: int | None = None) -> None:
+    """
+    Queue (or re-queue) the analysis of the check-in `(user_id, date)` in the caller's transaction.
+    A repeated check-in on the same day replaces the pending job instead of adding a second one.
+    With `message_id` the result replaces that message (the quick local analysis) instead of
+    arriving as a new one.
+    """
+    values = {
+        "chat_id": chat_id,
+        "locale": locale,
+        "prompt": prompt,
+        "message_id": message_id,
+        "status": "pending",
+        "attempts": 0,
+        "run_after": datetime.utcnow(),
+        "last_error": None,
+    }
+    stmt = dialect_insert(AnalysisJob).values(user_id=user_id, date=date, **values)
+    await session.execute(stmt.on_conflict_do_update(index_elements=["user_id", "date"], set_=values))
+
+
+def notify_workers() -> None:
+    """Wake idle workers after the enqueueing transaction has been committed."""
+    _wakeup.set()
+
+
+class AnalysisWorker:
+    """
+    Pool of `workers` tasks processing `analysis_jobs`.
+
+    A job is claimed by moving `run_after` one lease ahead with a compare-and-set UPDATE, so
+    only one worker (or replica) gets it and jobs of a crashed process become visible again
+    when the lease expires.
+    Failures are retried with exponential backoff up to `max_attempts`; finished jobs are deleted.
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.workers = settings.analysis_workers
+        self.max_attempts = settings.analysis_max_attempts
+        self.lease = timedelta(seconds=settings.analysis_lease)
+        self.poll_interval = settings.analysis_poll_interval
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        send_priority.set(BULK)
+        while True:
+            try:
+                job = await self._claim()
+            except Exception:
+                log.exception("jobs: claim failed")
+                job = None
+            if job is None:
+                _wakeup.clear()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._process(job)
+            except Exception:
+                # задача вернётся в очередь по истечении аренды; воркер не должен умирать
+                log.exception("jobs: processing job %s failed", job.id)
+
+    async def _claim(self) -> AnalysisJob | None:
+        now = datetime.utcnow()
+        async with SessionLocal() as session:
+            job = (await session.execute(
+                select(AnalysisJob)
+                .where(AnalysisJob.status.in_(("pending", "running")), AnalysisJob.run_after <= now)
+                # чат личный, его id — это tg_user_id: задачу берёт шард пользователя
+                .where(shards.owned(AnalysisJob.chat_id))
+                .order_by(AnalysisJob.run_after)
+                .limit(1)
+            )).scalar_one_or_none()
+            if job is None:
+                return None
+            # compare-and-set по run_after: из нескольких воркеров/реплик задачу получит один
+            lease_until = now + self.lease
+            res = await session.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job.id, AnalysisJob.run_after == job.run_after)
+                .values(status="running", attempts=AnalysisJob.attempts + 1, run_after=lease_until)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            if res.rowcount != 1:
+                return None
+            job.attempts += 1
+            job.run_after = lease_until
+            return job
+
+    async def _holds_lease(self, job: AnalysisJob) -> bool:
+        async with SessionLocal() as session:
+            return (await session.execute(
+                select(AnalysisJob.id).where(AnalysisJob.id == job.id, AnalysisJob.run_after == job.run_after)
+            )).first() is not None
+
+    async def _leased(self, job: AnalysisJob, chunks):
+        # перед первым выводом: при потерянной аренде пользователь не увидит устаревший разбор
+        checked = False
+        async for delta in chunks:
+            if not checked:
+                if not await self._holds_lease(job):
+                    raise LeaseLost()
+                checked = True
+            yield delta
+
+    async def _process(self, job: AnalysisJob) -> None:
+        from .llm import analyze_checkin_stream
+
+        chunks = analyze_checkin_stream(job.prompt, locale=job.locale, strict=True)
+        try:
+            if job.message_id is None:
+                analysis = await send_streamed(
+                    self.bot,
+                    job.chat_id,
+                    self._leased(job, chunks),
+                    prefix=t('analysis_ready', job.locale) + "\n\n",
+                    empty_text=t('llm_empty', job.locale),
+                    placeholder=False,
+                )
+            else:
+                analysis = await self._replace(job, chunks)
+        except LeaseLost:
+            log.info("jobs: analysis job %s was re-queued meanwhile, result dropped", job.id)
+            return
+        except Exception as e:
+            await self._fail(job, e)
+            return
+        async with SessionLocal() as session:
+            saved = await save_analysis(session, job, analysis)
+            await session.commit()
+        if not saved:
+            log.info("jobs: analysis job %s was re-queued meanwhile, result not stored", job.id)
+
+    async def _replace(self, job: AnalysisJob, chunks) -> str:
+        # быстрый разбор уже перед глазами — меняем его на ответ LLM целиком, без промежуточных правок
+        analysis = "".join([delta async for delta in chunks]).strip()
+        if not analysis:
+            raise ValueError("empty LLM analysis")
+        if not await self._holds_lease(job):
+            raise LeaseLost()
+        text = (t('analysis_ready', job.locale) + "\n\n" + analysis)[:4096]
+        try:
+            await self.bot.edit_message_text(text, chat_id=job.chat_id, message_id=job.message_id, parse_mode=None)
+        except TelegramBadRequest:
+            # сообщение удалено или слишком старое для правки — присылаем разбор отдельно
+            await self.bot.send_message(job.chat_id, text, parse_mode=None)
+        return analysis
+
+    async def _settle_quick(self, job: AnalysisJob) -> None:
+        """The LLM analysis will not come: drop the "detailed analysis follows" line from the quick one."""
+        async with SessionLocal() as session:
+            quick = (await session.execute(
+                select(Checkin.analysis_summary).where(Checkin.user_id == job.user_id, Checkin.date == job.date)
+            )).scalar_one_or_none()
+        if quick:
+            await self.bot.edit_message_text(
+                quick_message(quick, job.locale, pending=False),
+                chat_id=job.chat_id, message_id=job.message_id, parse_mode=None,
+            )
+
+    async def _fail(self, job: AnalysisJob, error: Exception) -> None:
+        final = job.attempts >= self.max_attempts or isinstance(error, TelegramForbiddenError)
+        backoff = min(settings.analysis_backoff * 2 ** (job.attempts - 1), 600) * random.uniform(0.8, 1.2)
+        log.warning("jobs: analysis job %s attempt %d failed: %r", job.id, job.attempts, error)
+        async with SessionLocal() as session:
+            res = await session.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job.id, AnalysisJob.run_after == job.run_after)
+                .values(
+                    status="failed" if final else "pending",
+                    run_after=datetime.utcnow() + timedelta(seconds=backoff),
+                    last_error=repr(error)[:500],
+                )
+            )
+            await session.commit()
+        if res.rowcount == 0:
+            # задачу уже перепоставили — о её судьбе сообщит новая попытка
+            return
+        if final and not isinstance(error, TelegramForbiddenError):
+            try:
+                if job.message_id is None:
+                    await self.bot.send_message(job.chat_id, t('analysis_failed', job.locale))
+                else:
+                    await self._settle_quick(job)
+            except Exception:
+                log.exception("jobs: failed to notify chat %s", job.chat_id)
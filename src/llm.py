@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 from .config import settings
+from .i18n import t
+from .llm_cache import cache_key, llm_cache
+from .metrics import instrument_llm, observe_llm
 
 SAFETY_SYSTEM_PROMPT = (
     "You are a professional, empathetic mental health coach.\n"
@@ -19,31 +22,311 @@ CHAT_SYSTEM_PROMPT = (
     "Avoid any diagnosis or medical claims. If crisis indicators appear, recommend seeking immediate help."
 )
 
-CRISIS_KEYWORDS = [
-    "суицид", "покончу", "умереть", "самоповреж", "self-harm", "suicide", "kill myself",
-    "не хочу жить", "не вижу смысла",
-]
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a coaching conversation.\n"
+    "Merge the previous summary with the new turns into one concise summary (max 120 words) "
+    "in the user's language: key facts, feelings, agreed steps. No advice, no diagnoses."
+)
+
+import asyncio
+import importlib.util
+import json
+import math
+import time
+from typing import AsyncIterator
 
 import httpx
 from httpx import HTTPStatusError, RequestError
 
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+from .llm_endpoints import Endpoint, parse_endpoints, route
+from .metrics import LLM_DEADLINE_EXCEEDED, LLM_HEDGES
 
 
-async def analyze_checkin(text: str, locale: str = "ru") -> str:
-    if not settings.openrouter_api_key:
-        return ("Краткий разбор (без LLM): я вижу важные моменты в ваших ответах.\n"
-                "Подумайте, что помогло сегодня, и что можно сделать завтра (сон, отдых, поддержка)."
-                if locale == "ru" else
-                "Brief analysis (no LLM): I see key points in your input. Consider what helped today and what to try tomorrow (sleep, rest, support).")
-
-    headers = {
-        "Authorization": f"Bearer {settings.openrouter_api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/Fyukon/mindCheckBot",
-        "X-Title": "MindCheckBot",
-    }
-    payload = {
+class LLMBusyError(Exception):
+    """Raised when the global LLM request queue is full."""
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the circuit breaker of every LLM endpoint is open."""
+
+
+class LLMDeadlineError(Exception):
+    """Raised when no endpoint answered (streams: sent a first token) before the call's deadline."""
+
+
+class LLMClient:
+    """
+    App-scoped OpenRouter client: one keep-alive connection pool (HTTP/2 when `h2` is installed)
+    and a global concurrency limit with a bounded FIFO queue in front of it.
+
+    Requests go to the endpoints of LLM_ENDPOINTS in order (see `llm_endpoints.route`). When the
+    current endpoint has not answered within its p95 latency and a slot is free, the same request
+    is hedged to the next one and the first answer wins; on an error the next one is tried.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, timeout: float = 30):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.endpoints = parse_endpoints(settings.llm_endpoints, settings.openrouter_model)
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._http = httpx.AsyncClient(
+            timeout=timeout,
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+                keepalive_expiry=settings.llm_keepalive_expiry,
+            ),
+            headers={
+                "Content-Type": "application/json",
+                "HTTP-Referer": "https://github.com/Fyukon/mindCheckBot",
+                "X-Title": "MindCheckBot",
+            },
+        )
+
+    @property
+    def queued(self) -> int:
+        return self._waiting
+
+    async def _acquire(self) -> None:
+        if self._sem.locked() and self._waiting >= self.max_queue:
+            raise LLMBusyError(f"LLM queue is full ({self._waiting} waiting)")
+        self._waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self._waiting -= 1
+
+    @staticmethod
+    def _auth() -> dict:
+        return {"Authorization": f"Bearer {settings.openrouter_api_key}"}
+
+    def preferred(self) -> Endpoint:
+        """Endpoint a request would be sent to first right now."""
+        endpoints = route(self.endpoints)
+        return endpoints[0] if endpoints else self.endpoints[0]
+
+    async def post(self, payload: dict, deadline: float | None = None) -> tuple[dict, Endpoint]:
+        """
+        Completion of `payload` from the first endpoint to answer, and that endpoint;
+        `deadline` — seconds for all attempts.
+        """
+        return await self._race("post", self._post, payload, deadline)
+
+    async def stream(self, payload: dict, deadline: float | None = None) -> tuple[Endpoint, AsyncIterator[str]]:
+        """
+        Start an SSE completion (`"stream": true`): the endpoint that answered first and its
+        content deltas. The race and `deadline` cover the first token; after it the answer is
+        read from that endpoint to the end.
+        """
+        (first, deltas), ep = await self._race(
+            "stream", self._open_stream, payload, deadline, discard=self._close_stream,
+        )
+
+        async def read() -> AsyncIterator[str]:
+            try:
+                if first is None:
+                    return
+                yield first
+                async for delta in deltas:
+                    yield delta
+            finally:
+                await deltas.aclose()
+
+        return ep, read()
+
+    async def _race(self, kind: str, attempt, payload: dict, deadline: float | None, discard=None):
+        loop = asyncio.get_running_loop()
+        endpoints = route(self.endpoints)
+        if not endpoints:
+            raise LLMUnavailableError("the circuit breaker of every LLM endpoint is open")
+        until = None if deadline is None else loop.time() + deadline
+        running: dict[asyncio.Task, tuple[Endpoint, float]] = {}
+        hedge_at: float | None = None
+        error: BaseException | None = None
+        # незавершённые попытки, начатые раньше этого момента, заведомо медленнее — их время идёт в статистику
+        censor_before = -math.inf
+
+        def launch() -> None:
+            nonlocal hedge_at
+            ep = endpoints.pop(0)
+            ep.started()
+            now = loop.time()
+            running[asyncio.create_task(attempt(ep, payload))] = (ep, now)
+            hedge_at = now + ep.hedge_delay(kind) if endpoints else None
+
+        launch()
+        try:
+            while True:
+                waits = [t for t in (hedge_at, until) if t is not None]
+                timeout = max(0.0, min(waits) - loop.time()) if waits else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                now = loop.time()
+                won = None
+                for task in done:
+                    ep, started = running.pop(task)
+                    if task.exception() is None:
+                        ep.succeeded(kind, now - started)
+                        if won is None:
+                            won, censor_before = (task.result(), ep), started
+                        elif discard is not None:
+                            await discard(task.result())
+                    elif isinstance(task.exception(), LLMBusyError):
+                        # очередь переполнена у нас, а не у модели
+                        ep.abandoned(kind, None)
+                        error = task.exception()
+                    else:
+                        ep.failed(task.exception())
+                        error = task.exception()
+                if won is not None:
+                    return won
+                if until is not None and now >= until:
+                    censor_before = math.inf
+                    LLM_DEADLINE_EXCEEDED.labels(kind).inc()
+                    raise LLMDeadlineError(f"no LLM answer in {deadline}s")
+                if not running:
+                    if not endpoints:
+                        raise error
+                    launch()
+                elif hedge_at is not None and now >= hedge_at:
+                    if self._sem.locked():
+                        # свободного слота нет — дублирование только удлинит очередь
+                        hedge_at = None
+                    else:
+                        LLM_HEDGES.labels(endpoints[0].name).inc()
+                        launch()
+        finally:
+            now = loop.time()
+            for task, (ep, started) in running.items():
+                task.cancel()
+                ep.abandoned(kind, now - started if started < censor_before else None)
+            for result in await asyncio.gather(*running, return_exceptions=True):
+                if discard is not None and not isinstance(result, BaseException):
+                    await discard(result)
+
+    async def _post(self, ep: Endpoint, payload: dict) -> dict:
+        await self._acquire()
+        started, status, error = time.perf_counter(), None, None
+        try:
+            r = await self._http.post(ep.url, headers=self._auth(), json={**payload, "model": ep.model})
+            status = r.status_code
+            r.raise_for_status()
+            return r.json()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._sem.release()
+            observe_llm("post", ep.name, started, status, error)
+
+    async def _open_stream(self, ep: Endpoint, payload: dict) -> tuple[str | None, AsyncIterator[str]]:
+        deltas = self._stream(ep, payload)
+        try:
+            return await deltas.__anext__(), deltas
+        except StopAsyncIteration:
+            return None, deltas
+
+    @staticmethod
+    async def _close_stream(opened: tuple[str | None, AsyncIterator[str]]) -> None:
+        await opened[1].aclose()
+
+    async def _stream(self, ep: Endpoint, payload: dict) -> AsyncIterator[str]:
+        await self._acquire()
+        started, status, error = time.perf_counter(), None, None
+        got_tokens = False
+        try:
+            async with self._http.stream(
+                "POST", ep.url, headers=self._auth(), json={**payload, "model": ep.model, "stream": True},
+            ) as r:
+                status = r.status_code
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    # OpenRouter шлёт и комментарии-keepalive (": OPENROUTER PROCESSING")
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = line[5:].strip()
+                    if chunk == "[DONE]":
+                        break
+                    delta = json.loads(chunk).get("choices", [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        got_tokens = True
+                        yield delta
+        except BaseException as e:
+            error = e
+            # до первого токена ошибку учитывает _race, после — только здесь
+            if got_tokens and isinstance(e, Exception):
+                ep.failed(e)
+            raise
+        finally:
+            self._sem.release()
+            observe_llm("stream", ep.name, started, status, error)
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+_client: LLMClient | None = None
+
+
+async def start_llm_client() -> LLMClient:
+    return get_llm_client()
+
+
+async def stop_llm_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_llm_client() -> LLMClient:
+    # вне main() (скрипты, миграции) создаём клиент лениво
+    global _client
+    if _client is None:
+        _client = LLMClient(settings.llm_max_concurrency, settings.llm_max_queue, settings.llm_timeout)
+        instrument_llm(_client)
+    return _client
+
+
+def _extract_content(data: dict) -> str | None:
+    return data.get("choices", [{}])[0].get("message", {}).get("content")
+
+
+# ответ кэшируется под эндпоинтом, который его дал, а ищется под тем, куда запрос ушёл бы первым:
+# ответ резервной модели (failover, хеджирование) не выдаётся за ответ основной
+
+async def _complete(payload: dict, use_cache: bool, deadline: float | None = None) -> str | None:
+    client = get_llm_client()
+    if use_cache and (cached := await llm_cache.get(cache_key(payload, client.preferred().name))) is not None:
+        return cached
+    data, ep = await client.post(payload, deadline)
+    content = _extract_content(data)
+    if use_cache and content:
+        await llm_cache.put(cache_key(payload, ep.name), content)
+    return content
+
+
+async def _stream(payload: dict, use_cache: bool, deadline: float | None = None) -> AsyncIterator[str]:
+    client = get_llm_client()
+    if use_cache and (cached := await llm_cache.get(cache_key(payload, client.preferred().name))) is not None:
+        yield cached
+        return
+    ep, deltas = await client.stream(payload, deadline)
+    parts = []
+    try:
+        async for delta in deltas:
+            parts.append(delta)
+            yield delta
+    finally:
+        await deltas.aclose()
+    # в кэш попадает только ответ, дочитанный до [DONE]
+    if use_cache and parts:
+        await llm_cache.put(cache_key(payload, ep.name), "".join(parts))
+
+
+def _analysis_payload(text: str) -> dict:
+    return {
         "model": settings.openrouter_model,
         "messages": [
             {"role": "system", "content": SAFETY_SYSTEM_PROMPT},
@@ -53,60 +336,99 @@ async def analyze_checkin(text: str, locale: str = "ru") -> str:
         "max_tokens": 400,
     }
 
+
+def _chat_payload(messages: list[dict]) -> dict:
+    return {
+        "model": settings.openrouter_model,
+        "messages": [{"role": "system", "content": CHAT_SYSTEM_PROMPT}] + messages,
+        "temperature": 0.6,
+        "max_tokens": 500,
+    }
+
+
+def _no_llm_analysis(locale: str) -> str:
+    return t("llm_fallback_analysis", locale)
+
+
+def _no_llm_chat(messages: list[dict], locale: str) -> str:
+    last_user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    return t("llm_fallback_chat", locale, text=last_user[:400] or t("llm_fallback_chat_empty", locale))
+
+
+async def analyze_checkin_stream(text: str, locale: str = "ru", strict: bool = False,
+                                 use_cache: bool = True) -> AsyncIterator[str]:
+    """
+    LLM analysis of a check-in prompt: yields text deltas as they arrive; the deadline
+    covers the wait for the first token. With `strict=True` HTTP/network/queue/deadline errors
+    propagate instead of a fallback text (for retries).
+    """
+    if not settings.openrouter_api_key:
+        yield _no_llm_analysis(locale)
+        return
+    deadline = settings.llm_analysis_deadline
+    if strict:
+        async for delta in _stream(_analysis_payload(text), use_cache, deadline):
+            yield delta
+        return
+    got_tokens = False
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(OPENROUTER_URL, headers=headers, json=payload)
-            r.raise_for_status()
-            data = r.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content")
-            return content or (
-                "Не удалось получить ответ от модели." if locale == "ru" else "Failed to get model response.")
+        async for delta in _stream(_analysis_payload(text), use_cache, deadline):
+            got_tokens = True
+            yield delta
     except HTTPStatusError as e:
         if e.response is not None and e.response.status_code in (402, 403, 429):
-            return (
-                "Краткий разбор (без LLM): сервис недоступен." if locale == "ru" else "Brief analysis (no LLM): service unavailable.")
+            yield t("llm_fallback_unavailable", locale)
+            return
         raise
+    except LLMUnavailableError:
+        yield t("llm_fallback_unavailable", locale)
+    except LLMDeadlineError:
+        yield t("llm_fallback_timeout", locale)
+    except LLMBusyError:
+        yield t("llm_fallback_busy", locale)
     except RequestError:
-        return (
-            "Краткий разбор (без LLM): сеть недоступна." if locale == "ru" else "Brief analysis (no LLM): network error.")
+        # обрыв посреди ответа — оставляем то, что уже показали
+        if not got_tokens:
+            yield t("llm_fallback_network", locale)
 
 
-async def chat(messages: list[dict], locale: str = "ru") -> str:
+async def chat_stream(messages: list[dict], locale: str = "ru", use_cache: bool = True) -> AsyncIterator[str]:
     """
-    messages: [{"role":"user"|"assistant"|"system","content": "..."}]
-    Always prepend CHAT_SYSTEM_PROMPT yourself if needed (this function does it as well).
+    Coach reply to `messages` ([{"role": "user"|"assistant", "content": ...}], CHAT_SYSTEM_PROMPT
+    is prepended here): yields text deltas as they arrive; the deadline covers the first token.
     """
     if not settings.openrouter_api_key:
-        # Фолбэк без внешних вызовов
-        last_user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
-        base = "Краткий ответ (без LLM): " if locale == "ru" else "Brief reply (no LLM): "
-        return base + (last_user[:400] or "Опишите свой день — настроение, стресс, энергия, сон, эмоции, планы.")
-
-    headers = {
-        "Authorization": f"Bearer {settings.openrouter_api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/Fyukon/mindCheckBot",
-        "X-Title": "MindCheckBot",
-    }
-    full_messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}] + messages
-    payload = {
-        "model": settings.openrouter_model,
-        "messages": full_messages,
-        "temperature": 0.6,
-        "max_tokens": 500,
-    }
-
+        yield _no_llm_chat(messages, locale)
+        return
+    got_tokens = False
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(OPENROUTER_URL, headers=headers, json=payload)
-            r.raise_for_status()
-            data = r.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content")
-            return content or ("Не удалось получить ответ от модели." if locale == "ru" else "Failed to get model response.")
-    except (HTTPStatusError, RequestError):
-        return ("Сервис недоступен. Попробуйте позже." if locale == "ru" else "Service unavailable. Try again later.")
+        async for delta in _stream(_chat_payload(messages), use_cache, settings.llm_chat_deadline):
+            got_tokens = True
+            yield delta
+    except (HTTPStatusError, RequestError, LLMBusyError, LLMUnavailableError, LLMDeadlineError):
+        if not got_tokens:
+            yield t("llm_unavailable", locale)
 
 
-def detect_crisis(text: str) -> bool:
-    lower = text.lower()
-    return any(k in lower for k in CRISIS_KEYWORDS)
+async def summarize(previous: str, turns: list[dict], locale: str = "ru", use_cache: bool = True) -> str:
+    """Fold `turns` into the running conversation summary `previous`."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+    if settings.openrouter_api_key:
+        payload = {
+            "model": settings.openrouter_model,
+            "messages": [
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Previous summary:\n{previous or '-'}\n\nNew turns:\n{transcript}"},
+            ],
+            "temperature": 0.2,
+            "max_tokens": 250,
+        }
+        try:
+            content = await _complete(payload, use_cache, settings.llm_chat_deadline)
+            if content:
+                return content
+        except (HTTPStatusError, RequestError, LLMBusyError, LLMUnavailableError, LLMDeadlineError):
+            pass
+    # Фолбэк: экстрактивная сводка из реплик пользователя
+    said = "; ".join(m["content"][:120] for m in turns if m.get("role") == "user")
+    return " ".join(filter(None, [previous, said]))[-1200:]
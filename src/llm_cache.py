@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+
+from .config import settings
+from .db import SessionLocal, dialect_insert
+from .metrics import CACHE_LOOKUPS, instrument_cache
+from .models import LlmCacheEntry
+
+log = logging.getLogger(__name__)
+
+
+def cache_key(payload: dict, endpoint: str) -> str:
+    """
+    sha256 over everything that determines the completion: the endpoint (model and URL, see
+    `Endpoint.name`) that answers it, messages (incl. system), sampling.
+    """
+    canonical = {k: v for k, v in payload.items() if k != "stream"}
+    canonical["model"] = endpoint
+    return hashlib.sha256(
+        json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+class LLMCache:
+    """
+    Content-addressed cache of LLM completions: an in-process LRU in front of an optional
+    `llm_cache` table (LLM_CACHE_DB=true) with TTL and a row cap.
+    """
+
+    def __init__(self, size: int, ttl: float, use_db: bool, db_max_rows: int):
+        self.size = size
+        self.ttl = timedelta(seconds=ttl)
+        self.use_db = use_db
+        self.db_max_rows = db_max_rows
+        self._lru: OrderedDict[str, tuple[datetime, str]] = OrderedDict()
+        self._puts = 0
+
+    async def get(self, key: str) -> str | None:
+        now = datetime.utcnow()
+        item = self._lru.get(key)
+        if item is not None and item[0] > now:
+            self._lru.move_to_end(key)
+            CACHE_LOOKUPS.labels("llm", "hit").inc()
+            return item[1]
+        if self.use_db:
+            async with SessionLocal() as session:
+                row = (await session.execute(
+                    select(LlmCacheEntry.response, LlmCacheEntry.expires_at)
+                    .where(LlmCacheEntry.key == key, LlmCacheEntry.expires_at > now)
+                )).first()
+            if row is not None:
+                self._remember(key, row.response, row.expires_at)
+                CACHE_LOOKUPS.labels("llm", "db_hit").inc()
+                return row.response
+        CACHE_LOOKUPS.labels("llm", "miss").inc()
+        return None
+
+    async def put(self, key: str, response: str) -> None:
+        expires_at = datetime.utcnow() + self.ttl
+        self._remember(key, response, expires_at)
+        if not self.use_db:
+            return
+        values = {"response": response, "expires_at": expires_at}
+        async with SessionLocal() as session:
+            stmt = dialect_insert(LlmCacheEntry).values(key=key, **values)
+            await session.execute(stmt.on_conflict_do_update(index_elements=[LlmCacheEntry.key], set_=values))
+            await session.commit()
+        self._puts += 1
+        if self._puts % 100 == 0:
+            await self.evict()
+
+    def _remember(self, key: str, response: str, expires_at: datetime) -> None:
+        self._lru[key] = (expires_at, response)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.size:
+            self._lru.popitem(last=False)
+
+    async def evict(self) -> None:
+        """Drop expired rows, then the soonest-expiring ones above LLM_CACHE_DB_MAX_ROWS."""
+        async with SessionLocal() as session:
+            await session.execute(delete(LlmCacheEntry).where(LlmCacheEntry.expires_at <= datetime.utcnow()))
+            total = (await session.execute(select(func.count()).select_from(LlmCacheEntry))).scalar_one()
+            if total > self.db_max_rows:
+                cutoff = (
+                    select(LlmCacheEntry.key)
+                    .order_by(LlmCacheEntry.expires_at)
+                    .limit(total - self.db_max_rows)
+                    .scalar_subquery()
+                )
+                await session.execute(delete(LlmCacheEntry).where(LlmCacheEntry.key.in_(cutoff)))
+            await session.commit()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+
+llm_cache = LLMCache(settings.llm_cache_size, settings.llm_cache_ttl, settings.llm_cache_db, settings.llm_cache_db_max_rows)
+instrument_cache("llm", llm_cache, ("hit", "db_hit", "miss"))
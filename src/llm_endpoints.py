@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+LATENCY_WINDOW = 100  # successful calls kept per endpoint and kind
+OUTCOME_WINDOW = 20  # calls the error rate is computed over
+MIN_SAMPLES = 20  # below this the hedge delay is LLM_HEDGE_INITIAL_DELAY
+
+
+class Endpoint:
+    """
+    One model at one OpenAI-compatible URL: recent latencies (full answer for `post`, first
+    token for `stream`), the error rate of the last calls, and a circuit breaker that opens after
+    LLM_BREAKER_FAILURES consecutive failures and lets one probe through after the cooldown.
+    """
+
+    def __init__(self, model: str, url: str = OPENROUTER_URL):
+        self.model = model
+        self.url = url
+        self.name = model if url == OPENROUTER_URL else f"{model}@{urlsplit(url).netloc}"
+        self.latencies: dict[str, deque[float]] = {
+            "post": deque(maxlen=LATENCY_WINDOW),
+            "stream": deque(maxlen=LATENCY_WINDOW),
+        }
+        self.outcomes: deque[bool] = deque(maxlen=OUTCOME_WINDOW)
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.failures < settings.llm_breaker_failures:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half_open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def degraded(self) -> bool:
+        return len(self.outcomes) >= 5 and self.error_rate() >= settings.llm_degraded_error_rate
+
+    def quantile(self, kind: str, q: float) -> float | None:
+        samples = self.latencies[kind]
+        if len(samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self, kind: str) -> float:
+        """Seconds to wait for this endpoint before sending the same request to the next one."""
+        p = self.quantile(kind, settings.llm_hedge_quantile)
+        return settings.llm_hedge_initial_delay if p is None else max(settings.llm_hedge_min_delay, p)
+
+    def started(self) -> None:
+        if self.state == "half_open":
+            self.probing = True
+
+    def succeeded(self, kind: str, latency: float) -> None:
+        self.latencies[kind].append(latency)
+        self.outcomes.append(True)
+        if self.failures >= settings.llm_breaker_failures:
+            log.info("llm: %s answered again, breaker closed", self.name)
+        self.failures = 0
+        self.probing = False
+
+    def failed(self, error: BaseException) -> None:
+        self.outcomes.append(False)
+        self.failures += 1
+        self.probing = False
+        if self.failures >= settings.llm_breaker_failures:
+            # неудачная проба после паузы снова открывает выключатель
+            self.open_until = time.monotonic() + settings.llm_breaker_cooldown
+            log.warning("llm: %s failed %d times in a row (%r), breaker open for %ss",
+                        self.name, self.failures, error, settings.llm_breaker_cooldown)
+
+    def abandoned(self, kind: str, elapsed: float | None) -> None:
+        """The call was cancelled: lost a hedge race or ran past the deadline (`elapsed` — a lower bound)."""
+        self.probing = False
+        if elapsed is not None:
+            self.latencies[kind].append(elapsed)
+
+
+def parse_endpoints(spec: str, default_model: str) -> list[Endpoint]:
+    """`"model,model@https://host/v1/chat/completions"` → endpoints in that order; empty → `default_model`."""
+    endpoints = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        model, _, url = item.partition("@")
+        endpoints.append(Endpoint(model, url or OPENROUTER_URL))
+    return endpoints or [Endpoint(default_model)]
+
+
+def route(endpoints: list[Endpoint]) -> list[Endpoint]:
+    """Endpoints a request may use, in the order to try them: healthy first, degraded last, open breakers skipped."""
+    # сортировка устойчивая: внутри группы сохраняется порядок из LLM_ENDPOINTS
+    return sorted((e for e in endpoints if e.available()), key=Endpoint.degraded)
@@ -0,0 +1,175 @@
+"""
+Deterministic check-in analysis without the LLM: a short personalised summary and 2–4
+recommendations from the scores, the emotions and the trend of the previous week.
+Texts live in the i18n catalog (`la_*` keys), the rules below only pick them.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from .i18n import t
+from .models import Checkin
+
+TREND_DAYS = 7
+TREND_MIN_CHECKINS = 3  # меньше — тренд не упоминаем
+TREND_DELTA = 1.5  # разница со средним, которую считаем заметной
+
+# категория -> слова (ru и en: эмоции пишут на любом языке независимо от локали);
+# "*" в конце — основа с любым окончанием, без него — только слово целиком ("mad" не ловит "made")
+EMOTION_WORDS: dict[str, tuple[str, ...]] = {
+    "anxiety": ("тревог*", "тревож*", "беспоко*", "страх*", "страш*", "паник*", "нервн*", "волну*", "волнен*",
+                "anxi*", "worr*", "fear", "fearful", "afraid", "scared", "panic*", "nervous"),
+    "sadness": ("грус*", "печал*", "тоск*", "одинок*", "уныл*", "уныни*", "sad", "sadness", "lonel*", "down",
+                "empty", "grief", "griev*", "unhappy"),
+    "anger": ("злост*", "злюсь", "злой", "злая", "зло", "гнев*", "раздраж*", "бешен*", "обид*", "anger", "angry",
+              "irritat*", "annoy*", "frustrat*", "mad", "furious"),
+    "fatigue": ("устал*", "выгор*", "вял*", "апати*", "tired", "exhaust*", "burnout", "burned", "drained", "apath*"),
+    "joy": ("радост*", "рад", "рада", "счаст*", "спокой*", "благодар*", "вдохнов*", "интерес*", "joy*", "happy",
+            "happiness", "calm*", "grateful", "inspir*", "content", "relax*"),
+}
+_EMOTION_PATTERNS = {
+    cat: re.compile(r"\b(?:%s)\b" % "|".join(
+        re.escape(w[:-1]) + r"\w*" if w.endswith("*") else re.escape(w) for w in words
+    ))
+    for cat, words in EMOTION_WORDS.items()
+}
+
+# (правило, ключ рекомендации) в порядке важности; берутся первые подошедшие, не больше 4
+RULES: tuple[tuple[str, str], ...] = (
+    ("low_streak", "la_rec_support"),
+    ("stress_high", "la_rec_breathing"),
+    ("anxiety", "la_rec_grounding"),
+    ("sleep_short", "la_rec_sleep_short"),
+    ("mood_low", "la_rec_small_joy"),
+    ("sadness", "la_rec_social"),
+    ("anger", "la_rec_anger"),
+    ("energy_low", "la_rec_walk"),
+    ("fatigue", "la_rec_rest"),
+    ("sleep_long", "la_rec_sleep_long"),
+    ("stress_rising", "la_rec_plan"),
+    ("mood_high", "la_rec_keep"),
+    ("joy", "la_rec_keep"),
+)
+# если подошло меньше двух правил
+DEFAULT_RECS = ("la_rec_reflect", "la_rec_plan")
+
+
+@dataclass(frozen=True, slots=True)
+class Trend:
+    """Averages of the check-ins of the `TREND_DAYS` days before the current one."""
+    checkins: int
+    mood: float | None
+    stress: float | None
+    energy: float | None
+    sleep: float | None
+
+
+async def load_trend(session, user_id: int, date: datetime) -> Trend:
+    """One aggregate over the user's `(user_id, date)` index: the week before `date`, `date` excluded."""
+    row = (await session.execute(
+        select(
+            func.count(),
+            func.avg(Checkin.mood_score),
+            func.avg(Checkin.stress_score),
+            func.avg(Checkin.energy_score),
+            func.avg(Checkin.sleep_hours),
+        ).where(
+            Checkin.user_id == user_id,
+            Checkin.date >= date - timedelta(days=TREND_DAYS),
+            Checkin.date < date,
+        )
+    )).one()
+    return Trend(row[0], *(None if v is None else float(v) for v in row[1:]))
+
+
+def emotion_categories(emotions: str | None) -> set[str]:
+    text = (emotions or "").lower()
+    return {cat for cat, pattern in _EMOTION_PATTERNS.items() if pattern.search(text)}
+
+
+def _level(score: int | None, low: int = 3, high: int = 7) -> str | None:
+    if score is None:
+        return None
+    return "low" if score <= low else "high" if score >= high else "mid"
+
+
+def _facts(values: dict, trend: Trend | None) -> set[str]:
+    mood, stress, energy = values.get("mood_score"), values.get("stress_score"), values.get("energy_score")
+    sleep = values.get("sleep_hours")
+    facts = emotion_categories(values.get("emotions"))
+    if _level(mood) == "low":
+        facts.add("mood_low")
+    elif _level(mood) == "high":
+        facts.add("mood_high")
+    if _level(stress) == "high":
+        facts.add("stress_high")
+    if _level(energy) == "low":
+        facts.add("energy_low")
+    if sleep is not None and sleep < 6:
+        facts.add("sleep_short")
+    elif sleep is not None and sleep > 9:
+        facts.add("sleep_long")
+    if trend is not None and trend.checkins >= TREND_MIN_CHECKINS:
+        if mood is not None and trend.mood is not None:
+            if mood - trend.mood >= TREND_DELTA:
+                facts.add("mood_rising")
+            elif trend.mood - mood >= TREND_DELTA:
+                facts.add("mood_falling")
+            if mood <= 4 and trend.mood <= 4:
+                facts.add("low_streak")
+        if stress is not None and trend.stress is not None and stress - trend.stress >= TREND_DELTA:
+            facts.add("stress_rising")
+    return facts
+
+
+def _summary(values: dict, trend: Trend | None, facts: set[str], locale: str) -> list[str]:
+    lines = []
+    for field, key in (("mood_score", "la_mood"), ("stress_score", "la_stress"), ("energy_score", "la_energy")):
+        level = _level(values.get(field))
+        if level is not None:
+            lines.append(t(f"{key}_{level}", locale, score=values[field]))
+    if "sleep_short" in facts:
+        lines.append(t("la_sleep_short", locale, hours=values["sleep_hours"]))
+    elif "sleep_long" in facts:
+        lines.append(t("la_sleep_long", locale, hours=values["sleep_hours"]))
+    if not lines:
+        lines.append(t("la_no_scores", locale))
+    if "mood_rising" in facts:
+        lines.append(t("la_mood_rising", locale, avg=f"{trend.mood:.1f}"))
+    elif "mood_falling" in facts:
+        lines.append(t("la_mood_falling", locale, avg=f"{trend.mood:.1f}"))
+    if "stress_rising" in facts:
+        lines.append(t("la_stress_rising", locale, avg=f"{trend.stress:.1f}"))
+    if values.get("emotions"):
+        lines.append(t("la_emotions", locale, emotions=values["emotions"].strip()[:200]))
+    return lines
+
+
+def analyze(values: dict, trend: Trend | None, locale: str = "ru") -> str:
+    """
+    Summary and 2–4 recommendations for the check-in `values` (as from `checkin_values`).
+    Pure function of its arguments: same input, same text.
+    """
+    facts = _facts(values, trend)
+    recs: list[str] = []
+    for fact, key in RULES:
+        if fact in facts and key not in recs:
+            recs.append(key)
+    for key in DEFAULT_RECS:
+        if len(recs) >= 2:
+            break
+        if key not in recs:
+            recs.append(key)
+    lines = " ".join(_summary(values, trend, facts, locale))
+    items = "\n".join(f"• {t(key, locale)}" for key in recs[:4])
+    return f"{lines}\n\n{t('la_recs_title', locale)}\n{items}"
+
+
+def quick_message(analysis: str, locale: str, pending: bool) -> str:
+    """Text of the check-in reply carrying the local analysis; `pending` — the LLM analysis will replace it."""
+    text = f"{t('checkin_saved', locale)}\n\n{analysis}"
+    return f"{text}\n\n{t('analysis_pending', locale)}" if pending else text
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+from datetime import datetime
+
+from aiogram import Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import startup
+from .config import settings
+from .models import FsmState
+
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+UPDATE_DURATION = Histogram(
+    "bot_update_duration_seconds", "Update processing time, middlewares included",
+    ["update_type", "handler"], buckets=SLOW_BUCKETS,
+)
+UPDATES = Counter("bot_updates_total", "Processed updates", ["update_type", "handler", "status"])
+UPDATE_QUERIES = Histogram(
+    "bot_update_db_queries", "SQL statements executed while processing one update",
+    ["handler"], buckets=(0, 1, 2, 3, 4, 5, 7, 10, 15, 25),
+)
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "SQL statement time", ["statement"], buckets=FAST_BUCKETS)
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time to get a connection from the pool", buckets=FAST_BUCKETS)
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out")
+LLM_DURATION = Histogram(
+    "llm_request_duration_seconds", "OpenRouter request time (streams: until the last chunk)",
+    ["kind", "endpoint", "status", "error"], buckets=SLOW_BUCKETS,
+)
+LLM_QUEUED = Gauge("llm_queued_requests", "Requests waiting for a free LLM slot")
+LLM_HEDGES = Counter("llm_hedged_requests_total", "Requests duplicated to a backup endpoint after the p95 delay", ["endpoint"])
+LLM_DEADLINE_EXCEEDED = Counter("llm_deadline_exceeded_total", "LLM calls that hit their overall deadline", ["kind"])
+LLM_BREAKER_OPEN = Gauge("llm_endpoint_breaker_open", "1 while the endpoint's circuit breaker is open", ["endpoint"])
+LLM_ERROR_RATE = Gauge("llm_endpoint_error_rate", "Error share of the endpoint's last 20 calls", ["endpoint"])
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Lookups in the in-process caches", ["cache", "result"])
+CACHE_ENTRIES = Gauge("cache_entries", "Entries held in an in-process cache", ["cache"])
+FSM_ACTIVE = Gauge("fsm_active_states", "Unexpired FSM states", ["state"])
+TELEGRAM_DURATION = Histogram(
+    "telegram_api_duration_seconds", "Bot API call time", ["method", "status"], buckets=FAST_BUCKETS,
+)
+DISPATCH_WAIT = Histogram(
+    "dispatch_queue_wait_seconds", "Time an update waited in its user's queue", buckets=FAST_BUCKETS + (5, 10, 30),
+)
+DISPATCH_PENDING = Gauge("dispatch_pending_updates", "Accepted updates not yet finished")
+DISPATCH_USERS = Gauge("dispatch_active_users", "Users with queued or running updates")
+DISPATCH_BUSY = Gauge("dispatch_busy_workers", "Dispatch workers running an update")
+TELEGRAM_SEND_WAIT = Histogram(
+    "telegram_send_wait_seconds", "Time a chat request waited for the per-chat and global rate limits",
+    ["priority"], buckets=FAST_BUCKETS + (5, 10, 30),
+)
+TELEGRAM_RETRY_AFTER = Counter("telegram_retry_after_total", "429 responses (flood limits) from the Bot API")
+SHARD_FORWARD = Histogram(
+    "shard_forward_seconds", "Front process: time to hand an update to its shard worker", ["shard"], buckets=FAST_BUCKETS,
+)
+STARTUP = Gauge("bot_startup_phase_seconds", "Seconds from process start to the end of a startup phase", ["phase"])
+
+# счётчики текущего апдейта: хендлер и число SQL-запросов
+_update_probe: ContextVar[dict | None] = ContextVar("metrics_probe", default=None)
+
+_STATEMENTS = {"select", "insert", "update", "delete", "with"}
+
+
+# --- aiogram ---
+
+async def update_metrics_mw(handler, event, data):
+    """Outermost update middleware: latency, outcome and SQL statement count per update."""
+    probe = {"handler": "unhandled", "queries": 0}
+    token = _update_probe.set(probe)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        return await handler(event, data)
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        _update_probe.reset(token)
+        update_type = getattr(event, "event_type", "unknown")
+        UPDATE_DURATION.labels(update_type, probe["handler"]).observe(time.perf_counter() - started)
+        UPDATES.labels(update_type, probe["handler"], status).inc()
+        UPDATE_QUERIES.labels(probe["handler"]).observe(probe["queries"])
+
+
+async def _handler_name_mw(handler, event, data):
+    probe = _update_probe.get()
+    if probe is not None:
+        probe["handler"] = data["handler"].callback.__name__
+    return await handler(event, data)
+
+
+def instrument_dispatcher(dp: Dispatcher) -> None:
+    """Register `update_metrics_mw` first and a handler-name probe on every event observer."""
+    dp.update.outer_middleware(update_metrics_mw)
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(_handler_name_mw)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware timing every Bot API call."""
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            TELEGRAM_DURATION.labels(type(method).__name__, status).observe(time.perf_counter() - started)
+
+
+def instrument_user_queues(queues) -> None:
+    DISPATCH_PENDING.set_function(lambda: queues.pending)
+    DISPATCH_USERS.set_function(lambda: queues.users)
+    DISPATCH_BUSY.set_function(lambda: queues.busy)
+
+
+# --- SQLAlchemy ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+    probe = _update_probe.get()
+    if probe is not None:
+        probe["queries"] += 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_started"].pop()
+    verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+    DB_QUERY_DURATION.labels(verb if verb in _STATEMENTS else "other").observe(time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute не вызывается при ошибке — снимаем отметку сами
+    stack = exception_context.connection.info.get("metrics_started") if exception_context.connection else None
+    if stack:
+        stack.pop()
+
+
+def _timed_pool_class(base: type) -> type:
+    class TimedPool(base):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    pool = sync_engine.pool
+    # у пула нет события "начали ждать соединение" — оборачиваем _do_get;
+    # pool.recreate() (engine.dispose) создаёт пул того же класса, так что обёртка сохраняется
+    pool.__class__ = _timed_pool_class(type(pool))
+    if hasattr(pool, "checkedout"):
+        DB_POOL_CHECKED_OUT.set_function(lambda: sync_engine.pool.checkedout())
+
+
+# --- OpenRouter ---
+
+def observe_llm(kind: str, endpoint: str, started: float, status: int | None, error: BaseException | None) -> None:
+    LLM_DURATION.labels(
+        kind,
+        endpoint,
+        str(status) if status is not None else "none",
+        type(error).__name__ if error is not None else "none",
+    ).observe(time.perf_counter() - started)
+
+
+def instrument_llm(client) -> None:
+    # вызывается при создании клиента — в быстром старте это первый запрос к LLM
+    LLM_QUEUED.set_function(lambda: client.queued)
+    for ep in client.endpoints:
+        LLM_BREAKER_OPEN.labels(ep.name).set_function(lambda ep=ep: ep.state == "open")
+        LLM_ERROR_RATE.labels(ep.name).set_function(ep.error_rate)
+
+
+def instrument_cache(name: str, cache, results: tuple[str, ...] = ("hit", "miss")) -> None:
+    # счётчики с нулями видны в /metrics до первого обращения
+    for result in results:
+        CACHE_LOOKUPS.labels(name, result)
+    CACHE_ENTRIES.labels(name).set_function(lambda: len(cache))
+
+
+# --- /metrics ---
+
+_fsm_refreshed = 0.0
+
+
+async def _refresh_fsm_gauge(engine: AsyncEngine) -> None:
+    # запрос к БД не на каждый скрейп
+    global _fsm_refreshed
+    if time.monotonic() - _fsm_refreshed < settings.metrics_fsm_interval:
+        return
+    _fsm_refreshed = time.monotonic()
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            select(FsmState.state, func.count())
+            .where(FsmState.expires_at > datetime.utcnow(), FsmState.state.is_not(None))
+            .group_by(FsmState.state)
+        )).all()
+    FSM_ACTIVE.clear()
+    for state, count in rows:
+        FSM_ACTIVE.labels(state).set(count)
+
+
+def metrics_handler(engine: AsyncEngine):
+    async def handle(request: web.Request) -> web.Response:
+        if settings.metrics_token and request.headers.get("Authorization") != f"Bearer {settings.metrics_token}":
+            raise web.HTTPUnauthorized()
+        await _refresh_fsm_gauge(engine)
+        for phase, seconds in startup.phases.items():
+            STARTUP.labels(phase).set(seconds)
+        return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    return handle
+
+
+def front_metrics_handler(router):
+    """Front process /metrics: its own registry, or `?shard=N` — that worker's, fetched over its socket."""
+    async def handle(request: web.Request) -> web.Response:
+        if settings.metrics_token and request.headers.get("Authorization") != f"Bearer {settings.metrics_token}":
+            raise web.HTTPUnauthorized()
+        shard = request.query.get("shard")
+        if shard is None:
+            return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+        if not shard.isdigit() or int(shard) >= settings.shards:
+            raise web.HTTPNotFound()
+        status, body, content_type = await router.metrics(int(shard), {"Authorization": request.headers.get("Authorization", "")})
+        return web.Response(status=status, body=body, headers={"Content-Type": content_type})
+
+    return handle
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from aiogram.types import Message
+from sqlalchemy import select
+
+from .crisis import detect_crisis
+from .db import LazySession
+from .i18n import t
+from .models import User
+from .user_cache import CachedUser, user_cache
+
+
+async def session_mw(handler, event, data):
+    """Inject a `LazySession` as `session`; it only opens a connection if a handler uses it."""
+    session = LazySession()
+    data["session"] = session
+    try:
+        return await handler(event, data)
+    finally:
+        await session.close()
+
+
+async def user_mw(handler, event, data):
+    """Resolve the sender's `User` once per update (cache first) and inject it as `user`."""
+    tg_user = data.get("event_from_user")
+    user = None
+    if tg_user is not None:
+        user = user_cache.get(tg_user.id)
+        if user is None:
+            result = await data["session"].execute(select(User).where(User.tg_user_id == tg_user.id))
+            row = result.scalar_one_or_none()
+            if row is not None:
+                user = user_cache.put(CachedUser.from_row(row))
+    data["user"] = user
+    return await handler(event, data)
+
+
+async def crisis_mw(handler, event: Message, data):
+    """Screen every inbound message text; on a match send support resources, then continue as usual."""
+    text = event.text or event.caption
+    if text and detect_crisis(text):
+        user = data.get("user")
+        locale = (user.language_code if user else None) or 'ru'
+        await event.answer(t('crisis_detected', locale))
+        await event.answer(t('crisis_hotline', locale))
+    return await handler(event, data)
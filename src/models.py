@@ -1,5 +1,5 @@
 from __future__ import annotations
-from sqlalchemy import BigInteger, String, Integer, DateTime, Text, Boolean, ForeignKey, UniqueConstraint
+from sqlalchemy import BigInteger, String, Integer, DateTime, Text, Boolean, ForeignKey, UniqueConstraint, JSON, PrimaryKeyConstraint, Index, LargeBinary, desc
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
 from .db import Base
@@ -23,13 +23,15 @@ class User(Base):
 class Checkin(Base):
     __tablename__ = 'checkins'
     __table_args__ = (
-        UniqueConstraint('user_id', 'date', name='uq_checkin_user_date'),
+        # уникальность и путь доступа "последние чек-ины пользователя" одним индексом;
+        # в Postgres таблица секционирована по месяцам (миграция 0007), PK там (id, date)
+        Index('uq_checkin_user_date', 'user_id', desc('date'), unique=True),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
 
-    date: Mapped[datetime] = mapped_column(DateTime, index=True)  # normalized to local date start
+    date: Mapped[datetime] = mapped_column(DateTime)  # normalized to local date start
     mood_score: Mapped[int | None] = mapped_column(Integer, nullable=True)  # 1-10
     stress_score: Mapped[int | None] = mapped_column(Integer, nullable=True)
     energy_score: Mapped[int | None] = mapped_column(Integer, nullable=True)
@@ -50,4 +52,84 @@ class Reminder(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), index=True)
     enabled: Mapped[bool] = mapped_column(Boolean, default=True)
     times: Mapped[str] = mapped_column(String(64), default='18:00')  # e.g., '09:00,18:00'
+    next_fire_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)  # naive UTC
+
+
+class FsmState(Base):
+    __tablename__ = 'fsm_states'
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # fsm:<bot>:<chat>:<user>:<destiny>
+    state: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, default=dict)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)  # naive UTC
+
+
+class AnalysisJob(Base):
+    __tablename__ = 'analysis_jobs'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'date', name='uq_analysis_job_user_date'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
+    date: Mapped[datetime] = mapped_column(DateTime)  # дата чек-ина, как в checkins.date
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    locale: Mapped[str] = mapped_column(String(8), default='ru')
+    prompt: Mapped[str] = mapped_column(Text)
+    message_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)  # быстрый локальный разбор, который заменит ответ LLM
+
+    status: Mapped[str] = mapped_column(String(16), default='pending')  # pending | running | failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    run_after: Mapped[datetime] = mapped_column(DateTime, index=True)  # naive UTC; для running — конец аренды
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class LlmCacheEntry(Base):
+    __tablename__ = 'llm_cache'
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256 запроса
+    response: Mapped[str] = mapped_column(Text)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)  # naive UTC
+
+
+class CheckinRollup(Base):
+    """Per-user daily/weekly aggregates of `checkins`, kept up to date by `stats.refresh_rollups`."""
+    __tablename__ = 'checkin_rollups'
+    __table_args__ = (
+        PrimaryKeyConstraint('user_id', 'period', 'period_start', name='pk_checkin_rollups'),
+    )
+
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
+    period: Mapped[str] = mapped_column(String(8))  # day | week
+    period_start: Mapped[datetime] = mapped_column(DateTime)  # local day / Monday of the week
+    checkins: Mapped[int] = mapped_column(Integer, default=0)
+
+    mood_sum: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    mood_n: Mapped[int] = mapped_column(Integer, default=0)
+    mood_min: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    mood_max: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    stress_sum: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    stress_n: Mapped[int] = mapped_column(Integer, default=0)
+    stress_min: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    stress_max: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    energy_sum: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    energy_n: Mapped[int] = mapped_column(Integer, default=0)
+    energy_min: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    energy_max: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    sleep_sum: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    sleep_n: Mapped[int] = mapped_column(Integer, default=0)
+    sleep_min: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    sleep_max: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+
+class CheckinArchive(Base):
+    """One gzip-compressed JSON array of a user's check-ins per archived month (see `archive.py`)."""
+    __tablename__ = 'checkins_archive'
+    __table_args__ = (
+        PrimaryKeyConstraint('user_id', 'month', name='pk_checkins_archive'),
+    )
 
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
+    month: Mapped[datetime] = mapped_column(DateTime)  # first day of the month
+    checkins: Mapped[int] = mapped_column(Integer)
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
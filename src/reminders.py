@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramAPIError
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import and_, case, or_, select, update
+
+from . import shards
+from .config import settings
+from .db import SessionLocal
+from .i18n import t
+from .models import Reminder, User
+from .send_queue import BULK, send_priority
+from .utils import parse_time_hhmm
+
+log = logging.getLogger(__name__)
+
+
+def resolve_tz(tz_name: str | None):
+    try:
+        return pytz.timezone(tz_name or settings.default_timezone)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(settings.default_timezone)
+
+
+def _localize(tz, naive: datetime) -> datetime:
+    # DST: несуществующее время (перевод вперёд) сдвигаем на час позже,
+    # неоднозначное (перевод назад) — берём первое вхождение
+    try:
+        return tz.localize(naive, is_dst=None)
+    except pytz.NonExistentTimeError:
+        return tz.localize(naive + timedelta(hours=1), is_dst=True)
+    except pytz.AmbiguousTimeError:
+        return tz.localize(naive, is_dst=True)
+
+
+def next_fire_utc(times: str, tz_name: str | None, after: datetime | None = None) -> datetime | None:
+    """
+    Next moment strictly after `after` (naive UTC) when one of `times` ('09:00,18:00')
+    happens in `tz_name`. Returns naive UTC, as stored in the DB, or None if no valid time.
+    """
+    parsed = [hm for hm in (parse_time_hhmm(x) for x in (times or "").split(",")) if hm]
+    if not parsed:
+        return None
+    after = after or datetime.utcnow()
+    tz = resolve_tz(tz_name)
+    local_day = pytz.UTC.localize(after).astimezone(tz).date()
+    for day_offset in range(3):
+        day = local_day + timedelta(days=day_offset)
+        candidates = []
+        for h, m in parsed:
+            local = _localize(tz, datetime(day.year, day.month, day.day, h, m))
+            fire = local.astimezone(pytz.UTC).replace(tzinfo=None)
+            if fire > after:
+                candidates.append(fire)
+        if candidates:
+            return min(candidates)
+    return None
+
+
+class ReminderEngine:
+    """
+    Reminder dispatcher.
+
+    Every `scan_interval` seconds one indexed query over `reminders.next_fire_at` loads the
+    reminders due within the look-ahead window, with their times and timezone, into an
+    in-memory min-heap. A dispatch task sleeps until the heap top is due, claims everything
+    due in one statement (conditional UPDATE to the next fire times, so stale heap entries
+    and other replicas are skipped) and sends the claimed ones through a paced sender, so a
+    crowd at the same "18:00" is spread over a bounded window.
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.scan_interval = settings.reminder_scan_interval
+        self.batch_size = settings.reminder_batch_size
+        self.send_rate = settings.reminder_send_rate / shards.SHARDS
+        self.grace = timedelta(seconds=settings.reminder_grace)
+        # (next_fire_at, id, tg_user_id, язык, times, timezone)
+        self._heap: list[tuple[datetime, int, int, str, str, str | None]] = []
+        self._queued: set[tuple[int, datetime]] = set()
+        self._wakeup = asyncio.Event()
+        self._scheduler = AsyncIOScheduler(timezone=pytz.UTC)
+        self._dispatch_task: asyncio.Task | None = None
+        self._sending: set[asyncio.Task] = set()
+        self._next_slot = 0.0
+
+    async def start(self) -> None:
+        await self.backfill()
+        await self.scan()
+        self._scheduler.add_job(
+            self.scan, "interval", seconds=self.scan_interval, max_instances=1, coalesce=True,
+        )
+        self._scheduler.start()
+        self._dispatch_task = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self) -> None:
+        self._scheduler.shutdown(wait=False)
+        if self._dispatch_task:
+            self._dispatch_task.cancel()
+            try:
+                await self._dispatch_task
+            except asyncio.CancelledError:
+                pass
+
+    async def backfill(self) -> None:
+        # включённые напоминания без next_fire_at (созданы до миграции 0002)
+        last_id = 0
+        async with SessionLocal() as session:
+            while True:
+                rows = (await session.execute(
+                    select(Reminder.id, Reminder.times, User.timezone)
+                    .join(User, User.id == Reminder.user_id)
+                    .where(Reminder.enabled.is_(True), Reminder.next_fire_at.is_(None), Reminder.id > last_id)
+                    .where(shards.owned(User.tg_user_id))
+                    .order_by(Reminder.id)
+                    .limit(self.batch_size)
+                )).all()
+                if not rows:
+                    return
+                now = datetime.utcnow()
+                await session.execute(
+                    update(Reminder),
+                    [{"id": rid, "next_fire_at": next_fire_utc(times, tz, now)} for rid, times, tz in rows],
+                )
+                await session.commit()
+                last_id = rows[-1][0]
+
+    async def scan(self) -> None:
+        horizon = datetime.utcnow() + timedelta(seconds=self.scan_interval * 2)
+        last_fire, last_id = datetime.min, 0
+        added = 0
+        async with SessionLocal() as session:
+            while True:
+                rows = (await session.execute(
+                    select(
+                        Reminder.id, Reminder.next_fire_at, User.tg_user_id, User.language_code,
+                        Reminder.times, User.timezone,
+                    )
+                    .join(User, User.id == Reminder.user_id)
+                    .where(
+                        Reminder.enabled.is_(True),
+                        Reminder.next_fire_at <= horizon,
+                        (Reminder.next_fire_at > last_fire)
+                        | ((Reminder.next_fire_at == last_fire) & (Reminder.id > last_id)),
+                        shards.owned(User.tg_user_id),
+                    )
+                    .order_by(Reminder.next_fire_at, Reminder.id)
+                    .limit(self.batch_size)
+                )).all()
+                for rid, fire_at, tg_user_id, lang, times, tz in rows:
+                    if (rid, fire_at) in self._queued:
+                        continue
+                    self._queued.add((rid, fire_at))
+                    heapq.heappush(self._heap, (fire_at, rid, tg_user_id, lang or "ru", times, tz))
+                    added += 1
+                if len(rows) < self.batch_size:
+                    break
+                last_fire, last_id = rows[-1][1], rows[-1][0]
+        if added:
+            log.info("reminders: queued %d (heap=%d)", added, len(self._heap))
+            self._wakeup.set()
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            now = datetime.utcnow()
+            due = {}
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                entry = heapq.heappop(self._heap)
+                self._queued.discard((entry[1], entry[0]))
+                # два времени одного напоминания в куче: актуально более позднее
+                due[entry[1]] = entry
+            try:
+                claimed = await self._claim(list(due.values()), now)
+            except Exception:
+                log.exception("reminders: claim failed for %d reminders", len(due))
+                continue
+            for rid in claimed:
+                fire_at, _, tg_user_id, lang, _, _ = due[rid]
+                # бот был выключен дольше grace — не шлём устаревшее напоминание
+                if now - fire_at > self.grace:
+                    continue
+                await self._pace()
+                task = asyncio.create_task(self._send(rid, tg_user_id, lang))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+
+    async def _claim(self, entries: list[tuple], now: datetime) -> list[int]:
+        """
+        Move every due reminder to its next fire time in one UPDATE ... RETURNING;
+        returns the ids whose `next_fire_at` still matched (not changed or claimed elsewhere).
+        """
+        if not entries:
+            return []
+        # все записи уже наступили, так что следующее время зависит только от расписания
+        nxt = {rid: next_fire_utc(times, tz, now) for _, rid, _, _, times, tz in entries}
+        async with SessionLocal() as session:
+            res = await session.execute(
+                update(Reminder)
+                .where(
+                    Reminder.enabled.is_(True),
+                    or_(*(and_(Reminder.id == rid, Reminder.next_fire_at == fire_at) for fire_at, rid, *_ in entries)),
+                )
+                .values(next_fire_at=case(nxt, value=Reminder.id))
+                .returning(Reminder.id)
+                .execution_options(synchronize_session=False)
+            )
+            claimed = res.scalars().all()
+            await session.commit()
+        return claimed
+
+    async def _pace(self) -> None:
+        now = time.monotonic()
+        self._next_slot = max(self._next_slot, now)
+        wait = self._next_slot - now
+        self._next_slot += 1.0 / self.send_rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _send(self, rid: int, tg_user_id: int, lang: str) -> None:
+        # retry_after и лимиты чата/бота соблюдает SendQueue; интерактивные ответы идут раньше
+        send_priority.set(BULK)
+        try:
+            await self.bot.send_message(tg_user_id, t("reminder_text", lang))
+        except TelegramForbiddenError:
+            # пользователь заблокировал бота
+            async with SessionLocal() as session:
+                await session.execute(update(Reminder).where(Reminder.id == rid).values(enabled=False))
+                await session.commit()
+        except TelegramAPIError:
+            log.exception("reminders: send failed for reminder %s", rid)
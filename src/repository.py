@@ -0,0 +1,117 @@
+"""
+Check-in and user writes with a fixed, small number of statements.
+
+Round-trip budgets — SQL statements per update, as counted by `bot_update_db_queries` and
+checked by `tests/test_round_trips.py` and `bench/dispatcher_bench.py` (it exits non-zero when a
+handler goes over). FSM reads and writes are included, the user is assumed to be in
+`user_cache` (a miss adds one SELECT).
+On Postgres every transaction adds BEGIN and COMMIT on top, and `pool_pre_ping` one ping per
+connection checkout; the analysis worker spends 2 statements per claim and 3 per result
+(lease check, DELETE, UPDATE).
+"""
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import delete, update
+
+from .db import dialect_insert
+from .models import AnalysisJob, Checkin, User
+
+ROUND_TRIP_BUDGETS: dict[str, int] = {
+    # первый контакт: поиск и создание пользователя, FSM
+    "cmd_start": 4,
+    "consent_handler": 3,
+    "cb_consent": 3,
+    "cmd_help": 1,
+    "cmd_lang": 2,
+    "cmd_settings": 1,
+    "cmd_reminders": 2,
+    # напоминание: SELECT + INSERT/UPDATE, часовой пояс пользователя, FSM
+    "reminders_text": 5,
+    "cmd_checkin": 2,
+    "cb_scale": 2,
+    # пропуск заметок завершает чек-ин — тогда как notes_handler
+    "cb_skip": 6,
+    "mood_handler": 2,
+    "stress_handler": 2,
+    "energy_handler": 2,
+    "emotions_handler": 2,
+    "sleep_handler": 2,
+    # тренд для локального разбора, upsert чек-ина, строки дня и недели, задача анализа, FSM
+    "notes_handler": 6,
+    "cmd_stats": 2,
+    "cmd_chart": 3,
+    "cmd_export": 3,
+    # удаление пользователя каскадом и его строки FSM
+    "cmd_delete_me": 3,
+    "cmd_coach": 3,
+    "cb_coach_prompt": 2,
+    "cb_coach_end": 2,
+    "chat_message_handler": 2,
+}
+
+
+def _to_int(v) -> int | None:
+    try:
+        return int(v)
+    except Exception:
+        return None
+
+
+def _sleep_hours(raw) -> int | None:
+    # может прийти как "7", "7.5", "7 ч"
+    try:
+        tokens = [x for x in (raw or "").replace(",", ".").split() if x.replace('.', '', 1).isdigit()]
+        return int(float(tokens[0])) if tokens else None
+    except Exception:
+        return None
+
+
+def checkin_values(data: dict) -> dict:
+    """Column values of a check-in from the FSM answers (unparseable or skipped answers → NULL)."""
+    return {
+        "mood_score": _to_int(data.get('mood')),
+        "stress_score": _to_int(data.get('stress')),
+        "energy_score": _to_int(data.get('energy')),
+        "emotions": data.get('emotions') or None,
+        "sleep_hours": _sleep_hours(data.get('sleep')),
+        "notes": data.get('notes') or None,
+    }
+
+
+async def upsert_checkin(session, user_id: int, date: datetime, values: dict) -> int:
+    """
+    Create or overwrite the check-in `(user_id, date)` with one INSERT ... ON CONFLICT DO UPDATE
+    ... RETURNING statement, in the caller's transaction. Returns the check-in id.
+    A repeated check-in keeps the previous analysis until the new one is written.
+    """
+    stmt = dialect_insert(Checkin).values(user_id=user_id, date=date, **values)
+    # конфликт разрешается уникальным индексом uq_checkin_user_date (порядок DESC не мешает выводу)
+    stmt = stmt.on_conflict_do_update(index_elements=["user_id", "date"], set_=values).returning(Checkin.id)
+    return (await session.execute(stmt)).scalar_one()
+
+
+async def save_analysis(session, job: AnalysisJob, analysis: str) -> bool:
+    """
+    Drop the job and store the analysis on its check-in, unless the job was re-queued
+    meanwhile (the check-in was redone, or the lease expired and another worker took it).
+    Returns False in that case: the analysis is of an outdated check-in and is not written.
+    """
+    # аренда сверяется до записи: иначе старый разбор лёг бы поверх нового чек-ина
+    res = await session.execute(
+        delete(AnalysisJob).where(AnalysisJob.id == job.id, AnalysisJob.run_after == job.run_after)
+    )
+    if res.rowcount == 0:
+        return False
+    await session.execute(
+        update(Checkin)
+        .where(Checkin.user_id == job.user_id, Checkin.date == job.date)
+        .values(analysis_summary=analysis, recommendations=analysis)
+    )
+    return True
+
+
+async def delete_user(session, user_id: int) -> None:
+    """Delete the user; check-ins, rollups, archive, reminders and jobs go with it via ON DELETE CASCADE."""
+    await session.execute(delete(User).where(User.id == user_id))
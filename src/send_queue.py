@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from . import shards
+from .config import settings
+from .metrics import TELEGRAM_RETRY_AFTER, TELEGRAM_SEND_WAIT
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# приоритет исходящих запросов текущей задачи; фоновые рассылки (напоминания, разборы) ставят BULK
+send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+
+class _Bucket:
+    """Token bucket: `rate` tokens per second, at most `burst` stored; can be paused by retry_after."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self) -> float:
+        """Seconds until a token can be taken (0 — now)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def idle(self) -> bool:
+        return self.delay() == 0.0 and self.tokens >= self.burst
+
+
+class _Chat:
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = _Bucket(rate, burst)
+        # очередь чата строго FIFO: порядок сообщений в чате важнее приоритета
+        self.lock = asyncio.Lock()
+
+
+class _Edit:
+    __slots__ = ("method", "future", "followers")
+
+    def __init__(self, method: EditMessageText):
+        self.method = method
+        self.future = asyncio.get_running_loop().create_future()
+        self.followers = 0
+
+
+class SendQueue(BaseRequestMiddleware):
+    """
+    Bot session middleware pacing every request addressed to a chat.
+
+    A request first waits its turn in the chat's FIFO bucket (SEND_CHAT_RATE/s, bursts of
+    SEND_CHAT_BURST), then for a token of the global bucket (SEND_GLOBAL_RATE/s), where
+    interactive replies go before BULK ones (`send_priority`). A 429 pauses the chat (or
+    everything, for requests without a chat) for `retry_after` and the request is retried up
+    to SEND_MAX_RETRIES times. An `edit_text` of a message that already has an edit waiting
+    replaces that edit's text instead of queueing a second one; both callers get one result.
+    Requests without a chat (answerCallbackQuery, getMe, setWebhook) pass straight through.
+    """
+
+    def __init__(self):
+        self.chat_rate = settings.send_chat_rate
+        self.chat_burst = settings.send_chat_burst
+        self.max_retries = settings.send_max_retries
+        # лимит Bot API общий на бота — в режиме шардов делится между процессами
+        global_rate = settings.send_global_rate / shards.SHARDS
+        self._global = _Bucket(global_rate, global_rate)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: asyncio.Task | None = None
+        self._chats: dict[int | str, _Chat] = {}
+        self._edits: dict[tuple, _Edit] = {}
+        self._swept = time.monotonic()
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await self._request(make_request, bot, method, None)
+        if not isinstance(method, EditMessageText) or method.message_id is None:
+            return await self._send(make_request, bot, method, chat_id)
+        key = (chat_id, method.message_id)
+        pending = self._edits.get(key)
+        if pending is not None:
+            pending.method = method
+            pending.followers += 1
+            return await asyncio.shield(pending.future)
+        pending = self._edits[key] = _Edit(method)
+        try:
+            result = await self._send(make_request, bot, method, chat_id, pending, key)
+        except asyncio.CancelledError:
+            if pending.followers:
+                pending.future.cancel()
+            raise
+        except Exception as e:
+            if pending.followers:
+                pending.future.set_exception(e)
+            raise
+        finally:
+            if self._edits.get(key) is pending:
+                del self._edits[key]
+        if pending.followers:
+            pending.future.set_result(result)
+        return result
+
+    async def _send(self, make_request, bot, method, chat_id, pending: _Edit | None = None, key=None):
+        priority = send_priority.get()
+        started = time.perf_counter()
+        for attempt in itertools.count():
+            await self._acquire(chat_id, priority)
+            if attempt == 0:
+                TELEGRAM_SEND_WAIT.labels(_PRIORITY_NAMES[priority]).observe(time.perf_counter() - started)
+            if pending is not None and self._edits.get(key) is pending:
+                # дальше правки этого сообщения встают в очередь заново
+                del self._edits[key]
+                method = pending.method
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                self._pause(chat_id, e.retry_after)
+
+    async def _request(self, make_request, bot, method, chat_id):
+        for attempt in itertools.count():
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                self._pause(chat_id, e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+    def _pause(self, chat_id, retry_after: float) -> None:
+        TELEGRAM_RETRY_AFTER.inc()
+        log.warning("send: flood limit for chat %s, retry after %ss", chat_id, retry_after)
+        until = time.monotonic() + retry_after
+        bucket = self._global if chat_id is None else self._chat(chat_id).bucket
+        bucket.paused_until = max(bucket.paused_until, until)
+
+    def _chat(self, chat_id) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            self._sweep()
+            chat = self._chats[chat_id] = _Chat(self.chat_rate, self.chat_burst)
+        return chat
+
+    def _sweep(self) -> None:
+        # корзина, снова полная и без ожидающих, ничем не отличается от новой — удаляем
+        now = time.monotonic()
+        if now - self._swept < 60:
+            return
+        self._swept = now
+        for chat_id in [c for c, chat in self._chats.items() if not chat.lock.locked() and chat.bucket.idle()]:
+            del self._chats[chat_id]
+
+    async def _acquire(self, chat_id, priority: int) -> None:
+        chat = self._chat(chat_id)
+        async with chat.lock:
+            while (delay := chat.bucket.delay()) > 0:
+                await asyncio.sleep(delay)
+            chat.bucket.tokens -= 1
+            await self._acquire_global(priority)
+
+    async def _acquire_global(self, priority: int) -> None:
+        if not self._waiters and self._global.delay() == 0:
+            self._global.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        await future
+
+    async def _run_pump(self) -> None:
+        # один раздатчик глобальных токенов: интерактивные раньше BULK, внутри приоритета — FIFO
+        while self._waiters:
+            delay = self._global.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._global.tokens -= 1
+                future.set_result(None)
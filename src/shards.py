@@ -0,0 +1,231 @@
+"""
+Multi-process mode (SHARDS > 1).
+
+The front process (`python -m src.bot` without SHARD_INDEX) receives updates — the webhook or
+the getUpdates loop — and hands each raw update to the worker process owning its user
+(`tg_user_id % SHARDS`, chat id for updates without a user) over the worker's unix socket.
+Workers are the same bot started with SHARD_INDEX=i: dispatcher, FSM and user caches are
+local to the process, background jobs only pick rows of their own users, and the work that
+exists once per deployment (partition maintenance, FSM eviction) runs on shard 0.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+from sqlalchemy import true
+
+from .config import settings
+from .metrics import SHARD_FORWARD
+
+log = logging.getLogger(__name__)
+
+SHARDS = max(1, settings.shards)
+# номер шарда этого процесса; None — фронт-процесс или однопроцессный режим
+SHARD = settings.shard_index
+
+
+def enabled() -> bool:
+    return SHARDS > 1
+
+
+def is_front() -> bool:
+    return SHARDS > 1 and SHARD is None
+
+
+def is_primary() -> bool:
+    """Whether this process runs the once-per-deployment jobs."""
+    return SHARD in (None, 0)
+
+
+def owned(tg_id_column):
+    """SQL condition: the row belongs to a user of this shard (always true without sharding)."""
+    return tg_id_column % SHARDS == SHARD if SHARD is not None and SHARDS > 1 else true()
+
+
+def shard_of(update: dict) -> int:
+    """Shard of a raw update: by the user who caused it, else by its chat, else 0."""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user") or {}
+        if "id" in user:
+            return user["id"] % SHARDS
+        chat = event.get("chat") or (event.get("message") or {}).get("chat") or {}
+        if "id" in chat:
+            return chat["id"] % SHARDS
+    return 0
+
+
+def socket_path(shard: int) -> str:
+    base = settings.shard_socket_dir or os.path.join(
+        tempfile.gettempdir(), f"mindcheck-{settings.bot_token.split(':')[0]}"
+    )
+    return os.path.join(base, f"shard-{shard}.sock")
+
+
+class ShardWorkers:
+    """Front side: starts one `python -m src.bot` per shard and restarts the ones that exit."""
+
+    def __init__(self):
+        self._procs: dict[int, asyncio.subprocess.Process] = {}
+        self._watchers: list[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self) -> None:
+        os.makedirs(os.path.dirname(socket_path(0)), exist_ok=True)
+        for shard in range(SHARDS):
+            self._procs[shard] = await self._spawn(shard)
+        self._watchers = [asyncio.create_task(self._watch(shard)) for shard in range(SHARDS)]
+
+    async def _spawn(self, shard: int) -> asyncio.subprocess.Process:
+        try:
+            os.unlink(socket_path(shard))
+        except FileNotFoundError:
+            pass
+        return await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "src.bot", env={**os.environ, "SHARD_INDEX": str(shard)},
+        )
+
+    async def _watch(self, shard: int) -> None:
+        backoff = 1.0
+        while True:
+            started = time.monotonic()
+            code = await self._procs[shard].wait()
+            if self._stopping:
+                return
+            # апдейты шарда ждут в forward, пока процесс не поднимется снова
+            backoff = 1.0 if time.monotonic() - started > 60 else min(backoff * 2, 30)
+            log.error("shards: worker %d exited with %s, restarting in %.0fs", shard, code, backoff)
+            await asyncio.sleep(backoff)
+            self._procs[shard] = await self._spawn(shard)
+
+    def alive(self, shard: int) -> bool:
+        proc = self._procs.get(shard)
+        return proc is not None and proc.returncode is None
+
+    async def stop(self, timeout: float = 15) -> None:
+        self._stopping = True
+        for task in self._watchers:
+            task.cancel()
+        await asyncio.gather(*self._watchers, return_exceptions=True)
+        procs = [p for p in self._procs.values() if p.returncode is None]
+        for proc in procs:
+            # SIGTERM: воркер дорабатывает принятые апдейты (UserQueues.stop) и выходит
+            proc.terminate()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in procs)), timeout)
+        except asyncio.TimeoutError:
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.kill()
+
+
+class ShardRouter:
+    """Front side: HTTP over each worker's unix socket — updates, health and metrics."""
+
+    def __init__(self):
+        self._sessions: dict[int, aiohttp.ClientSession] = {}
+
+    def _session(self, shard: int) -> aiohttp.ClientSession:
+        session = self._sessions.get(shard)
+        if session is None:
+            session = self._sessions[shard] = aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=socket_path(shard)),
+            )
+        return session
+
+    async def forward(self, update: dict, body: bytes | None = None) -> None:
+        """
+        Hand a raw update to its shard; returns once the worker has queued it (the worker
+        answers late when its queues are full, which pushes back on Telegram). Waits up to
+        SHARD_FORWARD_TIMEOUT for a worker that is (re)starting.
+        """
+        shard = shard_of(update)
+        body = body if body is not None else json.dumps(update).encode()
+        started = time.perf_counter()
+        deadline = time.monotonic() + settings.shard_forward_timeout
+        while True:
+            try:
+                async with self._session(shard).post(
+                    "http://shard/update", data=body, headers={"Content-Type": "application/json"},
+                ) as r:
+                    r.raise_for_status()
+                break
+            except aiohttp.ClientConnectorError:
+                # сокета ещё нет или процесс перезапускается: апдейт туда не попал, повтор безопасен
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+        SHARD_FORWARD.labels(str(shard)).observe(time.perf_counter() - started)
+
+    async def forward_batch(self, updates: list[dict]) -> None:
+        """Forward a getUpdates batch: shards in parallel, updates of one shard in order."""
+        by_shard: dict[int, list[dict]] = {}
+        for update in updates:
+            by_shard.setdefault(shard_of(update), []).append(update)
+
+        async def run(batch: list[dict]) -> None:
+            for update in batch:
+                # polling не может вернуть апдейт Telegram — ждём, пока шард снова станет доступен
+                while True:
+                    try:
+                        await self.forward(update)
+                        break
+                    except aiohttp.ClientResponseError as e:
+                        # шард ответил ошибкой на сам апдейт: повтор его не исправит
+                        log.error("shards: update %s rejected by its shard: %s", update.get("update_id"), e.status)
+                        break
+                    except Exception as e:
+                        log.warning("shards: update %s not forwarded: %r", update.get("update_id"), e)
+                        await asyncio.sleep(1)
+
+        await asyncio.gather(*(run(batch) for batch in by_shard.values()))
+
+    async def health(self, shard: int) -> dict | None:
+        try:
+            async with self._session(shard).get(
+                "http://shard/healthz", timeout=aiohttp.ClientTimeout(total=2),
+            ) as r:
+                return await r.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def metrics(self, shard: int, headers: dict) -> tuple[int, bytes, str]:
+        async with self._session(shard).get("http://shard/metrics", headers=headers) as r:
+            return r.status, await r.read(), r.headers.get("Content-Type", "text/plain")
+
+    async def poll(self, get_updates_url: str, allowed_updates: list[str]) -> None:
+        """getUpdates loop of the front process; the offset advances once the batch is queued on its shards."""
+        offset = None
+        async with aiohttp.ClientSession() as http:
+            while True:
+                params = {"timeout": 30, "allowed_updates": allowed_updates}
+                if offset is not None:
+                    params["offset"] = offset
+                try:
+                    async with http.post(get_updates_url, json=params, timeout=aiohttp.ClientTimeout(total=45)) as r:
+                        data = await r.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    log.warning("shards: getUpdates failed: %r", e)
+                    await asyncio.sleep(1)
+                    continue
+                if not data.get("ok"):
+                    log.warning("shards: getUpdates error: %s", data.get("description"))
+                    await asyncio.sleep((data.get("parameters") or {}).get("retry_after", 1))
+                    continue
+                updates = data["result"]
+                if updates:
+                    await self.forward_batch(updates)
+                    offset = updates[-1]["update_id"] + 1
+
+    async def close(self) -> None:
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
@@ -0,0 +1,49 @@
+"""
+Cold-start phase timings, measured from the moment `src.bot` starts importing.
+
+Imported first by `src.bot`, so it must stay free of heavy imports.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+_T0 = time.perf_counter()
+
+log = logging.getLogger(__name__)
+
+# фаза -> секунды от старта до её завершения
+phases: dict[str, float] = {}
+
+# выставляется `init_db`; в быстром старте апдейты могут прийти раньше проверки схемы
+schema_ready = asyncio.Event()
+
+
+def mark(phase: str) -> float:
+    elapsed = phases[phase] = time.perf_counter() - _T0
+    log.info("startup: %s at %.0f ms", phase, elapsed * 1000)
+    return elapsed
+
+
+async def timed(phase: str, awaitable):
+    result = await awaitable
+    mark(phase)
+    return result
+
+
+async def schema_gate_mw(handler, event, data):
+    """Hold updates until the schema check (and create_all on a fresh dev DB) has finished."""
+    if not schema_ready.is_set():
+        await schema_ready.wait()
+    return await handler(event, data)
+
+
+async def first_update_mw(handler, event, data):
+    """Records when the first update has been handled (time to first reply after a cold start)."""
+    try:
+        return await handler(event, data)
+    finally:
+        if "first_update" not in phases:
+            mark("first_update")
+            log.info("startup: %s", ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in phases.items()))
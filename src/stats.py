@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, literal, select, union_all
+
+from .db import day_number, dialect_insert
+from .i18n import t
+from .models import Checkin, CheckinRollup
+
+PERIODS = (7, 30, 90, 365)
+
+# метрика -> колонка checkins
+METRICS = {
+    "mood": Checkin.mood_score,
+    "stress": Checkin.stress_score,
+    "energy": Checkin.energy_score,
+    "sleep": Checkin.sleep_hours,
+}
+
+
+def week_start(day: datetime) -> datetime:
+    day = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day - timedelta(days=day.weekday())
+
+
+async def refresh_rollups(session, user_id: int, date: datetime) -> None:
+    """
+    Recompute the day and week rollup rows containing `date` from `checkins`
+    (one INSERT ... SELECT ... UNION ALL ... ON CONFLICT statement, in the caller's transaction).
+    """
+    day = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    ws = week_start(day)
+    cols = {"checkins": func.count()}
+    for name, col in METRICS.items():
+        cols[f"{name}_sum"] = func.sum(col)
+        cols[f"{name}_n"] = func.count(col)
+        cols[f"{name}_min"] = func.min(col)
+        cols[f"{name}_max"] = func.max(col)
+    sources = [
+        select(
+            literal(user_id).label("user_id"),
+            literal(period).label("period"),
+            literal(start).label("period_start"),
+            *(expr.label(name) for name, expr in cols.items()),
+        )
+        .where(Checkin.user_id == user_id, Checkin.date >= start, Checkin.date < end)
+        for period, start, end in (("day", day, day + timedelta(days=1)), ("week", ws, ws + timedelta(days=7)))
+    ]
+    names = ["user_id", "period", "period_start", *cols]
+    stmt = dialect_insert(CheckinRollup).from_select(names, union_all(*sources))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "period", "period_start"],
+        set_={name: stmt.excluded[name] for name in cols},
+    )
+    await session.execute(stmt)
+
+
+@dataclass
+class StatsRow:
+    period_start: datetime
+    checkins: int
+    values: dict[str, float | None]  # среднее за день/неделю
+    moving: dict[str, float | None]  # скользящее среднее
+    delta: dict[str, float | None]  # неделя к неделе
+    total_avg: dict[str, float | None]  # по всему периоду отчёта
+    total_min: dict[str, int | None]
+    total_max: dict[str, int | None]
+    total_checkins: int
+
+
+def _avg(s, n):
+    return s * 1.0 / func.nullif(n, 0)
+
+
+async def load_stats(session, user_id: int, days: int, today: datetime) -> list[StatsRow]:
+    """
+    One indexed query over `checkin_rollups`: daily rows for periods up to 30 days,
+    weekly rows otherwise; moving averages, week-over-week deltas and period totals
+    are computed by window functions. The moving average and the delta use calendar
+    frames (`RANGE` over day numbers), so days and weeks without check-ins count as gaps.
+    """
+    r = CheckinRollup
+    daily = days <= 30
+    period = "day" if daily else "week"
+    # окно скользящего среднего в днях: 7 дней или 4 недели
+    ma_days = 7 if daily else 28
+    since = today - timedelta(days=days - 1)
+    if not daily:
+        since = week_start(since)
+    lookback = timedelta(days=14) if daily else timedelta(weeks=4)
+    day_no = day_number(r.period_start)
+
+    def avg(m):
+        return _avg(getattr(r, f"{m}_sum"), getattr(r, f"{m}_n"))
+
+    # 1) средние за строку, скользящее среднее и значение неделей раньше
+    # (для дней — 7-дневное среднее прошлой недели, для недель — прошлая неделя)
+    prev_frame = (-13, -7) if daily else (-7, -7)
+    base = select(
+        r.period_start, r.checkins,
+        *(getattr(r, f"{m}_sum").label(f"{m}_sum") for m in METRICS),
+        *(getattr(r, f"{m}_n").label(f"{m}_n") for m in METRICS),
+        *(getattr(r, f"{m}_min").label(f"{m}_min") for m in METRICS),
+        *(getattr(r, f"{m}_max").label(f"{m}_max") for m in METRICS),
+        *(avg(m).label(m) for m in METRICS),
+        *(
+            func.avg(avg(m)).over(order_by=day_no, range_=(-(ma_days - 1), 0)).label(f"{m}_ma")
+            for m in METRICS
+        ),
+        *(func.avg(avg(m)).over(order_by=day_no, range_=prev_frame).label(f"{m}_prev") for m in METRICS),
+    ).where(
+        r.user_id == user_id, r.period == period, r.period_start >= since - lookback,
+    ).subquery()
+
+    # 2) неделя к неделе: для дней — разница 7-дневных средних, для недель — соседних недель
+    delta_src = "{m}_ma" if daily else "{m}"
+    with_delta = select(
+        base,
+        *((base.c[delta_src.format(m=m)] - base.c[f"{m}_prev"]).label(f"{m}_delta") for m in METRICS),
+    ).subquery()
+
+    # 3) фильтр по периоду отчёта и итоги по нему
+    c = with_delta.c
+    query = select(
+        with_delta,
+        func.sum(c.checkins).over().label("total_checkins"),
+        *(_avg(func.sum(c[f"{m}_sum"]).over(), func.sum(c[f"{m}_n"]).over()).label(f"{m}_total") for m in METRICS),
+        *(func.min(c[f"{m}_min"]).over().label(f"{m}_tmin") for m in METRICS),
+        *(func.max(c[f"{m}_max"]).over().label(f"{m}_tmax") for m in METRICS),
+    ).where(and_(c.period_start >= since, c.checkins > 0)).order_by(c.period_start)
+
+    rows = (await session.execute(query)).mappings().all()
+    return [
+        StatsRow(
+            period_start=row["period_start"],
+            checkins=row["checkins"],
+            values={m: row[m] for m in METRICS},
+            moving={m: row[f"{m}_ma"] for m in METRICS},
+            delta={m: row[f"{m}_delta"] for m in METRICS},
+            total_avg={m: row[f"{m}_total"] for m in METRICS},
+            total_min={m: row[f"{m}_tmin"] for m in METRICS},
+            total_max={m: row[f"{m}_tmax"] for m in METRICS},
+            total_checkins=row["total_checkins"],
+        )
+        for row in rows
+    ]
+
+
+def _num(v) -> str:
+    return "—" if v is None else f"{float(v):.1f}".rstrip("0").rstrip(".")
+
+
+def _signed(v) -> str:
+    return "—" if v is None else f"{float(v):+.1f}"
+
+
+def format_stats(rows: list[StatsRow], days: int, locale: str) -> str:
+    if not rows:
+        return t('stats_title', locale) + "\n" + t('stats_empty', locale)
+    last = rows[-1]
+    lines = [t('stats_header', locale, days=days, count=last.total_checkins)]
+    for m in METRICS:
+        lines.append(t(
+            'stats_metric_line', locale,
+            label=t(f'stats_label_{m}', locale),
+            avg=_num(last.total_avg[m]), min=_num(last.total_min[m]), max=_num(last.total_max[m]),
+            delta=_signed(last.delta[m]),
+        ))
+    lines.append("")
+    lines.append(t('stats_by_day' if days <= 30 else 'stats_by_week', locale))
+    for row in rows[-14:]:
+        v = row.values
+        lines.append(
+            f"{row.period_start.date()}: {_num(v['mood'])} / {_num(v['stress'])} / {_num(v['energy'])} / "
+            f"{_num(v['sleep'])} · ~{_num(row.moving['mood'])}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+
+async def _edit(msg: Message, text: str, reply_markup=None) -> None:
+    try:
+        await msg.edit_text(text, parse_mode=None, reply_markup=reply_markup)
+    except TelegramBadRequest:
+        # "message is not modified" и т.п.
+        pass
+
+
+async def send_streamed(bot: Bot, chat_id: int, chunks: AsyncIterator[str], prefix: str = "",
+                        reply_markup=None, empty_text: str = "", placeholder: bool = True) -> str:
+    """
+    Show an LLM reply progressively: one message grown with `edit_text` as deltas arrive,
+    at most once per STREAM_EDIT_INTERVAL (Telegram edit limits). Returns the full text.
+
+    With `placeholder=False` nothing is sent until the first delta, so an error raised by
+    `chunks` before any output propagates without leaving a message behind (used by
+    retried jobs). Errors after the first delta keep the partial text.
+    """
+    # без HTML: незакрытые теги в частичном ответе ломают разбор
+    started = time.monotonic()
+    msg = await bot.send_message(chat_id, prefix + "…", parse_mode=None) if placeholder else None
+    text, first_token_at, first_edit_at, last_edit = "", None, None, started
+    # промежуточная правка не задерживает чтение потока, но в полёте не больше одной:
+    # иначе более старый текст мог бы лечь поверх более нового
+    editing: asyncio.Task | None = None
+    try:
+        async for delta in chunks:
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            text += delta
+            if msg is None:
+                msg = await bot.send_message(chat_id, (prefix + text)[:4000] + " …", parse_mode=None)
+                last_edit = first_edit_at = time.monotonic()
+            elif time.monotonic() - last_edit >= settings.stream_edit_interval and (editing is None or editing.done()):
+                editing = asyncio.create_task(_edit(msg, (prefix + text)[:4000] + " …"))
+                last_edit = time.monotonic()
+                first_edit_at = first_edit_at or last_edit
+    except Exception:
+        if not text:
+            raise
+        log.exception("stream: interrupted after %d chars", len(text))
+    if editing is not None:
+        await asyncio.gather(editing, return_exceptions=True)
+    text = text or empty_text
+    final = (prefix + text)[:4096]
+    if msg is None:
+        await bot.send_message(chat_id, final, parse_mode=None, reply_markup=reply_markup)
+    else:
+        await _edit(msg, final, reply_markup=reply_markup)
+    done = time.monotonic()
+    log.info(
+        "stream: first token %.2fs, first visible %.2fs, total %.2fs",
+        (first_token_at or done) - started, (first_edit_at or done) - started, done - started,
+    )
+    return text
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+
+from .config import settings
+from .metrics import CACHE_LOOKUPS, instrument_cache
+from .models import User
+
+
+@dataclass(frozen=True, slots=True)
+class CachedUser:
+    """Immutable snapshot of a `User` row, safe to share between sessions and updates."""
+    id: int
+    tg_user_id: int
+    language_code: str | None
+    timezone: str
+    checkin_time: str
+    consent_given: bool
+
+    @classmethod
+    def from_row(cls, user: User) -> CachedUser:
+        return cls(
+            id=user.id,
+            tg_user_id=user.tg_user_id,
+            language_code=user.language_code,
+            timezone=user.timezone,
+            checkin_time=user.checkin_time,
+            consent_given=user.consent_given,
+        )
+
+
+class UserCache:
+    """LRU + TTL cache of `CachedUser` keyed by Telegram user id."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[int, tuple[float, CachedUser]] = OrderedDict()
+
+    def get(self, tg_user_id: int) -> CachedUser | None:
+        item = self._data.get(tg_user_id)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[tg_user_id]
+            CACHE_LOOKUPS.labels("user", "miss").inc()
+            return None
+        self._data.move_to_end(tg_user_id)
+        CACHE_LOOKUPS.labels("user", "hit").inc()
+        return item[1]
+
+    def put(self, user: CachedUser) -> CachedUser:
+        self._data[user.tg_user_id] = (time.monotonic() + self.ttl, user)
+        self._data.move_to_end(user.tg_user_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return user
+
+    def update(self, user: CachedUser, **changes) -> CachedUser:
+        return self.put(replace(user, **changes))
+
+    def invalidate(self, tg_user_id: int) -> None:
+        self._data.pop(tg_user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+user_cache = UserCache(settings.user_cache_size, settings.user_cache_ttl)
+instrument_cache("user", user_cache)
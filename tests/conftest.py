@@ -0,0 +1,34 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# настройки читаются при импорте src — до него;
+# TEST_DATABASE_URL=postgresql+asyncpg://... гоняет тесты на Postgres (включая миграции)
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL") or (
+    "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+)
+
+
+def _run_db(coro):
+    from src.db import Base, engine
+
+    async def main():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            return await coro
+        finally:
+            # пул привязан к циклу этого asyncio.run
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def run_db():
+    """Run a coroutine on a fresh event loop against an empty schema."""
+    return _run_db
@@ -0,0 +1,122 @@
+"""
+Migration 0007 and the archiver on a real Postgres (skipped on SQLite):
+upgrade → data intact → upsert on the partitioned table → archive → downgrade.
+
+    TEST_DATABASE_URL=postgresql+asyncpg://postgres@127.0.0.1:5432/mindcheck_test python -m pytest tests
+
+The database is wiped (schema public is recreated).
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import text
+
+from src.db import SessionLocal, engine
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "postgresql", reason="needs TEST_DATABASE_URL on Postgres")
+
+COLUMNS = "id, user_id, date, mood_score, stress_score, energy_score, emotions, sleep_hours, notes, analysis_summary, recommendations"
+
+
+def _migrate(conn, action: str, revision: str) -> None:
+    cfg = Config()
+    cfg.set_main_option("script_location", "migrations")
+    cfg.attributes["connection"] = conn
+    getattr(command, action)(cfg, revision)
+
+
+async def _run(action: str, revision: str) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(_migrate, action, revision)
+
+
+async def _fetch(sql: str) -> list:
+    async with engine.connect() as conn:
+        return (await conn.execute(text(sql))).all()
+
+
+def _month_start(months_back: int) -> datetime:
+    today = date.today()
+    months = today.year * 12 + today.month - 1 - months_back
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+async def _scenario():
+    from src.archive import CheckinArchiver, iter_archived
+    from src.repository import upsert_checkin
+
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP SCHEMA public CASCADE"))
+        await conn.execute(text("CREATE SCHEMA public"))
+    await _run("upgrade", "0006_checkin_rollups")
+
+    # чек-ины за текущий месяц и за 30 месяцев назад — последние уйдут в архив
+    old = _month_start(30)
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO users (id, tg_user_id) VALUES (1, 101), (2, 102)"))
+        await conn.execute(text(
+            f"INSERT INTO checkins ({COLUMNS}) VALUES "
+            "(1, 1, :d1, 5, 4, 6, 'calm', 7, 'n1', 'a1', 'r1'), "
+            "(2, 1, :d2, 3, 8, 2, NULL, 5, NULL, NULL, NULL), "
+            "(3, 2, :d3, 9, 1, 9, 'joy', 8, 'n3', NULL, NULL), "
+            "(4, 2, :d4, 2, 9, 3, 'sad', 4, NULL, 'a4', 'r4')"
+        ), {
+            "d1": old, "d2": old + timedelta(days=3),
+            "d3": _month_start(0), "d4": _month_start(0) + timedelta(days=1),
+        })
+        await conn.execute(text("SELECT setval('checkins_id_seq', 4)"))
+    before = await _fetch(f"SELECT {COLUMNS} FROM checkins ORDER BY id")
+
+    await _run("upgrade", "head")
+    assert await _fetch(f"SELECT {COLUMNS} FROM checkins ORDER BY id") == before
+    assert (await _fetch("SELECT relkind::text FROM pg_class WHERE relname = 'checkins'"))[0][0] == "p"
+    assert await _fetch(f"SELECT count(*) FROM checkins_p{old:%Y%m}") == [(2,)]
+    # ON CONFLICT (user_id, date) опирается на этот индекс: уникальный и с ключом секционирования
+    [(indexdef,)] = await _fetch("SELECT indexdef FROM pg_indexes WHERE indexname = 'uq_checkin_user_date'")
+    assert indexdef.startswith("CREATE UNIQUE INDEX") and "(user_id, date DESC)" in indexdef
+
+    async with SessionLocal() as session:
+        same = await upsert_checkin(session, 2, _month_start(0), {"mood_score": 7})
+        new = await upsert_checkin(session, 2, _month_start(0) + timedelta(days=2), {"mood_score": 6})
+        await session.commit()
+    # id из последовательности тратится и на конфликт — новый id просто больше прежних
+    assert same == 3 and new > 4
+    assert await _fetch("SELECT mood_score, notes FROM checkins WHERE id = 3") == [(7, "n3")]
+
+    archiver = CheckinArchiver(engine)
+    await archiver.ensure_partitions()
+    assert await archiver.archive_old() >= 1
+    assert await _fetch(f"SELECT to_regclass('checkins_p{old:%Y%m}')") == [(None,)]
+    assert await _fetch("SELECT user_id, month, checkins FROM checkins_archive") == [(1, old, 2)]
+    async with SessionLocal() as session:
+        archived = [r async for r in iter_archived(session, 1, None, None)]
+    assert [(r["mood"], r["notes"], r["recs"]) for r in archived] == [(5, "n1", "r1"), (3, None, None)]
+
+    # откат возвращает обычную таблицу; архивные месяцы в неё не разворачиваются
+    await _run("downgrade", "0006_checkin_rollups")
+    assert (await _fetch("SELECT relkind::text FROM pg_class WHERE relname = 'checkins'"))[0][0] == "r"
+    assert await _fetch(f"SELECT {COLUMNS} FROM checkins ORDER BY id") == [
+        (3, 2, _month_start(0), 7, 1, 9, "joy", 8, "n3", None, None),
+        before[3],
+        (new, 2, _month_start(0) + timedelta(days=2), 6, None, None, None, None, None, None, None),
+    ]
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO checkins (user_id, date) VALUES (1, now())"))
+    assert await _fetch("SELECT max(id) FROM checkins") == [(new + 1,)]
+
+    await _run("upgrade", "head")
+    assert await _fetch("SELECT count(*) FROM checkins") == [(4,)]
+
+
+async def _run_scenario():
+    try:
+        await _scenario()
+    finally:
+        await engine.dispose()
+
+
+def test_upgrade_archive_downgrade():
+    asyncio.run(_run_scenario())
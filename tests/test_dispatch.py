@@ -0,0 +1,47 @@
+"""UserQueues: one user's updates run one at a time in update_id order, users in parallel."""
+import asyncio
+
+from aiogram.types import Update
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.log = []
+        self.running: dict[str, int] = {}
+
+    async def feed_update(self, bot, update, **kwargs):
+        user = bot
+        self.running[user] = self.running.get(user, 0) + 1
+        self.log.append(("start", user, update.update_id, dict(self.running)))
+        # у первого пользователя обработка дольше — второй не должен его ждать
+        await asyncio.sleep(0.02 if user == "a" else 0.001)
+        self.running[user] -= 1
+        self.log.append(("end", user, update.update_id))
+
+
+def test_fifo_per_user():
+    from src.dispatch import UserQueues
+
+    async def scenario():
+        dp = FakeDispatcher()
+        queues = UserQueues()
+        queues.dp = dp
+        # бот в этом тесте — просто метка пользователя, его передают в feed_update как есть
+        for key, update_id in (("a", 3), ("b", 11), ("a", 1), ("a", 2), ("b", 10)):
+            await queues.submit(key, Update(update_id=update_id), key)
+        assert queues.pending == 5 and queues.users == 2
+        await queues.start()
+        await queues.stop()
+        return dp.log, queues
+
+    log, queues = asyncio.run(scenario())
+
+    # пришедшие не по порядку встают в очередь по update_id
+    starts = [entry for entry in log if entry[0] == "start"]
+    assert [u for _, user, u, _ in starts if user == "a"] == [1, 2, 3]
+    assert [u for _, user, u, _ in starts if user == "b"] == [10, 11]
+    assert all(running[user] == 1 for _, user, _, running in starts)
+    # "b" закончил всё раньше, чем "a" свой первый апдейт
+    ends = [(user, u) for kind, user, u, *_ in log if kind == "end"]
+    assert ends.index(("b", 11)) < ends.index(("a", 1))
+    assert queues.pending == 0 and queues.users == 0
@@ -0,0 +1,11 @@
+from datetime import datetime
+
+from src.export import parse_export_args
+
+
+def test_range_needs_at_least_one_end():
+    assert parse_export_args("..") is None
+    assert parse_export_args("csv ..") is None
+    req = parse_export_args("2024-01-01..")
+    assert req.since == datetime(2024, 1, 1) and req.until is None
+    assert parse_export_args("..2024-01-31").until == datetime(2024, 2, 1)
@@ -0,0 +1,74 @@
+"""SQLStorage: writes of one update are flushed once at its end; expired rows are invisible and evicted."""
+from datetime import datetime, timedelta
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import event, select, update
+
+KEY = StorageKey(bot_id=1, chat_id=101, user_id=101)
+
+
+def test_update_is_flushed_once(run_db):
+    from src.db import engine
+    from src.fsm_storage import SQLStorage
+    from src.models import FsmState
+
+    storage = SQLStorage(engine, ttl=3600)
+    statements = []
+
+    def count(conn, cursor, statement, *_):
+        statements.append(statement.split()[0])
+
+    async def handler(event_, data):
+        await storage.set_state(KEY, "CheckinStates:stress")
+        await storage.update_data(KEY, {"mood": "7"})
+        await storage.update_data(KEY, {"stress": "4"})
+        # чтение внутри апдейта видит ещё не записанное
+        assert await storage.get_data(KEY) == {"mood": "7", "stress": "4"}
+
+    async def scenario():
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            await storage.middleware(handler, None, {})
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+        async with engine.connect() as conn:
+            return (await conn.execute(select(FsmState.state, FsmState.data))).all()
+
+    rows = run_db(scenario())
+    # одно чтение строки и один upsert на весь апдейт
+    assert statements == ["SELECT", "INSERT"]
+    assert rows == [("CheckinStates:stress", {"mood": "7", "stress": "4"})]
+
+
+def test_expired_state_is_invisible_and_evicted(run_db):
+    from src.db import engine
+    from src.fsm_storage import SQLStorage
+    from src.models import FsmState
+
+    storage = SQLStorage(engine, ttl=3600, evict_batch=2)
+    keys = [StorageKey(bot_id=1, chat_id=100 + i, user_id=100 + i) for i in range(5)]
+
+    async def scenario():
+        for key in keys:
+            # вне middleware запись сразу уходит в БД
+            await storage.set_state(key, "ChatStates:active")
+        async with engine.begin() as conn:
+            await conn.execute(
+                update(FsmState).where(FsmState.key != storage.key_builder.build(keys[0]))
+                .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+            )
+        states = [await storage.get_state(key) for key in keys]
+        # просроченная строка перезаписывается целиком: старое состояние не воскресает
+        await storage.update_data(keys[1], {"a": 1})
+        revived = await storage.get_state(keys[1]), await storage.get_data(keys[1])
+        removed = await storage.evict_expired()
+        async with engine.connect() as conn:
+            left = (await conn.execute(select(FsmState.key).order_by(FsmState.key))).scalars().all()
+        return states, revived, removed, left
+
+    states, revived, removed, left = run_db(scenario())
+    assert states == ["ChatStates:active", None, None, None, None]
+    assert revived == (None, {"a": 1})
+    # партиями по evict_batch, пока не кончатся
+    assert removed == 3
+    assert left == sorted(storage.key_builder.build(key) for key in keys[:2])
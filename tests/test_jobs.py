@@ -0,0 +1,83 @@
+"""A result of a job that was re-queued meanwhile is neither stored nor shown."""
+from datetime import datetime
+
+from sqlalchemy import select
+
+DAY = datetime(2024, 3, 1)
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = []
+
+    async def send_message(self, *args, **kwargs):
+        self.calls.append(("send_message", args))
+
+    async def edit_message_text(self, *args, **kwargs):
+        self.calls.append(("edit_message_text", args))
+
+
+async def _claimed_then_requeued(message_id):
+    from src.db import SessionLocal
+    from src.jobs import AnalysisWorker, enqueue_analysis
+    from src.models import Checkin, User
+
+    async with SessionLocal() as session:
+        session.add(User(id=1, tg_user_id=101))
+        session.add(Checkin(user_id=1, date=DAY, mood_score=5, analysis_summary="new quick"))
+        await session.flush()
+        await enqueue_analysis(session, 1, DAY, 101, "ru", "old prompt", message_id=message_id)
+        await session.commit()
+    worker = AnalysisWorker(FakeBot())
+    job = await worker._claim()
+    assert job is not None
+    # чек-ин перепройден, пока первый воркер ждал LLM
+    async with SessionLocal() as session:
+        await enqueue_analysis(session, 1, DAY, 101, "ru", "new prompt", message_id=message_id)
+        await session.commit()
+    return worker, job
+
+
+async def _summary():
+    from src.db import SessionLocal
+    from src.models import Checkin
+
+    async with SessionLocal() as session:
+        return (await session.execute(select(Checkin.analysis_summary))).scalar_one()
+
+
+def test_stale_result_is_not_saved(run_db):
+    async def scenario():
+        from src.db import SessionLocal
+        from src.models import AnalysisJob
+        from src.repository import save_analysis
+
+        _, job = await _claimed_then_requeued(None)
+        async with SessionLocal() as session:
+            assert await save_analysis(session, job, "old analysis") is False
+            await session.commit()
+        assert await _summary() == "new quick"
+        async with SessionLocal() as session:
+            assert (await session.execute(select(AnalysisJob.prompt))).scalar_one() == "new prompt"
+
+    run_db(scenario())
+
+
+def test_stale_result_is_not_shown(run_db, monkeypatch):
+    async def old_stream(prompt, locale, strict):
+        yield "old analysis"
+
+    monkeypatch.setattr("src.llm.analyze_checkin_stream", old_stream)
+
+    async def scenario():
+        for message_id in (None, 55):
+            worker, job = await _claimed_then_requeued(message_id)
+            await worker._process(job)
+            assert worker.bot.calls == []
+            assert await _summary() == "new quick"
+            from src.db import Base, engine
+            async with engine.begin() as conn:
+                for table in reversed(Base.metadata.sorted_tables):
+                    await conn.execute(table.delete())
+
+    run_db(scenario())
@@ -0,0 +1,97 @@
+"""LLMClient._race over fake attempts: failover, hedging, deadline, circuit breaker."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from src.config import settings
+from src.llm import LLMClient, LLMDeadlineError, LLMUnavailableError
+from src.llm_endpoints import Endpoint, route
+
+
+@pytest.fixture(autouse=True)
+def fast_settings(monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge_initial_delay", 0.05)
+    monkeypatch.setattr(settings, "llm_breaker_failures", 2)
+    monkeypatch.setattr(settings, "llm_breaker_cooldown", 0.1)
+
+
+def _attempts(behaviour: dict, calls: list):
+    """Fake attempt: endpoint model → (seconds, result or exception)."""
+    async def attempt(ep: Endpoint, payload: dict):
+        calls.append(ep.model)
+        delay, outcome = behaviour[ep.model]
+        await asyncio.sleep(delay)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+    return attempt
+
+
+def _race(behaviour: dict, deadline: float | None = None, concurrency: int = 4, hold_slots: bool = False):
+    async def scenario():
+        client = LLMClient(concurrency, max_queue=10)
+        client.endpoints = [Endpoint("a"), Endpoint("b")]
+        calls = []
+        if hold_slots:
+            for _ in range(concurrency):
+                await client._sem.acquire()
+        try:
+            result = await client._race("post", _attempts(behaviour, calls), {}, deadline)
+        except Exception as e:
+            result = e
+        finally:
+            await client.aclose()
+        return result, calls, client.endpoints
+
+    return asyncio.run(scenario())
+
+
+def test_error_fails_over_to_next_endpoint():
+    (result, ep), calls, (a, b) = _race({"a": (0, httpx.ConnectError("down")), "b": (0, "from b")})
+    assert (result, ep.model, calls) == ("from b", "b", ["a", "b"])
+    assert a.failures == 1 and b.failures == 0
+
+
+def test_slow_endpoint_is_hedged():
+    (result, ep), calls, (a, b) = _race({"a": (5, "from a"), "b": (0.01, "from b")}, deadline=2)
+    assert (result, ep.model, calls) == ("from b", "b", ["a", "b"])
+    # проигравшая попытка отменена, но её время — нижняя граница задержки "a"
+    assert a.failures == 0 and len(a.latencies["post"]) == 1 and a.latencies["post"][0] >= 0.05
+
+
+def test_no_hedge_without_a_free_slot():
+    result, calls, _ = _race({"a": (5, "from a"), "b": (0, "from b")}, deadline=0.2, concurrency=1, hold_slots=True)
+    assert isinstance(result, LLMDeadlineError)
+    assert calls == ["a"]
+
+
+def test_breaker_opens_and_lets_one_probe_through():
+    a = Endpoint("a")
+    for _ in range(settings.llm_breaker_failures):
+        a.failed(httpx.ConnectError("down"))
+    assert a.state == "open" and route([a]) == []
+
+    time.sleep(settings.llm_breaker_cooldown)
+    assert a.state == "half_open" and route([a]) == [a]
+    a.started()
+    # пока проба в полёте, других запросов на эндпоинт нет
+    assert route([a]) == []
+    a.succeeded("post", 0.1)
+    assert a.state == "closed"
+
+
+def test_all_breakers_open():
+    async def scenario():
+        client = LLMClient(4, max_queue=10)
+        client.endpoints = [Endpoint("a")]
+        for _ in range(settings.llm_breaker_failures):
+            client.endpoints[0].failed(httpx.ConnectError("down"))
+        try:
+            with pytest.raises(LLMUnavailableError):
+                await client._race("post", _attempts({}, []), {}, None)
+        finally:
+            await client.aclose()
+
+    asyncio.run(scenario())
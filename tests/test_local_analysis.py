@@ -0,0 +1,11 @@
+from src.local_analysis import emotion_categories
+
+
+def test_emotions_match_whole_words():
+    assert emotion_categories("made a download, fearless") == set()
+    assert emotion_categories("I feel down. Mad!") == {"sadness", "anger"}
+
+
+def test_emotion_stems_match_inflections():
+    assert emotion_categories("Тревожно, устала") == {"anxiety", "fatigue"}
+    assert emotion_categories("радостно и спокойно") == {"joy"}
@@ -0,0 +1,28 @@
+"""next_fire_utc around DST changes (Europe/Berlin: 2024-03-31 02:00 → 03:00, 2024-10-27 03:00 → 02:00)."""
+from datetime import datetime
+
+from src.reminders import next_fire_utc
+
+
+def test_fixed_local_time_moves_in_utc():
+    # 09:00 по Берлину: 08:00 UTC зимой, 07:00 UTC летом
+    assert next_fire_utc("09:00", "Europe/Berlin", datetime(2024, 3, 30, 8, 0)) == datetime(2024, 3, 31, 7, 0)
+    assert next_fire_utc("09:00", "Europe/Berlin", datetime(2024, 10, 26, 7, 0)) == datetime(2024, 10, 27, 8, 0)
+
+
+def test_nonexistent_time_fires_an_hour_later():
+    # 02:30 31 марта нет — напоминание приходит в 03:30 летнего времени
+    assert next_fire_utc("02:30", "Europe/Berlin", datetime(2024, 3, 30, 12, 0)) == datetime(2024, 3, 31, 1, 30)
+    assert next_fire_utc("02:30", "Europe/Berlin", datetime(2024, 3, 31, 1, 30)) == datetime(2024, 4, 1, 0, 30)
+
+
+def test_ambiguous_time_fires_once():
+    # 02:30 27 октября бывает дважды — берём первое, второе не повторяет напоминание
+    first = next_fire_utc("02:30", "Europe/Berlin", datetime(2024, 10, 26, 12, 0))
+    assert first == datetime(2024, 10, 27, 0, 30)
+    assert next_fire_utc("02:30", "Europe/Berlin", first) == datetime(2024, 10, 28, 1, 30)
+
+
+def test_earliest_of_several_times():
+    assert next_fire_utc("18:00, 09:00", "Europe/Berlin", datetime(2024, 3, 31, 8, 0)) == datetime(2024, 3, 31, 16, 0)
+    assert next_fire_utc("25:00,x", "Europe/Berlin", datetime(2024, 3, 31, 8, 0)) is None
@@ -0,0 +1,116 @@
+"""
+Every handler in `ROUND_TRIP_BUDGETS`, fed through the production dispatcher, stays within
+its budget of SQL statements (counted like `bench/dispatcher_bench.py` does).
+"""
+import itertools
+from collections import defaultdict
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import CallbackQuery, Chat, Message, Update, User as TgUser
+from sqlalchemy import event
+
+ids = itertools.count(1)
+
+
+class FakeSession(BaseSession):
+    async def close(self) -> None:
+        pass
+
+    async def make_request(self, bot, method, timeout=None):
+        if type(method).__name__ in ("SendMessage", "EditMessageText", "SendDocument", "SendPhoto"):
+            return Message(
+                message_id=next(ids), date=datetime.now(),
+                chat=Chat(id=getattr(method, "chat_id", None) or 1, type="private"), text=getattr(method, "text", None),
+            ).as_(bot)
+        return True
+
+    async def stream_content(self, *a, **k):
+        yield b""
+
+
+def message(uid: int, text: str) -> Update:
+    return Update(update_id=next(ids), message=Message(
+        message_id=next(ids), date=datetime.now(), chat=Chat(id=uid, type="private"),
+        from_user=TgUser(id=uid, is_bot=False, first_name="test", language_code="ru"), text=text,
+    ))
+
+
+def callback(uid: int, data: str) -> Update:
+    origin = Message(
+        message_id=next(ids), date=datetime.now(), chat=Chat(id=uid, type="private"),
+        from_user=TgUser(id=1, is_bot=True, first_name="bot"), text="…",
+    )
+    return Update(update_id=next(ids), callback_query=CallbackQuery(
+        id=str(next(ids)), chat_instance="test", from_user=TgUser(id=uid, is_bot=False, first_name="test"),
+        message=origin, data=data,
+    ))
+
+
+SCENARIO = [
+    (1, "/start"), (1, "да"), (1, "/help"), (1, "/lang"), (1, "/lang"), (1, "/settings"),
+    (1, "/reminders"), (1, "09:00,21:00 Europe/Berlin"),
+    # чек-ин текстом
+    (1, "/checkin"), (1, "7"), (1, "4"), (1, "6"), (1, "радость"), (1, "7"), (1, "прогулка"),
+    # чек-ин кнопками, конец — пропуском
+    (1, "/checkin"), (1, "@scale:mood:6"), (1, "@scale:stress:5"), (1, "@skip:energy"),
+    (1, "@skip:emotions"), (1, "@skip:sleep"), (1, "@skip:notes"),
+    (1, "/stats"), (1, "/stats 30"), (1, "/chart"), (1, "/export"), (1, "/export json gz"),
+    (1, "/coach"), (1, "@coach:prompt:plan"), (1, "Как мне лучше спать?"), (1, "@coach:end"),
+    (1, "/delete_me"),
+    (2, "/start"), (2, "@consent:yes"),
+]
+
+
+def test_handlers_within_budget(run_db, monkeypatch):
+    from src import llm
+    from src import bot as app
+    from src.charts import stop_chart_pool
+    from src.config import settings
+    from src.db import engine
+    from src.fsm_storage import SQLStorage
+    from src.repository import ROUND_TRIP_BUDGETS
+
+    async def reply(messages, locale="ru", use_cache=True):
+        yield "Попробуйте лечь на полчаса раньше."
+
+    # с ключом OpenRouter notes_handler ставит задачу анализа — бюджет считает и её
+    monkeypatch.setattr(settings, "openrouter_api_key", "test")
+    monkeypatch.setattr(settings, "chart_pool", "thread")
+    monkeypatch.setattr(llm, "chat_stream", reply)
+
+    queries: dict[str, list[int]] = defaultdict(list)
+    probe = {"handler": None, "queries": 0}
+
+    async def probe_handler(handler, event, data):
+        probe["handler"] = data["handler"].callback.__name__
+        return await handler(event, data)
+
+    def count_query(*_):
+        probe["queries"] += 1
+
+    async def scenario():
+        await app.init_db()
+        storage = SQLStorage(engine, settings.fsm_ttl)
+        dp = app.build_dispatcher(storage)
+        dp.message.middleware(probe_handler)
+        dp.callback_query.middleware(probe_handler)
+        bot = Bot(token=settings.bot_token, session=FakeSession())
+        event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+        try:
+            for uid, text in SCENARIO:
+                probe.update(handler=None, queries=0)
+                await dp.feed_update(bot, callback(uid, text[1:]) if text.startswith("@") else message(uid, text))
+                queries[probe["handler"]].append(probe["queries"])
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count_query)
+            stop_chart_pool()
+
+    run_db(scenario())
+
+    assert set(queries) == set(ROUND_TRIP_BUDGETS)
+    # cmd_start нового пользователя ищет его в БД — это промах user_cache, бюджет его не включает
+    queries["cmd_start"] = [q - 1 for q in queries["cmd_start"]]
+    over = {name: max(q) for name, q in queries.items() if max(q) > ROUND_TRIP_BUDGETS[name]}
+    assert over == {}
@@ -0,0 +1,78 @@
+"""SendQueue: per-chat pacing, merged edits of one message, interactive before BULK."""
+import asyncio
+import time
+
+from aiogram.methods import EditMessageText, SendMessage
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    async def __call__(self, bot, method):
+        self.sent.append((time.monotonic(), method))
+        return len(self.sent)
+
+
+def _queue(chat_rate: float, chat_burst: float, global_rate: float = 1000):
+    from src.send_queue import SendQueue, _Bucket
+
+    queue = SendQueue()
+    queue.chat_rate, queue.chat_burst = chat_rate, chat_burst
+    queue._global = _Bucket(global_rate, global_rate)
+    return queue
+
+
+def test_chat_is_paced_after_burst():
+    async def scenario():
+        queue, make_request = _queue(chat_rate=20, chat_burst=2), Recorder()
+        started = time.monotonic()
+        await asyncio.gather(*(
+            queue(make_request, None, SendMessage(chat_id=1, text=str(i))) for i in range(5)
+        ))
+        # другой чат не ждёт первого
+        await queue(make_request, None, SendMessage(chat_id=2, text="other"))
+        return started, make_request.sent
+
+    started, sent = asyncio.run(scenario())
+    assert [m.text for _, m in sent] == ["0", "1", "2", "3", "4", "other"]
+    # два сразу, дальше по 1/20 с
+    assert sent[1][0] - started < 0.03
+    assert sent[4][0] - started >= 3 / 20 - 0.01
+    assert sent[5][0] - sent[4][0] < 0.03
+
+
+def test_pending_edits_are_merged():
+    async def scenario():
+        queue, make_request = _queue(chat_rate=10, chat_burst=1), Recorder()
+        await queue(make_request, None, SendMessage(chat_id=1, text="…"))
+        results = await asyncio.gather(*(
+            queue(make_request, None, EditMessageText(chat_id=1, message_id=7, text=text))
+            for text in ("a", "ab", "abc")
+        ))
+        return results, make_request.sent
+
+    results, sent = asyncio.run(scenario())
+    # одна правка с последним текстом, её результат у всех трёх
+    assert [m.text for _, m in sent] == ["…", "abc"]
+    assert results == [2, 2, 2]
+
+
+def test_interactive_goes_before_bulk():
+    from src.send_queue import BULK, INTERACTIVE, send_priority
+
+    async def send(queue, make_request, chat_id, priority):
+        send_priority.set(priority)
+        await queue(make_request, None, SendMessage(chat_id=chat_id, text=str(priority)))
+
+    async def scenario():
+        queue, make_request = _queue(chat_rate=100, chat_burst=100, global_rate=20), Recorder()
+        queue._global.tokens = 0
+        bulk = [asyncio.create_task(send(queue, make_request, 100 + i, BULK)) for i in range(3)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(send(queue, make_request, 200, INTERACTIVE))
+        await asyncio.gather(*bulk, interactive)
+        return make_request.sent
+
+    sent = asyncio.run(scenario())
+    assert [m.chat_id for _, m in sent] == [200, 100, 101, 102]
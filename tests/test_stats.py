@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from src.db import Base, SessionLocal, engine
+from src.models import Checkin, User
+from src.stats import load_stats, refresh_rollups
+
+TODAY = datetime(2026, 10, 16)  # пятница
+
+
+async def _stats(moods: dict[int, int], days: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        user = User(tg_user_id=1)
+        session.add(user)
+        await session.flush()
+        for offset, mood in moods.items():
+            date = TODAY + timedelta(days=offset)
+            session.add(Checkin(user_id=user.id, date=date, mood_score=mood))
+            await session.flush()
+            await refresh_rollups(session, user.id, date)
+        await session.commit()
+        rows = await load_stats(session, user.id, days, TODAY)
+    # пул привязан к циклу asyncio.run этого теста
+    await engine.dispose()
+    return rows
+
+
+def test_daily_frames_skip_gaps():
+    # реже, чем раз в день: окна считают календарные дни, а не строки
+    rows = asyncio.run(_stats({-28: 2, -21: 2, -14: 5, -9: 4, -2: 9, -1: 9, 0: 9}, 7))
+    assert [r.period_start for r in rows] == [TODAY - timedelta(days=d) for d in (2, 1, 0)]
+    last = rows[-1]
+    assert last.moving["mood"] == 9
+    # прошлая неделя (дни -13..-7) — только день -9
+    assert last.delta["mood"] == 5
+    assert last.total_avg["mood"] == 9
+
+
+def test_daily_delta_without_previous_week():
+    rows = asyncio.run(_stats({-28: 2, -21: 2, -14: 5, -2: 9, 0: 9}, 7))
+    assert rows[-1].moving["mood"] == 9
+    assert rows[-1].delta["mood"] is None
+
+
+def test_weekly_frames_skip_gaps():
+    # недели с чек-инами: -5, -3 и текущая; соседней с текущей нет
+    rows = asyncio.run(_stats({-35: 2, -21: 4, 0: 8}, 90))
+    last = rows[-1]
+    assert last.values["mood"] == 8
+    # 4 недели назад (-28..0) попадают только -21 и текущая
+    assert last.moving["mood"] == 6
+    assert last.delta["mood"] is None
+    assert rows[-2].delta["mood"] is None